@@ -0,0 +1,232 @@
+"""
+Audio helpers for the audio server: text segmentation and in-memory / streaming encoders.
+
+Synthesized audio never touches the disk: encode_audio() turns a waveform into response bytes,
+piping through ffmpeg's stdin/stdout for compressed formats.
+
+Formats (same names as the OpenAI speech API):
+- pcm: raw 16-bit little-endian mono samples at the model's sample rate, no encoding cost
+- wav: PCM with a RIFF header; streams use unknown (0xFFFFFFFF) sizes
+- mp3 / aac (ADTS) / flac: ffmpeg
+- opus: Ogg Opus via ffmpeg, resampled to 24 kHz since Opus does not support 22.05 kHz
+
+Every format can be streamed: streaming synthesis pushes each segment's PCM through one
+long-running encoder, so the output is a single continuous stream.
+"""
+
+import math
+import queue
+import re
+import struct
+import subprocess
+import threading
+
+import numpy as np
+
+# Pause inserted between streamed segments, same as IndexTTS2's default interval_silence
+SEGMENT_SILENCE_MS = 200
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg; codecs=opus",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "pcm": "audio/pcm",
+}
+
+DEFAULT_BITRATES = {
+    "mp3": "128k",
+    "opus": "32k",
+    "aac": "64k",
+}
+
+# ffmpeg output arguments per compressed format; lossy formats take a bitrate
+FFMPEG_OUTPUT_ARGS = {
+    "mp3": ["-f", "mp3", "-c:a", "libmp3lame"],
+    "opus": ["-f", "ogg", "-c:a", "libopus", "-ar", "24000", "-application", "voip", "-page_duration", "200000"],
+    "aac": ["-f", "adts", "-c:a", "aac"],
+    "flac": ["-f", "flac", "-c:a", "flac"],
+}
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+_SENTENCE_RE = re.compile(r"(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)")
+_CLAUSE_RE = re.compile(r"(?<=[，,、：:])")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough text token count: one per CJK character, one per four other word characters"""
+    cjk = len(_CJK_RE.findall(text))
+    other = sum(len(word) for word in re.findall(r"\w+", _CJK_RE.sub(" ", text)))
+    return cjk + math.ceil(other / 4)
+
+
+def _pack(pieces: list[str], max_tokens: int) -> list[str]:
+    segments, current = [], ""
+    for piece in pieces:
+        if current and estimate_tokens(current + piece) > max_tokens:
+            segments.append(current)
+            current = ""
+        current += piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+def split_segments(text: str, max_tokens: int) -> list[str]:
+    """Split text into segments of at most about max_tokens, preferring sentence and clause boundaries"""
+    pieces = []
+    for sentence in (s for s in _SENTENCE_RE.split(text) if s.strip()):
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        for clause in (c for c in _CLAUSE_RE.split(sentence) if c):
+            rest = clause
+            while estimate_tokens(rest) > max_tokens:
+                # No punctuation to split on: cut by characters
+                cut = max(1, len(rest) * max_tokens // estimate_tokens(rest))
+                pieces.append(rest[:cut])
+                rest = rest[cut:]
+            pieces.append(rest)
+    return [segment.strip() for segment in _pack(pieces, max_tokens) if segment.strip()]
+
+
+def pcm16_bytes(wav) -> bytes:
+    """Convert an IndexTTS2 waveform (int16 array, any shape, mono) to little-endian PCM bytes"""
+    samples = np.asarray(wav)
+    if samples.dtype != np.int16:
+        samples = np.clip(samples, -32768, 32767).astype(np.int16)
+    return samples.reshape(-1).astype("<i2", copy=False).tobytes()
+
+
+def silence_bytes(sample_rate: int, milliseconds: int = SEGMENT_SILENCE_MS) -> bytes:
+    return bytes(2 * (sample_rate * milliseconds // 1000))
+
+
+def wav_header(sample_rate: int, data_size: int | None = None, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """PCM WAV header; data_size=None writes 0xFFFFFFFF sizes for a stream of unknown length"""
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    riff_size = 0xFFFFFFFF if data_size is None else 36 + data_size
+    data_size = 0xFFFFFFFF if data_size is None else data_size
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", riff_size, b"WAVE", b"fmt ", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample, b"data", data_size)
+
+
+def parse_bitrates(value: str) -> dict[str, str]:
+    """Parse "mp3=128k,opus=24k" into a bitrate table on top of the defaults"""
+    bitrates = dict(DEFAULT_BITRATES)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, bitrate = item.partition("=")
+        if name not in DEFAULT_BITRATES or not bitrate:
+            raise ValueError(f"Invalid bitrate setting: {item}")
+        bitrates[name] = bitrate
+    return bitrates
+
+
+def ffmpeg_output_args(output_format: str, bitrate: str | None = None) -> list[str]:
+    args = list(FFMPEG_OUTPUT_ARGS[output_format])
+    if output_format in DEFAULT_BITRATES:
+        args += ["-b:a", bitrate or DEFAULT_BITRATES[output_format]]
+    return args
+
+
+def ffmpeg_encode(pcm: bytes, sample_rate: int, output_args: list[str]) -> bytes:
+    """Encode 16-bit mono PCM through ffmpeg pipes"""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0", *output_args, "pipe:1"],
+        input=pcm,
+        capture_output=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg encoding failed: {result.stderr.decode(errors='replace')[:200]}")
+    return result.stdout
+
+
+def encode_audio(wav, sample_rate: int, output_format: str, bitrate: str | None = None) -> bytes:
+    """Encode a whole waveform in memory"""
+    pcm = pcm16_bytes(wav)
+    if output_format == "pcm":
+        return pcm
+    if output_format == "wav":
+        return wav_header(sample_rate, len(pcm)) + pcm
+    if output_format in FFMPEG_OUTPUT_ARGS:
+        return ffmpeg_encode(pcm, sample_rate, ffmpeg_output_args(output_format, bitrate))
+    raise ValueError(f"Unsupported audio format: {output_format}")
+
+
+class PcmStreamEncoder:
+    """Raw PCM, optionally preceded by a streaming WAV header"""
+
+    def __init__(self, sample_rate: int, with_header: bool):
+        self.sample_rate = sample_rate
+        self.with_header = with_header
+
+    def start(self) -> bytes:
+        return wav_header(self.sample_rate) if self.with_header else b""
+
+    def encode(self, pcm: bytes) -> bytes:
+        return pcm
+
+    def finish(self) -> bytes:
+        return b""
+
+    def close(self):
+        pass
+
+
+class FFmpegStreamEncoder:
+    """Feeds PCM into one ffmpeg process and returns whatever encoded output is available"""
+
+    def __init__(self, sample_rate: int, output_args: list[str]):
+        self.sample_rate = sample_rate
+        self._process = subprocess.Popen(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0", *output_args, "pipe:1"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self._chunks: queue.Queue[bytes] = queue.Queue()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        for chunk in iter(lambda: self._process.stdout.read1(65536), b""):
+            self._chunks.put(chunk)
+
+    def _drain(self) -> bytes:
+        parts = []
+        while True:
+            try:
+                parts.append(self._chunks.get_nowait())
+            except queue.Empty:
+                return b"".join(parts)
+
+    def start(self) -> bytes:
+        return b""
+
+    def encode(self, pcm: bytes) -> bytes:
+        self._process.stdin.write(pcm)
+        self._process.stdin.flush()
+        return self._drain()
+
+    def finish(self) -> bytes:
+        """Flush the encoder; blocks until ffmpeg exits"""
+        self._process.stdin.close()
+        self._reader.join()
+        self._process.wait()
+        return self._drain()
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+
+def create_stream_encoder(output_format: str, sample_rate: int, bitrate: str | None = None):
+    if output_format == "pcm":
+        return PcmStreamEncoder(sample_rate, with_header=False)
+    if output_format == "wav":
+        return PcmStreamEncoder(sample_rate, with_header=True)
+    if output_format in FFMPEG_OUTPUT_ARGS:
+        return FFmpegStreamEncoder(sample_rate, ffmpeg_output_args(output_format, bitrate))
+    raise ValueError(f"Unsupported streaming format: {output_format}")
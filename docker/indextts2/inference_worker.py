@@ -0,0 +1,122 @@
+"""
+Inference worker pool for the audio server.
+
+Each IndexTTS2 replica is owned by exactly one worker thread, so a replica never runs two
+syntheses at once. Requests are queued on an asyncio queue and the endpoints await a future,
+which keeps the uvicorn event loop free for health checks and voice listings while the GPU
+is busy. The queue depth is bounded; when it is full, callers get QueueFullError with a
+Retry-After estimate derived from the recent average job time.
+"""
+
+import asyncio
+import functools
+import math
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from loguru import logger
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue has reached its maximum depth"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """Runs blocking inference calls on dedicated per-replica threads"""
+
+    def __init__(self, replicas: list[Any], max_queue_depth: int = 8, initial_job_seconds: float = 10.0):
+        if not replicas:
+            raise ValueError("At least one model replica is required")
+        self.replicas = replicas
+        self.max_queue_depth = max_queue_depth
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self._avg_job_seconds = initial_job_seconds
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"tts-replica-{index}") for index in range(len(replicas))]
+
+    async def start(self):
+        """Start one worker task per replica; must be called from the running event loop"""
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(index, replica)) for index, replica in enumerate(self.replicas)]
+        logger.info(f"Inference pool started with {len(self.replicas)} replica(s), max queue depth {self.max_queue_depth}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def avg_job_seconds(self) -> float:
+        return self._avg_job_seconds
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog is expected to drain"""
+        backlog = self.queued + self.active
+        return max(1, math.ceil(backlog * self._avg_job_seconds / len(self.replicas)))
+
+    async def run(self, fn: Callable[..., Any], *args, admitted: bool = False, **kwargs) -> Any:
+        """Queue fn(replica, *args, **kwargs) and wait for its result
+
+        admitted=True skips the depth check, for follow-up work of a request that was already
+        admitted (e.g. the later segments of a stream that has started sending audio).
+        """
+        if self._queue is None:
+            raise RuntimeError("Inference pool is not started")
+        if not admitted and self.queued >= self.max_queue_depth:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((fn, args, kwargs, future))
+        return await future
+
+    async def _worker(self, index: int, replica: Any):
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, args, kwargs, future = await self._queue.get()
+            # The client went away while the job was still queued
+            if future.done():
+                self._queue.task_done()
+                continue
+            self.active += 1
+            start = time.monotonic()
+            try:
+                result = await loop.run_in_executor(self._executors[index], functools.partial(fn, replica, *args, **kwargs))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                elapsed = time.monotonic() - start
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+                self.active -= 1
+                self.completed += 1
+                self._queue.task_done()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "replicas": len(self.replicas),
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_job_seconds": round(self._avg_job_seconds, 3),
+        }
@@ -1,24 +1,34 @@
 #!/usr/bin/env python3
 
 import argparse
-import base64
+import asyncio
 import os
 import sys
-import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import uvicorn
+from audio_encoding import CONTENT_TYPES, parse_bitrates, split_segments, wav_header
 
 # Import book speech functions
 from book_speech import (
     create_tts_request,
     parse_ssml,
 )
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from loguru import logger
 from pydantic import BaseModel, Field
+from response_cache import ResponseCache, byte_range_response
+from scratch_dir import ScratchDir
+from segment_cache import SegmentCache
+from segment_scheduler import SegmentScheduler
+from synthesis_pipeline import SegmentPipeline, StageTimings
+from voice_catalog import VoiceCatalog
+from voice_registry import VoiceRegistry, file_version
+
+from inference_worker import InferencePool, QueueFullError
 
 # Configure logger
 logger.remove()
@@ -41,6 +51,17 @@ parser.add_argument("--deepspeed", action="store_true", default=False, help="Use
 parser.add_argument("--audio_prompt_dir", type=str, default="/app/audio_prompts", help="Audio prompt base directory")
 parser.add_argument("--default_audio_prompt", type=str, default="jiang-style1.mp3", help="Default audio prompt filename")
 parser.add_argument("--offline", action="store_true", default=False, help="Run in offline mode (disable HuggingFace downloads)")
+parser.add_argument("--replicas", type=int, default=1, help="Number of IndexTTS2 model replicas, each served by its own worker thread")
+parser.add_argument("--max_queue_depth", type=int, default=8, help="Maximum queued synthesis requests before returning 429")
+parser.add_argument("--pipeline_depth", type=int, default=4, help="Segments of one request synthesized ahead of the encoder")
+parser.add_argument("--voice_cache_size", type=int, default=32, help="Number of voice conditionings kept in memory")
+parser.add_argument("--voice_cache_dir", type=str, default="", help="Directory to persist voice conditionings and uploaded prompts (empty: memory only)")
+parser.add_argument("--segment_cache_size", type=int, default=512, help="Size of the synthesized segment cache in MB (0 disables it)")
+parser.add_argument("--segment_cache_dir", type=str, default="", help="Segment cache directory (default: <voice_cache_dir>/segments, or a scratch directory)")
+parser.add_argument("--book_cache_size", type=int, default=256, help="Size of the in-memory /v1/book/speech response cache in MB (0 keeps only request coalescing)")
+parser.add_argument("--voice_manifest", type=str, default="", help="Voice ID manifest file (default: <audio_prompt_dir>/.voice_manifest.json)")
+parser.add_argument("--audio_bitrate", type=str, default="", help="Bitrates of lossy formats, e.g. mp3=128k,opus=32k,aac=64k (unset formats use these defaults)")
+parser.add_argument("--voice_refresh_interval", type=float, default=10.0, help="Seconds between voice directory change checks")
 cmd_args = parser.parse_args()
 
 # Set offline mode BEFORE importing any HuggingFace libraries
@@ -85,12 +106,28 @@ logger.add("index-tts-server.log", rotation="10 MB", level="TRACE")
 
 
 default_audio_prompt_path = os.path.join(audio_prompt_base_dir, cmd_args.default_audio_prompt)
+audio_bitrates = parse_bitrates(cmd_args.audio_bitrate)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(voice_catalog.refresh)
+    watcher = asyncio.create_task(voice_catalog.watch(cmd_args.voice_refresh_interval))
+    await inference_pool.start()
+    await segment_scheduler.start()
+    yield
+    watcher.cancel()
+    await segment_scheduler.stop()
+    await inference_pool.stop()
+    scratch_dir.cleanup()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="OpenAI-compatible Audio API",
     description="API for text-to-speech synthesis using OpenAI-compatible API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -102,23 +139,71 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize IndexTTS2 model immediately (same as webui.py)
-logger.info(f"Initializing IndexTTS2 model from {cmd_args.model_dir}...")
-tts_instance = IndexTTS2(
-    model_dir=cmd_args.model_dir,
-    cfg_path=os.path.join(cmd_args.model_dir, "config.yaml"),
-    use_fp16=cmd_args.fp16,
-    use_deepspeed=cmd_args.deepspeed,
-    use_cuda_kernel=cmd_args.cuda_kernel,
-)
+# Initialize IndexTTS2 model replicas immediately (same as webui.py)
+logger.info(f"Initializing {cmd_args.replicas} IndexTTS2 replica(s) from {cmd_args.model_dir}...")
+tts_replicas = [
+    IndexTTS2(
+        model_dir=cmd_args.model_dir,
+        cfg_path=os.path.join(cmd_args.model_dir, "config.yaml"),
+        use_fp16=cmd_args.fp16,
+        use_deepspeed=cmd_args.deepspeed,
+        use_cuda_kernel=cmd_args.cuda_kernel,
+    )
+    for _ in range(max(1, cmd_args.replicas))
+]
+tts_instance = tts_replicas[0]
 logger.info("IndexTTS2 model initialized successfully")
 
+# Synthesis runs on per-replica worker threads so the event loop is never blocked
+inference_pool = InferencePool(tts_replicas, max_queue_depth=cmd_args.max_queue_depth)
+
+# Per-stage durations (queue wait, synthesis, encoding, first audio) reported by /health
+stage_timings = StageTimings()
+
+
+def run_segment(tts, text: str, infer_kwargs: dict):
+    """Synthesize one segment on a replica, reusing the voice's cached conditioning"""
+    return voice_registry.infer(tts, text=text, output_path=None, **infer_kwargs)
+
+
+# Segments of all requests share one queue and run on the first free replica, oldest first
+segment_scheduler = SegmentScheduler(
+    inference_pool,
+    run_segment,
+    max_pending_requests=cmd_args.max_queue_depth,
+    timings=stage_timings,
+)
+
+# Files that must exist on disk (uploaded prompts) live here and are removed at shutdown
+scratch_dir = ScratchDir()
+
+# Speaker / emotion conditioning, prompt durations and uploaded prompts, shared by all replicas
+voice_registry = VoiceRegistry(
+    prompt_dir=os.path.join(cmd_args.voice_cache_dir, "indextts-prompts") if cmd_args.voice_cache_dir else str(scratch_dir.subdir("prompts")),
+    max_entries=cmd_args.voice_cache_size,
+    persist_dir=os.path.join(cmd_args.voice_cache_dir, "conditioning") if cmd_args.voice_cache_dir else None,
+)
+
+# Synthesized segments, reused when the same text is spoken again with the same voice and parameters
+segment_cache = None
+if cmd_args.segment_cache_size > 0:
+    segment_cache = SegmentCache(
+        cmd_args.segment_cache_dir or (os.path.join(cmd_args.voice_cache_dir, "segments") if cmd_args.voice_cache_dir else str(scratch_dir.subdir("segments"))),
+        max_bytes=cmd_args.segment_cache_size * 1024 * 1024,
+    )
+
+# Finished /v1/book/speech responses; identical concurrent requests share one synthesis
+book_cache = ResponseCache(max_bytes=cmd_args.book_cache_size * 1024 * 1024)
+
+# Voices in the audio prompt directory, with IDs that stay stable across restarts
+voice_catalog = VoiceCatalog(audio_prompt_base_dir, cmd_args.voice_manifest or os.path.join(audio_prompt_base_dir, ".voice_manifest.json"))
+
 
 # Request models
 class TTSRequest(BaseModel):
     text: str = Field(..., description="Text to synthesize")
     audio_prompt: str | None = Field(None, description="Base64-encoded audio prompt or path to audio file")
-    output_format: str = Field("mp3", description="Output audio format (mp3 or wav)")
+    output_format: str = Field("mp3", description="Output audio format (mp3, opus, aac, flac, wav or pcm)")
     max_text_tokens_per_sentence: int = Field(100, description="Maximum text tokens per sentence")
     sentences_bucket_max_size: int = Field(4, description="Maximum sentences per bucket")
     verbose: bool = Field(False, description="Enable verbose output")
@@ -166,36 +251,116 @@ class OpenAISpeechRequest(BaseModel):
 
     # Other settings
     verbose: bool = Field(default=False, description="Enable verbose output")
+    stream: bool = Field(default=False, description="Stream audio segment by segment as it is synthesized")
+    bitrate: str | None = Field(default=None, pattern=r"^\d+k?$", description="Bitrate for mp3, opus and aac, e.g. 48k (default: server setting)")
 
 
 # Helper functions
 def get_tts_instance():
-    """Get the IndexTTS2 instance (already initialized at module level)"""
+    """Get the first IndexTTS2 replica, for cheap helpers that do not run inference"""
     return tts_instance
 
 
+def start_pipeline(text: str, max_text_tokens_per_segment: int, **infer_kwargs) -> SegmentPipeline:
+    """Split text and admit it into the synthesis pipeline; a full queue becomes 429 with Retry-After"""
+    segments = split_segments(text, max_text_tokens_per_segment) or [text]
+    pipeline = SegmentPipeline(
+        segment_scheduler,
+        segments,
+        {"max_text_tokens_per_segment": max_text_tokens_per_segment, **infer_kwargs},
+        depth=cmd_args.pipeline_depth,
+        timings=stage_timings,
+        cache=segment_cache,
+    )
+    try:
+        pipeline.start()
+    except QueueFullError as e:
+        logger.warning(f"Rejecting synthesis request: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}) from e
+    return pipeline
+
+
+async def synthesize_audio(output_format: str, bitrate: str | None = None, *, text: str, max_text_tokens_per_segment: int, **infer_kwargs) -> bytes:
+    """Synthesize into memory and encode for the response; nothing is written to disk
+
+    Segments are encoded as they arrive, so encoding overlaps the synthesis of later segments.
+    """
+    pipeline = start_pipeline(text, max_text_tokens_per_segment, **infer_kwargs)
+    if output_format == "wav":
+        # The header needs the final data size
+        pcm = b"".join([chunk async for chunk in pipeline.encode("pcm")])
+        return wav_header(pipeline.sample_rate, len(pcm)) + pcm
+    return b"".join([chunk async for chunk in pipeline.encode(output_format, bitrate or audio_bitrates.get(output_format))])
+
+
+async def stream_speech(text: str, max_text_tokens_per_segment: int, output_format: str, bitrate: str | None = None, **infer_kwargs) -> StreamingResponse:
+    """Synthesize text segment by segment and send each segment as soon as it is encoded
+
+    Segments interleave with other requests' segments in the scheduler, and at most
+    --pipeline_depth of them are synthesized ahead of the client. The first segment is awaited
+    before the response starts, so queue rejections and errors still surface as HTTP status codes.
+    """
+    pipeline = start_pipeline(text, max_text_tokens_per_segment, **infer_kwargs)
+    logger.info(f"Streaming speech in {len(pipeline.segments)} segment(s) as {output_format}")
+    chunks = pipeline.encode(output_format, bitrate or audio_bitrates.get(output_format))
+    try:
+        first = await anext(chunks)
+    except BaseException:
+        await chunks.aclose()
+        raise
+
+    async def generate():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated stream
+            logger.error(f"Error while streaming speech: {str(e)}")
+        finally:
+            # Segments of a disconnected client are dropped from the scheduler
+            await chunks.aclose()
+
+    return StreamingResponse(generate(), media_type=CONTENT_TYPES[output_format])
+
+
+def resolve_voice(voice: str | None) -> str:
+    """Map a voice ID, file name or file name without extension to a prompt path; unknown voices use the default prompt"""
+    if not voice:
+        return default_audio_prompt_path
+    if voice == "lf":
+        return os.path.join(audio_prompt_base_dir, "audo_enhanced_audio-lf2.mp3")
+    entry = voice_catalog.resolve(voice)
+    if entry is None:
+        logger.warning(f"Voice not found: {voice}, using default: {default_audio_prompt_path}")
+        return default_audio_prompt_path
+    return entry.path
+
+
+def catalog_response(request: Request, content: dict) -> Response:
+    """JSON response tagged with the catalog ETag; 304 when the client already has this version"""
+    etag = voice_catalog.etag
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=content, headers={"ETag": etag})
+
+
 async def process_audio_prompt(audio_prompt):
-    """Process audio prompt from base64 or file path"""
+    """Process audio prompt from base64 or file path
+
+    Base64 prompts are stored under their content hash, so repeated uploads of the same audio
+    reuse one file and its cached conditioning. Local files are used in place.
+    """
     if not audio_prompt:
         return None
 
-    logger.trace(f"audio prompt: {audio_prompt}")
+    logger.trace(f"audio prompt: {audio_prompt[:100]}")
 
     # Check if it's a base64 string
     if audio_prompt.startswith("data:") or ";base64," in audio_prompt:
         try:
-            # Extract the base64 part if it's a data URL
-            if ";base64," in audio_prompt:
-                audio_prompt = audio_prompt.split(";base64,")[1]
-                # Decode base64
-                audio_data = base64.b64decode(audio_prompt)
-            else:
-                audio_data = audio_prompt
-
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                return temp_file.name
+            # Decoding and writing the file must not block the event loop
+            return await asyncio.to_thread(voice_registry.store_base64_prompt, audio_prompt)
         except Exception as e:
             logger.error(f"Failed to decode base64 audio: {e}")
             raise HTTPException(status_code=400, detail=f"Invalid base64 audio: {str(e)}") from e
@@ -203,13 +368,8 @@ async def process_audio_prompt(audio_prompt):
     local_audio_path = os.path.join(audio_prompt_base_dir, audio_prompt)
     logger.trace(f"local audio path: {local_audio_path}")
     if os.path.exists(local_audio_path):
-        temp_dir = tempfile.mkdtemp()
-        with open(local_audio_path, "rb") as input_file:
-            temp_audio_path = os.path.join(temp_dir, os.path.basename(local_audio_path))
-            with open(temp_audio_path, "wb") as output_file:
-                output_file.write(input_file.read())
-        logger.info(f"Found audio prompt file at: {local_audio_path}, copy to temp path: {temp_audio_path}")
-        return temp_audio_path
+        logger.info(f"Found audio prompt file at: {local_audio_path}")
+        return local_audio_path
     else:
         logger.warning(f"Audio prompt file not found at: {local_audio_path}, use default audio prompt: {default_audio_prompt_path}")
         return default_audio_prompt_path
@@ -225,37 +385,27 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "ok"}
-
+    return {
+        "status": "ok",
+        "inference": inference_pool.stats(),
+        "scheduler": segment_scheduler.stats(),
+        "stages": stage_timings.stats(),
+        "segment_cache": segment_cache.stats() if segment_cache else None,
+        "book_cache": book_cache.stats(),
+        "voices": voice_registry.stats(),
+    }
 
-def get_indexed_audio_files():
-    """Get indexed audio files from available directories"""
-    try:
-        # 尝试列出多个可能的目录
-        results = {}
-
-        # 检查当前工作目录
-        results["cwd"] = os.getcwd()
-
-        # 尝试列出 audio_prompt 目录
-        local_audio_path = audio_prompt_base_dir
-        if os.path.exists(local_audio_path):
-            files = os.listdir(local_audio_path)
-            # 添加索引和文件名
-            indexed_files = {str(i): filename for i, filename in enumerate(files)}
-            results["audio_files"] = indexed_files
-        else:
-            results["audio_files"] = "Directory not found"
 
-        return results
-    except Exception as e:
-        return {"error": str(e)}
+def get_indexed_audio_files() -> dict[str, str]:
+    """Stable voice ID -> file name, from the voice catalog"""
+    return {entry.id: entry.name for entry in voice_catalog.voices()}
 
 
 @app.get("/v1/tts/voices")
-async def list_audio_files():
-    """Debug endpoint to list audio files in the audio_prompt directory"""
-    return get_indexed_audio_files()
+async def list_audio_files(request: Request):
+    """List audio files in the audio_prompt directory with their stable IDs and metadata"""
+    voices = voice_catalog.voices()
+    return catalog_response(request, {"cwd": os.getcwd(), "audio_files": get_indexed_audio_files(), "voices": [entry.public() for entry in voices]})
 
 
 @app.get("/v1/models")
@@ -275,95 +425,53 @@ async def list_models():
 
 
 @app.get("/v1/voices")
-async def list_voices():
+async def list_voices(request: Request):
     """List available voices (custom endpoint for voice discovery)"""
-    # Get available audio files
     indexed_files = get_indexed_audio_files()
 
     # Standard OpenAI voices
     standard_voices = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
 
-    # Custom voices from audio_prompt directory
-    custom_voices = []
-    if "audio_files" in indexed_files and isinstance(indexed_files["audio_files"], dict):
-        custom_voices = list(indexed_files["audio_files"].values())
-
-    return {
-        "standard_voices": standard_voices,
-        "custom_voices": custom_voices,
-        "indexed_files": indexed_files.get("audio_files", {}),
-    }
+    return catalog_response(
+        request,
+        {
+            "standard_voices": standard_voices,
+            "custom_voices": list(indexed_files.values()),
+            "indexed_files": indexed_files,
+        },
+    )
 
 
 @app.post("/v1/tts")
-async def tts_endpoint(request: TTSRequest, background_tasks: BackgroundTasks):
+async def tts_endpoint(request: TTSRequest):
     """Generate speech from text"""
     try:
-        # Get TTS instance
-        tts = get_tts_instance()
-
         # Process audio prompt if provided
 
         audio_prompt_path = None
         if request.audio_prompt:
             audio_prompt_path = await process_audio_prompt(request.audio_prompt)
-            background_tasks.add_task(lambda: os.unlink(audio_prompt_path) if audio_prompt_path and os.path.exists(audio_prompt_path) else None)
-        elif request.voice:
-            # 尝试使用索引获取音频文件
-            try:
-                # 获取索引音频文件列表
-                indexed_files = get_indexed_audio_files()
-
-                # 检查是否是特殊标识符
-                if request.voice == "lf":
-                    audio_prompt_path = os.path.join(audio_prompt_base_dir, "audo_enhanced_audio-lf2.mp3")
-                # 检查是否是数字索引
-                elif request.voice.isdigit():
-                    # 尝试从本地目录获取
-                    local_files = indexed_files.get("audio_files", {})
-                    audio_prompt_path = os.path.join(audio_prompt_base_dir, local_files[request.voice]) if isinstance(local_files, dict) and request.voice in local_files else default_audio_prompt_path
-                else:
-                    # 直接使用文件名
-                    audio_prompt_path = os.path.join(audio_prompt_base_dir, request.voice)
-            except Exception as e:
-                logger.error(f"Error finding voice by index: {e}")
-                audio_prompt_path = default_audio_prompt_path
         else:
-            audio_prompt_path = default_audio_prompt_path
+            audio_prompt_path = resolve_voice(request.voice)
 
-        # 检查音频文件长度
+        # 检查音频文件长度（每个文件版本只探测一次）
         try:
             if audio_prompt_path and os.path.exists(audio_prompt_path):
-                # 使用ffprobe检查音频文件长度
-                import subprocess
+                duration = await asyncio.to_thread(voice_registry.duration, audio_prompt_path)
+                if duration is not None:
+                    logger.info(f"Audio prompt duration: {duration} seconds")
 
-                result = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", audio_prompt_path], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-                if result.returncode == 0:
-                    try:
-                        duration = float(result.stdout.strip())
-                        logger.info(f"Audio prompt duration: {duration} seconds")
-
-                        # 如果超过60秒，使用默认语音提示
-                        if duration > 70.0:
-                            logger.warning(f"Audio prompt too long ({duration} seconds), using default prompt")
-                            audio_prompt_path = default_audio_prompt_path
-                    except ValueError:
-                        logger.warning(f"Could not parse duration: {result.stdout}")
-                else:
-                    logger.warning(f"Could not determine audio duration: {result.stderr}")
+                    # 如果超过70秒，使用默认语音提示
+                    if duration > 70.0:
+                        logger.warning(f"Audio prompt too long ({duration} seconds), using default prompt")
+                        audio_prompt_path = default_audio_prompt_path
 
         except Exception as e:
             logger.warning(f"Error checking audio duration: {e}")
             # 出错时不替换音频文件，继续使用原文件
 
         logger.trace(f"prompt voice: {audio_prompt_path}")
-        # Create temporary output file
-        with tempfile.NamedTemporaryFile(suffix=f".{request.output_format}", delete=False) as temp_file:
-            output_path = temp_file.name
-
-        # Add cleanup task
-        background_tasks.add_task(lambda: os.unlink(output_path) if os.path.exists(output_path) else None)
+        output_format = request.output_format.lower() if request.output_format.lower() in CONTENT_TYPES else "wav"
 
         # Generate speech
         logger.info(f"Generating speech for text: {request.text[:50]}...")
@@ -383,20 +491,15 @@ async def tts_endpoint(request: TTSRequest, background_tasks: BackgroundTasks):
 
         # Use IndexTTS2.infer method
         logger.trace(f"spk_audio_prompt: {audio_prompt_path}")
-        logger.trace(f"output_path: {output_path}")
+        logger.trace(f"output_format: {output_format}")
         logger.trace(f"verbose: {request.verbose}")
         logger.trace(f"max_text_tokens_per_segment: {request.max_text_tokens_per_sentence}")
         logger.trace(f"kwargs: {kwargs}")
-        tts.infer(spk_audio_prompt=audio_prompt_path, text=request.text, output_path=output_path, verbose=request.verbose, max_text_tokens_per_segment=request.max_text_tokens_per_sentence, **kwargs)
-
-        # Stream the audio file
-        def iterfile():
-            with open(output_path, "rb") as f:
-                yield from f
-
-        content_type = "audio/mpeg" if request.output_format == "mp3" else "audio/wav"
-        return StreamingResponse(iterfile(), media_type=content_type)
+        audio_data = await synthesize_audio(output_format, spk_audio_prompt=audio_prompt_path, text=request.text, verbose=request.verbose, max_text_tokens_per_segment=request.max_text_tokens_per_sentence, **kwargs)
+        return Response(content=audio_data, media_type=CONTENT_TYPES[output_format])
 
+    except HTTPException:
+        raise
     except Exception as e:
         error_detail = {"error": str(e), "type": type(e).__name__}
         logger.error("Error in TTS generation: " + str(e))
@@ -406,7 +509,7 @@ async def tts_endpoint(request: TTSRequest, background_tasks: BackgroundTasks):
 
 # OpenAI-compatible endpoint
 @app.post("/v1/audio/speech")
-async def speech_endpoint(request: OpenAISpeechRequest, background_tasks: BackgroundTasks):
+async def speech_endpoint(request: OpenAISpeechRequest):
     """Generate speech from text (OpenAI-compatible API with IndexTTS2 extensions)
 
     This endpoint is compatible with OpenAI's /v1/audio/speech API and includes
@@ -416,7 +519,7 @@ async def speech_endpoint(request: OpenAISpeechRequest, background_tasks: Backgr
         request: OpenAI-compatible speech request with IndexTTS2 extensions
 
     Returns:
-        StreamingResponse with audio data
+        Response with audio data, or a StreamingResponse when stream=true
     """
     try:
         # Validate input
@@ -425,42 +528,20 @@ async def speech_endpoint(request: OpenAISpeechRequest, background_tasks: Backgr
 
         # Normalize response format
         output_format = request.response_format.lower()
-        if output_format not in ["mp3", "wav", "opus", "aac", "flac", "pcm"]:
+        if output_format not in CONTENT_TYPES:
             logger.warning(f"Unsupported format {output_format}, defaulting to mp3")
             output_format = "mp3"
 
-        # Map common formats to supported ones
-        format_mapping = {
-            "opus": "mp3",
-            "aac": "mp3",
-            "flac": "wav",
-            "pcm": "wav",
-        }
-        output_format = format_mapping.get(output_format, output_format)
-
         # Get TTS instance
         tts = get_tts_instance()
 
         # Process speaker audio prompt (voice)
-        audio_prompt_path = None
-        if request.voice:
-            indexed_files = get_indexed_audio_files()
-            if request.voice == "lf":
-                audio_prompt_path = os.path.join(audio_prompt_base_dir, "audo_enhanced_audio-lf2.mp3")
-            elif request.voice.isdigit():
-                local_files = indexed_files.get("audio_files", {})
-                audio_prompt_path = os.path.join(audio_prompt_base_dir, local_files[request.voice]) if isinstance(local_files, dict) and request.voice in local_files else default_audio_prompt_path
-            else:
-                audio_prompt_path = os.path.join(audio_prompt_base_dir, request.voice)
-        else:
-            audio_prompt_path = default_audio_prompt_path
+        audio_prompt_path = resolve_voice(request.voice)
 
         # Process emotion reference audio if provided
         emo_audio_prompt_path = None
         if request.emo_control_mode == 1 and request.emo_reference_audio:
             emo_audio_prompt_path = await process_audio_prompt(request.emo_reference_audio)
-            if emo_audio_prompt_path:
-                background_tasks.add_task(lambda: os.unlink(emo_audio_prompt_path) if os.path.exists(emo_audio_prompt_path) else None)
 
         # Process emotion vector if provided
         emo_vector = None
@@ -473,12 +554,6 @@ async def speech_endpoint(request: OpenAISpeechRequest, background_tasks: Backgr
         # Process emotion text
         emo_text = request.emo_text if request.emo_text and request.emo_text.strip() else None
 
-        # Create temporary output file
-        with tempfile.NamedTemporaryFile(suffix=f".{output_format}", delete=False) as temp_file:
-            output_path = temp_file.name
-
-        background_tasks.add_task(lambda: os.unlink(output_path) if os.path.exists(output_path) else None)
-
         # Prepare generation kwargs
         kwargs = {
             "do_sample": request.do_sample,
@@ -491,12 +566,30 @@ async def speech_endpoint(request: OpenAISpeechRequest, background_tasks: Backgr
             "max_mel_tokens": request.max_mel_tokens,
         }
 
+        if request.stream:
+            return await stream_speech(
+                request.input,
+                request.max_text_tokens_per_segment,
+                output_format,
+                bitrate=request.bitrate,
+                spk_audio_prompt=audio_prompt_path,
+                emo_audio_prompt=emo_audio_prompt_path,
+                emo_alpha=request.emo_weight,
+                emo_vector=emo_vector,
+                use_emo_text=(request.emo_control_mode == 3),
+                emo_text=emo_text,
+                use_random=request.emo_random,
+                verbose=request.verbose,
+                **kwargs,
+            )
+
         # Generate speech using IndexTTS2
         logger.info(f"Generating speech with emotion mode {request.emo_control_mode}")
-        tts.infer(
+        audio_data = await synthesize_audio(
+            output_format,
+            bitrate=request.bitrate,
             spk_audio_prompt=audio_prompt_path,
             text=request.input,
-            output_path=output_path,
             emo_audio_prompt=emo_audio_prompt_path,
             emo_alpha=request.emo_weight,
             emo_vector=emo_vector,
@@ -507,14 +600,7 @@ async def speech_endpoint(request: OpenAISpeechRequest, background_tasks: Backgr
             max_text_tokens_per_segment=request.max_text_tokens_per_segment,
             **kwargs,
         )
-
-        # Stream the audio file
-        def iterfile():
-            with open(output_path, "rb") as f:
-                yield from f
-
-        content_type = "audio/mpeg" if output_format == "mp3" else "audio/wav"
-        return StreamingResponse(iterfile(), media_type=content_type)
+        return Response(content=audio_data, media_type=CONTENT_TYPES[output_format])
 
     except HTTPException:
         raise
@@ -525,7 +611,7 @@ async def speech_endpoint(request: OpenAISpeechRequest, background_tasks: Backgr
 
 # 阅读 app API
 @app.post("/v1/book/speech", response_class=Response)
-async def book_speech_endpoint(request: Request, background_tasks: BackgroundTasks):
+async def book_speech_endpoint(request: Request):
     """
     Endpoint for text-to-speech synthesis using Azure TTS-style requests.
     This endpoint is compatible with legado app and similar clients.
@@ -544,42 +630,10 @@ async def book_speech_endpoint(request: Request, background_tasks: BackgroundTas
         # Create TTS request from parsed text, rate, and voice
         tts_request = create_tts_request(text, rate, response_format="mp3", voice=voice)
 
-        # Get TTS instance
-        tts = get_tts_instance()
-
-        # Process audio prompt (voice)
-        audio_prompt_path = None
-        if voice:
-            indexed_files = get_indexed_audio_files()
-            if voice.isdigit():
-                local_files = indexed_files.get("audio_files", {})
-                audio_prompt_path = os.path.join(audio_prompt_base_dir, local_files[voice]) if isinstance(local_files, dict) and voice in local_files else default_audio_prompt_path
-            else:
-                # Try to use voice as filename (with or without extension)
-                potential_path = os.path.join(audio_prompt_base_dir, voice)
-                # If voice doesn't have extension and file doesn't exist, try common extensions
-                if not os.path.exists(potential_path):
-                    if not any(voice.endswith(ext) for ext in [".mp3", ".wav", ".flac"]):
-                        for ext in [".mp3", ".wav", ".flac"]:
-                            test_path = os.path.join(audio_prompt_base_dir, voice + ext)
-                            if os.path.exists(test_path):
-                                audio_prompt_path = test_path
-                                break
-                    # If still not found, fall back to default
-                    if audio_prompt_path is None:
-                        logger.warning(f"Voice file not found: {voice}, using default: {default_audio_prompt_path}")
-                        audio_prompt_path = default_audio_prompt_path
-                else:
-                    audio_prompt_path = potential_path
-        else:
-            audio_prompt_path = default_audio_prompt_path
+        # Process audio prompt (voice): ID, file name, or file name without extension
+        audio_prompt_path = resolve_voice(voice)
 
-        # Create temporary output file
         output_format = tts_request.response_format.lower()
-        with tempfile.NamedTemporaryFile(suffix=f".{output_format}", delete=False) as temp_file:
-            output_path = temp_file.name
-
-        background_tasks.add_task(lambda: os.unlink(output_path) if os.path.exists(output_path) else None)
 
         # Prepare generation kwargs with speed adjustment
         kwargs = {
@@ -593,33 +647,25 @@ async def book_speech_endpoint(request: Request, background_tasks: BackgroundTas
             "max_mel_tokens": 1500,
         }
 
-        # Generate speech using IndexTTS2
-        logger.info(f"Generating book speech with voice: {audio_prompt_path}, speed: {tts_request.speed}")
-        tts.infer(
-            spk_audio_prompt=audio_prompt_path,
-            text=text,
-            output_path=output_path,
-            verbose=tts_request.verbose,
-            max_text_tokens_per_segment=tts_request.max_text_tokens_per_sentence,
-            **kwargs,
-        )
+        # Retries, seeks and re-opens of the same paragraph are served from the cache
+        cache_key = (text, rate, voice, file_version(audio_prompt_path))
+
+        async def generate():
+            logger.info(f"Generating book speech with voice: {audio_prompt_path}, speed: {tts_request.speed}")
+            return await synthesize_audio(
+                output_format,
+                spk_audio_prompt=audio_prompt_path,
+                text=text,
+                verbose=tts_request.verbose,
+                max_text_tokens_per_segment=tts_request.max_text_tokens_per_sentence,
+                **kwargs,
+            )
 
-        # Read the audio file and return as Response (not streaming)
+        audio_data = await book_cache.get_or_create(cache_key, generate)
+
+        # Return as Response (not streaming) with explicit headers
         # This matches llm-forwarder implementation for better client compatibility
-        with open(output_path, "rb") as f:
-            audio_data = f.read()
-
-        content_type = "audio/mpeg" if output_format == "mp3" else "audio/wav"
-
-        # Return with explicit headers for client compatibility
-        return Response(
-            content=audio_data,
-            media_type=content_type,
-            headers={
-                "Content-Length": str(len(audio_data)),
-                "Accept-Ranges": "bytes",
-            },
-        )
+        return byte_range_response(audio_data, CONTENT_TYPES[output_format], request.headers.get("range"))
 
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -639,6 +685,7 @@ if __name__ == "__main__":
     logger.info("Starting Audio OpenAI-compatible API server")
     logger.info(f"Model directory: {cmd_args.model_dir}")
     logger.info(f"FP16: {cmd_args.fp16}, CUDA kernel: {cmd_args.cuda_kernel}, DeepSpeed: {cmd_args.deepspeed}")
+    logger.info(f"Replicas: {len(tts_replicas)}, max queue depth: {cmd_args.max_queue_depth}")
     logger.info(f"Server: {host}:{port}")
 
     # Start server
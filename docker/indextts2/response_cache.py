@@ -0,0 +1,126 @@
+"""
+Whole-response cache for /v1/book/speech, with singleflight and HTTP Range support.
+
+legado-style readers request the same paragraph again on retries, seeks and re-opens. Finished
+responses are kept in a byte-bounded in-memory LRU keyed by the parsed SSML (text, rate, voice)
+plus the voice file version. Identical requests that arrive while the audio is still being
+synthesized wait for the same synthesis instead of starting their own. The synthesis runs in
+its own task, so it finishes and fills the cache even if the client that started it
+disconnects; the reader's retry then gets the cached audio.
+
+Cached audio is served with real byte ranges: a single "Range: bytes=..." gets 206 Partial
+Content, an unsatisfiable one gets 416, and anything else gets the full body.
+"""
+
+import asyncio
+import re
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from fastapi.responses import Response
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiableError(Exception):
+    """The requested byte range lies outside the content"""
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Inclusive (start, end) of a single byte range, or None to serve the whole content
+
+    Malformed and multi-range headers are ignored, as RFC 9110 allows.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiableError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise RangeNotSatisfiableError(header)
+    return start, end
+
+
+def byte_range_response(content: bytes, media_type: str, range_header: str | None) -> Response:
+    """Full (200), partial (206) or 416 response for content"""
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        byte_range = parse_range(range_header, len(content))
+    except RangeNotSatisfiableError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(content)}"})
+    if byte_range is None:
+        return Response(content=content, media_type=media_type, headers={**headers, "Content-Length": str(len(content))})
+    start, end = byte_range
+    body = content[start : end + 1]
+    headers.update({"Content-Range": f"bytes {start}-{end}/{len(content)}", "Content-Length": str(len(body))})
+    return Response(content=body, status_code=206, media_type=media_type, headers=headers)
+
+
+class ResponseCache:
+    """Byte-bounded LRU of finished responses with coalescing of identical in-flight requests"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.total_bytes = 0
+        self._entries: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+
+    async def get_or_create(self, key: Hashable, create: Callable[[], Awaitable[bytes]]) -> bytes:
+        content = self._entries.get(key)
+        if content is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._create(key, create))
+            # Mark the result as retrieved even if every waiter has gone away
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._in_flight[key] = task
+        else:
+            self.coalesced += 1
+        # A waiter that goes away does not cancel the shared synthesis
+        return await asyncio.shield(task)
+
+    async def _create(self, key: Hashable, create: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            content = await create()
+            self._store(key, content)
+            return content
+        finally:
+            del self._in_flight[key]
+
+    def _store(self, key: Hashable, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        self.total_bytes += len(content) - len(self._entries.pop(key, b""))
+        self._entries[key] = content
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / total, 3) if total else None,
+        }
@@ -0,0 +1,54 @@
+"""
+Managed scratch directory for the audio server.
+
+Synthesis itself stays in memory; disk is only used where a model API insists on a file path
+(e.g. uploaded prompt audio, which IndexTTS2 loads by path). Everything goes under one private
+directory that is removed at shutdown, with an atexit fallback. Directories left behind by a
+crashed process are removed on the next start.
+"""
+
+import atexit
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from loguru import logger
+
+_PREFIX = "indextts-scratch-"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScratchDir:
+    """Private temporary directory owned by this process"""
+
+    def __init__(self, parent: str | None = None):
+        self.parent = Path(parent or tempfile.gettempdir())
+        self._remove_stale()
+        self.root = Path(tempfile.mkdtemp(prefix=f"{_PREFIX}{os.getpid()}-", dir=self.parent))
+        atexit.register(self.cleanup)
+
+    def _remove_stale(self):
+        for path in self.parent.glob(f"{_PREFIX}*"):
+            match = re.match(rf"{_PREFIX}(\d+)-", path.name)
+            if match and not _pid_alive(int(match.group(1))):
+                logger.info(f"Removing scratch directory left by a previous run: {path}")
+                shutil.rmtree(path, ignore_errors=True)
+
+    def subdir(self, name: str) -> Path:
+        path = self.root / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
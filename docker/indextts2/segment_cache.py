@@ -0,0 +1,139 @@
+"""
+Segment memoization cache for the audio server.
+
+Book readers and notifications synthesize the same sentences ("第一章", chapter titles,
+boilerplate) with the same voice and parameters again and again. Synthesized segments are
+stored on disk under a content hash of (normalized text, voice file versions, generation
+parameters), and requests are assembled from cached and freshly synthesized segments.
+
+The store is bounded in bytes with LRU eviction; file mtimes record recency so the order
+survives a restart. Requests with use_random (random emotion) are never cached. Sampled
+generation (do_sample) is part of the key but is cached: a repeated sentence reuses the first
+rendition instead of drawing a new one.
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from audio_encoding import pcm16_bytes
+from loguru import logger
+from voice_registry import file_version
+
+# Arguments that do not change the audio
+IGNORED_KWARGS = ("verbose",)
+PROMPT_KWARGS = ("spk_audio_prompt", "emo_audio_prompt")
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def segment_key(text: str, infer_kwargs: dict[str, Any]) -> str | None:
+    """Cache key for one segment, or None if the segment must not be cached"""
+    if infer_kwargs.get("use_random"):
+        return None
+    params = {name: value for name, value in infer_kwargs.items() if name not in IGNORED_KWARGS}
+    for name in PROMPT_KWARGS:
+        if params.get(name):
+            # A re-recorded voice file gets new cache entries
+            params[name] = file_version(params[name])
+            if params[name] is None:
+                return None
+    payload = json.dumps({"text": normalize_text(text), "params": params}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SegmentCache:
+    """Size-bounded on-disk LRU of synthesized segments"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        for path in sorted(self.root.glob("*.seg"), key=lambda path: path.stat().st_mtime_ns):
+            self._entries[path.stem] = path.stat().st_size
+            self.total_bytes += path.stat().st_size
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.seg"
+
+    def __contains__(self, key: str | None) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> tuple[int, np.ndarray] | None:
+        """(sample_rate, int16 samples) of a cached segment"""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self._entries.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        (sample_rate,) = struct.unpack_from("<I", data)
+        return sample_rate, np.frombuffer(data, dtype="<i2", offset=4)
+
+    def put(self, key: str, sample_rate: int, wav):
+        data = struct.pack("<I", sample_rate) + pcm16_bytes(wav)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        temp = path.with_name(f".{path.name}.{threading.get_ident()}")
+        try:
+            temp.write_bytes(data)
+            temp.replace(path)
+        except OSError as e:
+            logger.warning(f"Could not store cached segment: {e}")
+            temp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            evicted = []
+            while self.total_bytes > self.max_bytes and self._entries:
+                key, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(key)
+        for key in evicted:
+            self._path(key).unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
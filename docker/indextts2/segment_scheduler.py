@@ -0,0 +1,147 @@
+"""
+Cross-request segment scheduler for the audio server.
+
+Requests are split into text segments up front and all segments wait in one shared queue.
+Whenever a replica is free, the scheduler hands it the oldest waiting segment and routes the
+result back to the request it came from. Each request keeps only a few segments queued at a time
+(see SegmentPipeline), so concurrent requests advance segment by segment and a long text does not
+hold a replica until it is done.
+
+Segments run one at a time: IndexTTS2.infer() synthesizes one text per call, so throughput scales
+with the number of replicas. Reusing a voice's conditioning across segments is VoiceRegistry's job.
+Admission control is per request: once a request is admitted, none of its segments is rejected.
+"""
+
+import asyncio
+import math
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from loguru import logger
+
+from inference_worker import InferencePool, QueueFullError
+
+
+@dataclass
+class SegmentJob:
+    request: int
+    text: str
+    infer_kwargs: dict[str, Any]
+    future: asyncio.Future = field(repr=False)
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class SegmentScheduler:
+    """Runs waiting segments of all requests on the inference pool, oldest first"""
+
+    def __init__(self, pool: InferencePool, run_segment: Callable[[Any, str, dict[str, Any]], Any], *, max_pending_requests: int = 8, timings: Any = None):
+        self.pool = pool
+        self.run_segment = run_segment
+        self.max_pending_requests = max_pending_requests
+        self.timings = timings
+        self.segments = 0
+        self._waiting: list[SegmentJob] = []
+        self._in_flight = 0
+        self._requests = 0
+        self._running: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, *self._running, return_exceptions=True)
+        for job in self._waiting:
+            job.future.cancel()
+        self._waiting = []
+
+    @property
+    def pending_requests(self) -> int:
+        return len({job.request for job in self._waiting if not job.future.done()})
+
+    def retry_after(self) -> int:
+        segments = len(self._waiting) + self._in_flight
+        return max(1, math.ceil(segments * self.pool.avg_job_seconds / len(self.pool.replicas)))
+
+    def admit(self) -> int:
+        """Admit a new request and return its ID; raises QueueFullError when too many are waiting"""
+        if self._wakeup is None:
+            raise RuntimeError("Segment scheduler is not started")
+        if self.pending_requests >= self.max_pending_requests:
+            self.pool.rejected += 1
+            raise QueueFullError(self.retry_after())
+        self._requests += 1
+        return self._requests
+
+    def submit(self, texts: list[str], request: int | None = None, **infer_kwargs) -> list[asyncio.Future]:
+        """Queue segments and return one future per segment, in order
+
+        Without a request ID this admits a new request; follow-up segments of an admitted
+        request pass its ID and are never rejected.
+        """
+        if request is None:
+            request = self.admit()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._waiting.append(SegmentJob(request, text, infer_kwargs, future))
+            futures.append(future)
+        self._wakeup.set()
+        return futures
+
+    def _next_job(self) -> SegmentJob | None:
+        # Segments whose request went away are dropped
+        self._waiting = [job for job in self._waiting if not job.future.done()]
+        return self._waiting.pop(0) if self._waiting else None
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._in_flight < len(self.pool.replicas):
+                job = self._next_job()
+                if job is None:
+                    break
+                self._in_flight += 1
+                task = asyncio.create_task(self._run(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    def _run_segment(self, replica: Any, job: SegmentJob) -> Any:
+        start = time.monotonic()
+        if self.timings is not None:
+            self.timings.record("queue_wait", start - job.queued_at)
+        result = self.run_segment(replica, job.text, job.infer_kwargs)
+        if self.timings is not None:
+            self.timings.record("synthesis", time.monotonic() - start)
+        return result
+
+    async def _run(self, job: SegmentJob):
+        try:
+            result = await self.pool.run(self._run_segment, job, admitted=True)
+        except Exception as e:
+            logger.error(f"Segment of request {job.request} failed: {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.segments += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            self._wakeup.set()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "waiting_segments": len(self._waiting),
+            "pending_requests": self.pending_requests,
+            "segments_in_flight": self._in_flight,
+            "segments": self.segments,
+        }
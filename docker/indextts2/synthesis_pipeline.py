@@ -0,0 +1,151 @@
+"""
+Staged synthesis pipeline for the audio server.
+
+A request goes through three stages: segment synthesis on a replica (via the segment
+scheduler), PCM conversion, and encoding. The stages overlap across segments: while segment N
+is being converted and encoded on a CPU thread, segments N+1 .. N+depth are already being
+synthesized. The window between the synthesis and encoding stages is bounded by depth, so a
+slow encoder or a slow streaming client holds back synthesis instead of piling up audio.
+
+With a SegmentCache, segments already synthesized with the same voice and parameters are read
+from disk instead of being queued for synthesis.
+
+Scope: the pipeline does not split synthesis itself. IndexTTS2 runs GPT, s2mel and the vocoder
+inside one infer() call, and the server only uses that public entry point of the upstream
+package (cloned unpinned in the image), so a GPT stage and an s2mel+vocoder stage on separate
+workers would mean re-implementing infer() against its internals. Within one request those
+steps stay sequential and overlap only across replicas. StageTimings records how long segments
+spend in each stage (queue wait, synthesis, encoding) plus time to first audio and the whole
+request, so /health shows which stage is the bottleneck.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from typing import Any
+
+from audio_encoding import create_stream_encoder, pcm16_bytes, silence_bytes
+from segment_cache import SegmentCache, segment_key
+from segment_scheduler import SegmentScheduler
+
+
+class StageTimings:
+    """Thread-safe per-stage duration counters"""
+
+    def __init__(self):
+        self._stages: dict[str, tuple[int, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            count, total, longest = self._stages.get(stage, (0, 0.0, 0.0))
+            self._stages[stage] = (count + 1, total + seconds, max(longest, seconds))
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {stage: {"count": count, "avg_ms": round(1000 * total / count, 1), "max_ms": round(1000 * longest, 1), "total_seconds": round(total, 3)} for stage, (count, total, longest) in self._stages.items()}
+
+
+class SegmentPipeline:
+    """Synthesizes and encodes the segments of one request with at most depth segments in flight"""
+
+    def __init__(self, scheduler: SegmentScheduler, segments: list[str], infer_kwargs: dict[str, Any], *, depth: int = 4, timings: StageTimings | None = None, cache: SegmentCache | None = None):
+        self.scheduler = scheduler
+        self.segments = segments
+        self.infer_kwargs = infer_kwargs
+        self.depth = max(1, depth)
+        self.timings = timings
+        self.cache = cache
+        self.sample_rate: int | None = None
+        self._request: int | None = None
+        self._next = 0
+        # (cache key to store the result under, future of (sample_rate, wav)) per segment
+        self._in_flight: deque[tuple[str | None, asyncio.Future]] = deque()
+        self._started_at = time.monotonic()
+
+    def start(self):
+        """Admit the request and queue the first segments; raises QueueFullError"""
+        self._request = self.scheduler.admit()
+        self._fill()
+
+    def _fill(self):
+        texts = self.segments[self._next : self._next + self.depth - len(self._in_flight)]
+        if not texts:
+            return
+        self._next += len(texts)
+        keys = [segment_key(text, self.infer_kwargs) if self.cache is not None else None for text in texts]
+        cached = [key is not None and key in self.cache for key in keys]
+        for key, hit in zip(keys, cached, strict=True):
+            if key is not None and not hit:
+                self.cache.record(hit=False)
+        misses = [text for text, hit in zip(texts, cached, strict=True) if not hit]
+        futures = iter(self.scheduler.submit(misses, request=self._request, **self.infer_kwargs) if misses else [])
+        for text, key, hit in zip(texts, keys, cached, strict=True):
+            if hit:
+                self._in_flight.append((None, asyncio.ensure_future(self._read_cached(text, key))))
+            else:
+                self._in_flight.append((key, next(futures)))
+
+    async def _read_cached(self, text: str, key: str) -> tuple[int, Any]:
+        result = await asyncio.to_thread(self.cache.get, key)
+        self.cache.record(hit=result is not None)
+        if result is None:
+            # Evicted since the lookup
+            result = await self.scheduler.submit([text], request=self._request, **self.infer_kwargs)[0]
+            await asyncio.to_thread(self.cache.put, key, *result)
+        return result
+
+    def _record(self, stage: str, seconds: float):
+        if self.timings is not None:
+            self.timings.record(stage, seconds)
+
+    async def pcm(self) -> AsyncIterator[bytes]:
+        """PCM of each segment in order, with the inter-segment pause prepended after the first"""
+        index = 0
+        while self._in_flight:
+            key, future = self._in_flight[0]
+            sample_rate, wav = await future
+            self._in_flight.popleft()
+            # Keep the synthesis stage busy while this segment moves on
+            self._fill()
+            if key is not None:
+                await asyncio.to_thread(self.cache.put, key, sample_rate, wav)
+            self.sample_rate = sample_rate
+            pcm = pcm16_bytes(wav)
+            yield silence_bytes(sample_rate) + pcm if index else pcm
+            index += 1
+
+    async def encode(self, output_format: str, bitrate: str | None = None) -> AsyncIterator[bytes]:
+        """Encoded output chunks; the first chunk is ready as soon as the first segment is"""
+        encoder = None
+        try:
+            async for pcm in self.pcm():
+                first = encoder is None
+                chunk = b""
+                if first:
+                    encoder = create_stream_encoder(output_format, self.sample_rate, bitrate)
+                    chunk = encoder.start()
+                start = time.monotonic()
+                chunk += await asyncio.to_thread(encoder.encode, pcm)
+                self._record("encode", time.monotonic() - start)
+                if first:
+                    self._record("first_audio", time.monotonic() - self._started_at)
+                yield chunk
+            if encoder is not None:
+                start = time.monotonic()
+                yield await asyncio.to_thread(encoder.finish)
+                self._record("encode", time.monotonic() - start)
+            self._record("request", time.monotonic() - self._started_at)
+        finally:
+            self.close()
+            if encoder is not None:
+                encoder.close()
+
+    def close(self):
+        """Drop segments that have not been synthesized yet"""
+        for _, future in self._in_flight:
+            future.cancel()
+        self._in_flight.clear()
+        self._next = len(self.segments)
@@ -0,0 +1,158 @@
+"""
+Voice catalog for the audio prompt directory.
+
+Voices get stable numeric IDs that are persisted to a JSON manifest and never reused, so
+"voice 3" keeps meaning the same file when other files are added or removed. The catalog is
+built once at startup and refreshed incrementally by polling file mtimes in the background;
+request handlers only do dictionary lookups. The manifest also stores per-file metadata
+(size, mtime, duration, sample rate) so unchanged files are not probed again after a restart.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+from voice_registry import probe_audio
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a")
+
+
+@dataclass
+class VoiceEntry:
+    """One audio prompt file"""
+
+    id: str
+    name: str
+    path: str
+    size: int
+    mtime_ns: int
+    duration: float | None = None
+    sample_rate: int | None = None
+
+    def public(self) -> dict[str, Any]:
+        data = asdict(self)
+        data.pop("path")
+        return data
+
+
+class VoiceCatalog:
+    """In-memory index of the voices in one directory"""
+
+    def __init__(self, root: str, manifest_path: str, probe: Callable[[str], tuple[float | None, int | None]] = probe_audio):
+        self.root = Path(root)
+        self.manifest_path = Path(manifest_path)
+        self.probe = probe
+        self.etag = '"empty"'
+        self._ids: dict[str, str] = {}
+        self._metadata: dict[str, dict[str, Any]] = {}
+        self._next_id = 0
+        self._by_id: dict[str, VoiceEntry] = {}
+        self._by_name: dict[str, VoiceEntry] = {}
+        self._by_stem: dict[str, VoiceEntry] = {}
+        self._lock = threading.Lock()
+        self._load_manifest()
+
+    def _load_manifest(self):
+        if not self.manifest_path.exists():
+            return
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable voice manifest {self.manifest_path}: {e}")
+            return
+        self._ids = manifest.get("ids", {})
+        self._metadata = manifest.get("metadata", {})
+        self._next_id = manifest.get("next_id", max((int(i) + 1 for i in self._ids.values()), default=0))
+
+    def _save_manifest(self):
+        manifest = {"next_id": self._next_id, "ids": self._ids, "metadata": self._metadata}
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.manifest_path.with_name(f".{self.manifest_path.name}.tmp")
+        temp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        temp.replace(self.manifest_path)
+
+    def _seed_ids(self):
+        """First run without a manifest: number files like the old lookup did, by position in the unfiltered os.listdir()
+
+        That lookup counted every directory entry, not just audio files, so existing "voice N" IDs keep
+        pointing at the same files. The positions of other entries are skipped and never handed out.
+        """
+        names = os.listdir(self.root)
+        self._ids = {name: str(index) for index, name in enumerate(names) if name.lower().endswith(AUDIO_EXTENSIONS) and (self.root / name).is_file()}
+        self._next_id = len(names)
+
+    def refresh(self) -> bool:
+        """Rescan the directory; only new or modified files are probed. Returns True if anything changed"""
+        try:
+            files = [entry for entry in os.scandir(self.root) if entry.is_file() and entry.name.lower().endswith(AUDIO_EXTENSIONS)]
+        except FileNotFoundError:
+            files = []
+        if not self._ids and self._next_id == 0 and files:
+            self._seed_ids()
+        entries, dirty = [], False
+        for file in files:
+            stat = file.stat()
+            metadata = self._metadata.get(file.name)
+            if metadata is None or metadata["size"] != stat.st_size or metadata["mtime_ns"] != stat.st_mtime_ns:
+                duration, sample_rate = self.probe(file.path)
+                metadata = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "duration": duration, "sample_rate": sample_rate}
+                self._metadata[file.name] = metadata
+                dirty = True
+            if file.name not in self._ids:
+                self._ids[file.name] = str(self._next_id)
+                self._next_id += 1
+                dirty = True
+            entries.append(VoiceEntry(id=self._ids[file.name], name=file.name, path=file.path, **metadata))
+
+        present = {entry.name for entry in entries}
+        for name in [name for name in self._metadata if name not in present]:
+            # Removed files keep their ID in the manifest so it is never reused
+            del self._metadata[name]
+            dirty = True
+        if dirty:
+            try:
+                self._save_manifest()
+            except OSError as e:
+                logger.warning(f"Could not write voice manifest {self.manifest_path}: {e}")
+
+        entries.sort(key=lambda entry: int(entry.id))
+        etag = '"' + hashlib.sha1(json.dumps([asdict(entry) for entry in entries], sort_keys=True).encode()).hexdigest() + '"'
+        with self._lock:
+            changed = etag != self.etag
+            self._by_id = {entry.id: entry for entry in entries}
+            self._by_name = {entry.name: entry for entry in entries}
+            self._by_stem = {}
+            # Extension guessing prefers .mp3, then .wav, .flac, ...
+            for entry in sorted(entries, key=lambda entry: AUDIO_EXTENSIONS.index(Path(entry.name).suffix.lower())):
+                self._by_stem.setdefault(Path(entry.name).stem, entry)
+            self.etag = etag
+        if changed:
+            logger.info(f"Voice catalog updated: {len(entries)} voice(s) in {self.root}")
+        return changed
+
+    async def watch(self, interval_seconds: float):
+        """Poll the directory for changes until cancelled"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.warning(f"Voice catalog refresh failed: {e}")
+
+    def resolve(self, voice: str | None) -> VoiceEntry | None:
+        """Look up a voice by ID, file name, or file name without extension"""
+        if not voice:
+            return None
+        with self._lock:
+            return self._by_id.get(voice) or self._by_name.get(voice) or self._by_stem.get(voice)
+
+    def voices(self) -> list[VoiceEntry]:
+        with self._lock:
+            return list(self._by_id.values())
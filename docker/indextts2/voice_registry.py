@@ -0,0 +1,260 @@
+"""
+Voice registry: per-voice conditioning cache for IndexTTS2.
+
+IndexTTS2 remembers the conditioning of only the last speaker / emotion prompt it saw
+(cache_spk_cond, cache_s2mel_style, ... keyed by the prompt path), so alternating voices
+re-extracts speaker features on every request. The registry keeps those tensors in an LRU keyed
+by (voice file, mtime), installs them on the replica before inference so IndexTTS2 takes its
+cached branch, and captures them afterwards. Entries can optionally be persisted to disk so a
+restart does not pay the extraction cost again.
+
+It also caches prompt durations per (voice file, mtime) and stores base64 prompts as
+content-addressed files, so the same uploaded prompt maps to the same path and cache entry.
+Prompt files evicted from that store are deleted lazily: only once no inference is using them
+and they have been idle for a grace period, so queued requests never lose their prompt.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+# IndexTTS2 instance attributes holding the cached conditioning, and the attribute with the prompt path they belong to
+CONDITIONING_KINDS = {
+    "speaker": ("cache_spk_audio_prompt", ("cache_spk_cond", "cache_s2mel_style", "cache_s2mel_prompt", "cache_mel")),
+    "emotion": ("cache_emo_audio_prompt", ("cache_emo_cond",)),
+}
+
+# File suffix of uploaded prompts by data URL MIME type, so the decoder sees the real container format
+PROMPT_SUFFIXES = {
+    "audio/wav": ".wav",
+    "audio/wave": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/mpeg": ".mp3",
+    "audio/mp3": ".mp3",
+    "audio/flac": ".flac",
+    "audio/x-flac": ".flac",
+    "audio/ogg": ".ogg",
+    "audio/mp4": ".m4a",
+    "audio/x-m4a": ".m4a",
+    "audio/aac": ".aac",
+    "audio/webm": ".webm",
+}
+
+
+def file_version(path: str) -> str | None:
+    """Cache key for a prompt file: path plus modification time, None if the file is missing"""
+    try:
+        return f"{os.path.abspath(path)}:{os.stat(path).st_mtime_ns}"
+    except OSError:
+        return None
+
+
+def probe_audio(path: str) -> tuple[float | None, int | None]:
+    """Audio duration in seconds and sample rate via ffprobe"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "format=duration:stream=sample_rate", "-of", "json", path],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        logger.warning(f"Could not probe audio {path}: {result.stderr}")
+        return None, None
+    try:
+        info = json.loads(result.stdout)
+        streams = info.get("streams") or [{}]
+        duration = info.get("format", {}).get("duration")
+        sample_rate = streams[0].get("sample_rate")
+        return (float(duration) if duration else None), (int(sample_rate) if sample_rate else None)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Could not parse ffprobe output for {path}: {e}")
+        return None, None
+
+
+class VoiceRegistry:
+    """Conditioning LRU, duration cache and base64 prompt store shared by all replicas"""
+
+    def __init__(self, prompt_dir: str, max_entries: int = 32, max_prompts: int = 64, persist_dir: str | None = None, prompt_grace: float = 600.0):
+        self.prompt_dir = Path(prompt_dir)
+        self.prompt_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_prompts = max_prompts
+        self.prompt_grace = prompt_grace
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        if self.persist_dir:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._conditioning: OrderedDict[tuple[str, str], tuple] = OrderedDict()
+        self._durations: dict[str, float | None] = {}
+        self._prompts: OrderedDict[str, Path] = OrderedDict()
+        # Evicted prompt files -> time they were last handed out or used, deleted once idle for prompt_grace
+        self._retired: dict[Path, float] = {}
+        self._in_flight: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    # Prompt durations
+
+    def duration(self, path: str) -> float | None:
+        """Duration of a prompt file, probed once per file version"""
+        version = file_version(path)
+        if version is None:
+            return None
+        with self._lock:
+            if version in self._durations:
+                return self._durations[version]
+        value = probe_audio(path)[0]
+        with self._lock:
+            self._durations[version] = value
+        return value
+
+    # Base64 prompts
+
+    def store_prompt(self, data: bytes, suffix: str = ".wav") -> str:
+        """Save an uploaded prompt under its content hash and return the path"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            path = self._prompts.get(digest)
+            if path is not None and path.exists():
+                self._prompts.move_to_end(digest)
+                return str(path)
+            path = self.prompt_dir / f"{digest}{suffix}"
+            self._retired.pop(path, None)
+            if not path.exists():
+                temp = path.with_name(f".{path.name}.{threading.get_ident()}")
+                temp.write_bytes(data)
+                temp.replace(path)
+            self._prompts[digest] = path
+            now = time.monotonic()
+            while len(self._prompts) > self.max_prompts:
+                _, evicted = self._prompts.popitem(last=False)
+                self._retired[evicted] = now
+            self._sweep_retired(now)
+        return str(path)
+
+    def _sweep_retired(self, now: float):
+        """Delete evicted prompt files that no inference uses and that have been idle for the grace period"""
+        for path, last_used in list(self._retired.items()):
+            if self._in_flight[str(path)] or now - last_used < self.prompt_grace:
+                continue
+            del self._retired[path]
+            path.unlink(missing_ok=True)
+
+    def store_base64_prompt(self, value: str) -> str:
+        """Decode a base64 string or data URL and store it; the data URL's MIME type picks the suffix (default .wav)"""
+        suffix = ".wav"
+        if ";base64," in value:
+            header, value = value.split(";base64,", 1)
+            mime = header.removeprefix("data:").split(";", 1)[0].strip().lower()
+            suffix = PROMPT_SUFFIXES.get(mime, suffix)
+        return self.store_prompt(base64.b64decode(value), suffix)
+
+    # Conditioning cache
+
+    def _persist_path(self, kind: str, version: str) -> Path:
+        return self.persist_dir / f"{kind}-{hashlib.sha256(version.encode()).hexdigest()}.pt"
+
+    def _lookup(self, kind: str, version: str, device: Any) -> tuple | None:
+        with self._lock:
+            tensors = self._conditioning.get((kind, version))
+            if tensors is not None:
+                self._conditioning.move_to_end((kind, version))
+                return tensors
+        if self.persist_dir is None or not self._persist_path(kind, version).exists():
+            return None
+        try:
+            import torch
+
+            tensors = tuple(torch.load(self._persist_path(kind, version), map_location=device))
+        except Exception as e:
+            logger.warning(f"Failed to load persisted {kind} conditioning: {e}")
+            return None
+        self._remember(kind, version, tensors, persist=False)
+        return tensors
+
+    def _remember(self, kind: str, version: str, tensors: tuple, persist: bool = True):
+        with self._lock:
+            self._conditioning[(kind, version)] = tensors
+            self._conditioning.move_to_end((kind, version))
+            while len(self._conditioning) > self.max_entries:
+                self._conditioning.popitem(last=False)
+        if persist and self.persist_dir is not None:
+            try:
+                import torch
+
+                torch.save(list(tensors), self._persist_path(kind, version))
+            except Exception as e:
+                logger.warning(f"Failed to persist {kind} conditioning: {e}")
+
+    def prepare(self, tts: Any, kind: str, path: str | None):
+        """Install cached conditioning for path on the replica, or force IndexTTS2 to recompute it"""
+        if not path:
+            return
+        prompt_attr, attrs = CONDITIONING_KINDS[kind]
+        version = file_version(path)
+        tensors = self._lookup(kind, version, getattr(tts, "device", None)) if version else None
+        if tensors is None:
+            self.misses += 1
+            # The replica's own single-entry cache does not know about file changes
+            if getattr(tts, prompt_attr, None) == path:
+                setattr(tts, prompt_attr, None)
+            return
+        self.hits += 1
+        for attr, value in zip(attrs, tensors, strict=True):
+            setattr(tts, attr, value)
+        setattr(tts, prompt_attr, path)
+
+    def capture(self, tts: Any, kind: str, path: str | None):
+        """Remember the conditioning IndexTTS2 computed for path"""
+        prompt_attr, attrs = CONDITIONING_KINDS[kind]
+        version = file_version(path) if path else None
+        if version is None or getattr(tts, prompt_attr, None) != path:
+            return
+        with self._lock:
+            known = (kind, version) in self._conditioning
+        if not known:
+            self._remember(kind, version, tuple(getattr(tts, attr) for attr in attrs))
+
+    def infer(self, tts: Any, **infer_kwargs):
+        """tts.infer() with the speaker and emotion conditioning served from the registry"""
+        speaker = infer_kwargs.get("spk_audio_prompt")
+        # IndexTTS2 uses the speaker prompt as emotion reference when none is given
+        emotion = infer_kwargs.get("emo_audio_prompt") or speaker
+        paths = [path for path in (speaker, emotion) if path]
+        with self._lock:
+            self._in_flight.update(paths)
+        try:
+            self.prepare(tts, "speaker", speaker)
+            self.prepare(tts, "emotion", emotion)
+            result = tts.infer(**infer_kwargs)
+            self.capture(tts, "speaker", speaker)
+            self.capture(tts, "emotion", emotion)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= Counter(paths)
+                now = time.monotonic()
+                for path in paths:
+                    if Path(path) in self._retired:
+                        self._retired[Path(path)] = now
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "conditioning_entries": len(self._conditioning),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "stored_prompts": len(self._prompts),
+            "retired_prompts": len(self._retired),
+        }
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+音频服务编码开销基准：对比各输出格式编码同一段音频的 CPU 时间、耗时和体积
+CPU 时间包含本进程和 ffmpeg 子进程（resource.getrusage），压缩格式需要系统安装 ffmpeg
+
+用法:
+    python scripts/benchmark_audio_encoding.py --seconds 30 --runs 5
+    python scripts/benchmark_audio_encoding.py --bitrate mp3=96k,opus=24k --formats mp3,opus,pcm
+"""
+
+import argparse
+import resource
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from audio_encoding import CONTENT_TYPES, FFMPEG_OUTPUT_ARGS, encode_audio, parse_bitrates  # noqa: E402
+
+
+def synthetic_speech(seconds: float, sample_rate: int) -> np.ndarray:
+    """类语音信号：基频缓慢变化的谐波、每秒约 4 个音节的包络和少量噪声"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    signal = voice * envelope + 0.02 * np.random.default_rng(0).standard_normal(len(t))
+    return (signal / np.abs(signal).max() * 0.6 * 32767).astype(np.int16)
+
+
+def cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(wav: np.ndarray, sample_rate: int, output_format: str, bitrate: str | None, runs: int) -> tuple[float, float, int]:
+    """返回 (最小 CPU 秒数, 最小耗时秒数, 编码后字节数)"""
+    encode_audio(wav, sample_rate, output_format, bitrate)  # 预热
+    cpu, wall, size = [], [], 0
+    for _ in range(runs):
+        cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+        size = len(encode_audio(wav, sample_rate, output_format, bitrate))
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(cpu_seconds() - cpu_start)
+    return min(cpu), min(wall), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio encoding CPU benchmark per output format")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of the test audio")
+    parser.add_argument("--sample-rate", type=int, default=22050, help="IndexTTS2 outputs 22050 Hz")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--formats", default=",".join(CONTENT_TYPES))
+    parser.add_argument("--bitrate", default="", help="e.g. mp3=128k,opus=32k,aac=64k")
+    args = parser.parse_args()
+
+    bitrates = parse_bitrates(args.bitrate)
+    wav = synthetic_speech(args.seconds, args.sample_rate)
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+
+    logger.info(f"audio={args.seconds:.0f}s sample_rate={args.sample_rate} runs={args.runs}")
+    logger.info(f"{'format':<8}{'bitrate':>9}{'size KB':>10}{'kbps':>8}{'cpu ms':>9}{'wall ms':>9}{'cpu ms/audio s':>16}")
+    for output_format in args.formats.split(","):
+        if output_format in FFMPEG_OUTPUT_ARGS and not has_ffmpeg:
+            logger.info(f"{output_format:<8}  skipped (ffmpeg not found)")
+            continue
+        bitrate = bitrates.get(output_format)
+        cpu, wall, size = measure(wav, args.sample_rate, output_format, bitrate, args.runs)
+        kbps = size * 8 / 1000 / args.seconds
+        logger.info(f"{output_format:<8}{bitrate or '-':>9}{size / 1024:>10.1f}{kbps:>8.0f}{cpu * 1000:>9.1f}{wall * 1000:>9.1f}{cpu * 1000 / args.seconds:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+本地模型解码吞吐基准：对比 eager 与 compiled（静态 KV cache + torch.compile）执行模式的 decode tokens/s
+
+用法:
+    uv run python scripts/benchmark_decode.py --model-key qwen3-4b-fp8 --prompt-len 128 --new-tokens 128
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import torch  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from src.execution_mode import CompiledExecution  # noqa: E402
+from src.model_manager import model_manager  # noqa: E402
+
+
+def measure(model_key: str, input_ids: torch.Tensor, new_tokens: int, runs: int) -> float:
+    """返回 decode 阶段 tokens/s：用 (N 个 token 耗时 - 1 个 token 耗时) 扣除 prefill"""
+
+    def timed(max_new_tokens: int) -> float:
+        kwargs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids), "max_new_tokens": max_new_tokens, "min_new_tokens": max_new_tokens, "do_sample": False}
+        start = time.perf_counter()
+        model_manager.generate(model_key, **kwargs)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter() - start
+
+    timed(new_tokens)  # 预热
+    prefill = min(timed(1) for _ in range(runs))
+    total = min(timed(new_tokens) for _ in range(runs))
+    return (new_tokens - 1) / max(total - prefill, 1e-6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode throughput benchmark (eager vs compiled)")
+    parser.add_argument("--model-key", default=model_manager.current_model_key)
+    parser.add_argument("--prompt-len", type=int, default=128)
+    parser.add_argument("--new-tokens", type=int, default=128)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-cache-len", type=int, default=1024)
+    args = parser.parse_args()
+
+    # 先以 eager 模式加载，测完后在同一个模型上启用 compiled
+    model_config = model_manager.config["models"][args.model_key]
+    execution_config = {**model_config.get("execution", {}), "mode": "eager"}
+    model_config["execution"] = execution_config
+    if not model_manager.load_model(args.model_key):
+        sys.exit(1)
+
+    model = model_manager.models[args.model_key]
+    device = next(model.parameters()).device
+    input_ids = torch.randint(100, 1000, (1, args.prompt_len), device=device)
+
+    eager_tps = measure(args.model_key, input_ids, args.new_tokens, args.runs)
+
+    execution = CompiledExecution(model, {**execution_config, "mode": "compiled", "max_cache_len": args.max_cache_len, "warmup_prompt_lengths": [args.prompt_len]})
+    execution.apply()
+    execution.warmup(model_manager.processors[args.model_key])
+    model_manager.executions[args.model_key] = execution
+    compiled_tps = measure(args.model_key, input_ids, args.new_tokens, args.runs)
+
+    logger.info(f"model={args.model_key} device={device} prompt_len={args.prompt_len} new_tokens={args.new_tokens}")
+    logger.info(f"{'mode':<10}{'decode tok/s':>14}")
+    logger.info(f"{'eager':<10}{eager_tps:>14.1f}")
+    logger.info(f"{'compiled':<10}{compiled_tps:>14.1f}")
+    logger.info(f"speedup: {compiled_tps / eager_tps:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+LoRA 适配器热切换
+多个微调版本共享同一个基础模型：model_config.json 中的适配器条目通过 base 指向基础模型、
+adapter_path 指向 LoRA 权重。基础模型只加载一份，适配器按请求挂载/切换，
+每个基础模型保留一个小的 LRU（max_adapters），超出时卸载最久未使用的适配器
+"""
+
+import importlib.util
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any
+
+from loguru import logger
+
+DEFAULT_MAX_ADAPTERS = 4
+
+
+def is_adapter_entry(model_config: dict[str, Any]) -> bool:
+    return bool(model_config.get("base")) and bool(model_config.get("adapter_path"))
+
+
+class AdapterCache:
+    """单个基础模型上已挂载的适配器（LRU），以及串行化适配器切换的锁"""
+
+    def __init__(self, model, max_adapters: int = DEFAULT_MAX_ADAPTERS):
+        self.model = model
+        self.max_adapters = max(int(max_adapters), 1)
+        self.loaded: OrderedDict[str, str] = OrderedDict()
+        # set_adapter 作用于整个模型，不同适配器的生成需要串行执行
+        self.lock = threading.RLock()
+
+    def load(self, adapter_key: str, adapter_path: str) -> bool:
+        """挂载适配器（已挂载时只更新 LRU 顺序）"""
+        with self.lock:
+            if adapter_key in self.loaded:
+                self.loaded.move_to_end(adapter_key)
+                return True
+            if importlib.util.find_spec("peft") is None:
+                logger.error("未安装 peft，无法加载 LoRA 适配器")
+                return False
+            while len(self.loaded) >= self.max_adapters:
+                self.unload(next(iter(self.loaded)))
+            try:
+                self.model.load_adapter(adapter_path, adapter_name=adapter_key)
+            except Exception as e:
+                logger.error(f"加载适配器 '{adapter_key}' ({adapter_path}) 失败: {e}")
+                return False
+            self.loaded[adapter_key] = adapter_path
+            logger.info(f"适配器 '{adapter_key}' 已挂载，当前 {len(self.loaded)}/{self.max_adapters}")
+            return True
+
+    def unload(self, adapter_key: str) -> bool:
+        with self.lock:
+            if adapter_key not in self.loaded:
+                return False
+            self.model.delete_adapter(adapter_key)
+            del self.loaded[adapter_key]
+            logger.info(f"适配器 '{adapter_key}' 已卸载")
+            return True
+
+    @contextmanager
+    def activate(self, adapter_key: str | None, adapter_path: str | None = None):
+        """在生成期间启用指定适配器；adapter_key 为 None 时使用基础模型（关闭所有适配器）"""
+        with self.lock:
+            if adapter_key is None:
+                if self.loaded:
+                    self.model.disable_adapters()
+            else:
+                if not self.load(adapter_key, adapter_path):
+                    raise RuntimeError(f"适配器 '{adapter_key}' 加载失败")
+                self.model.set_adapter(adapter_key)
+                self.model.enable_adapters()
+            yield
@@ -0,0 +1,209 @@
+"""
+OpenAI 兼容的本地模型 API
+- GET  /v1/models: 列出本地模型
+- POST /v1/chat/completions: 对话生成，支持 stream（SSE）和 image_url 多模态输入（仅 data URL，不抓取远程地址）；
+  扩展字段 priority（interactive/bulk）决定调度优先级，user 作为公平排队的会话标识
+- GET  /v1/scheduler/stats: 本地与在线调度器的队列指标
+生成通过全局 model_manager 完成，与 Gradio 界面共用已加载的模型、推理进程和各项缓存；
+既可以挂载到 Gradio 所在的服务上（config.yaml 的 api.mount），也可以单独运行：python -m src.api_server
+"""
+
+import argparse
+import base64
+import json
+import threading
+import time
+import uuid
+from contextlib import suppress
+from io import BytesIO
+from typing import Any, Literal
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from PIL import Image
+from pydantic import BaseModel, Field
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from src.model_manager import model_manager, model_reaper
+from src.scheduler import SchedulerFullError, local_scheduler, online_scheduler
+from src.utils.config import Config
+
+# data URL 解码后的图像大小上限
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+
+class ChatMessage(BaseModel):
+    role: Literal["system", "user", "assistant"]
+    content: str | list[dict[str, Any]]
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str
+    messages: list[ChatMessage]
+    max_tokens: int = Field(1024, ge=1)
+    temperature: float = Field(0.6, ge=0)
+    top_p: float = Field(0.9, gt=0, le=1)
+    top_k: int | None = None
+    repetition_penalty: float | None = None
+    stream: bool = False
+    priority: Literal["interactive", "bulk"] = "interactive"
+    user: str | None = None
+
+
+def load_image(url: str) -> Image.Image:
+    """读取 image_url：只接受 data URL
+
+    API 没有鉴权且可能监听在 0.0.0.0，服务端不代客户端抓取 http(s) 地址，避免被用来访问主机所在的内网
+    """
+    if not url.startswith("data:") or "," not in url:
+        raise HTTPException(status_code=400, detail="image_url must be a base64 data URL")
+    encoded = url.split(",", 1)[1]
+    # base64 每 4 个字符解码为 3 个字节，解码前先按长度拒绝过大的图像
+    if len(encoded) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail=f"image_url exceeds {MAX_IMAGE_BYTES} bytes")
+    try:
+        return Image.open(BytesIO(base64.b64decode(encoded))).convert("RGB")
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image_url: {e}") from e
+
+
+def to_processor_messages(messages: list[ChatMessage]) -> tuple[list[dict[str, Any]], list[Image.Image]]:
+    """把 OpenAI 格式的消息转换为聊天模板格式，图像替换为占位并单独返回"""
+    converted, images = [], []
+    for message in messages:
+        if isinstance(message.content, str):
+            converted.append({"role": message.role, "content": message.content})
+            continue
+        parts = []
+        for part in message.content:
+            if part.get("type") == "text":
+                parts.append({"type": "text", "text": part.get("text", "")})
+            elif part.get("type") == "image_url":
+                image_url = part.get("image_url")
+                url = image_url.get("url", "") if isinstance(image_url, dict) else str(image_url)
+                images.append(load_image(url))
+                parts.append({"type": "image"})
+            else:
+                raise HTTPException(status_code=400, detail=f"Unsupported content part type: {part.get('type')}")
+        converted.append({"role": message.role, "content": parts})
+    return converted, images
+
+
+def generation_kwargs(request: ChatCompletionRequest) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {"max_new_tokens": request.max_tokens}
+    if request.temperature > 0:
+        kwargs.update({"do_sample": True, "temperature": request.temperature, "top_p": request.top_p})
+    else:
+        kwargs["do_sample"] = False
+    if request.top_k is not None:
+        kwargs["top_k"] = request.top_k
+    if request.repetition_penalty is not None:
+        kwargs["repetition_penalty"] = request.repetition_penalty
+    return kwargs
+
+
+def _chunk(completion_id: str, created: int, model: str, delta: dict[str, Any], finish_reason: str | None = None) -> str:
+    payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="LLM Web UI API", description="OpenAI-compatible API for local models")
+
+    @app.get("/v1/models")
+    async def list_models():
+        models = model_manager.get_available_models()
+        return {
+            "object": "list",
+            "data": [{"id": key, "object": "model", "created": 0, "owned_by": "local", "name": cfg.get("name", key), "type": cfg.get("type", "text")} for key, cfg in models.items()],
+        }
+
+    @app.get("/v1/scheduler/stats")
+    async def scheduler_stats():
+        return {"local": local_scheduler.stats(), "online": online_scheduler.stats()}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: ChatCompletionRequest):
+        model_config = model_manager.get_available_models().get(request.model)
+        if model_config is None:
+            raise HTTPException(status_code=404, detail=f"Model '{request.model}' not found")
+
+        messages, images = await run_in_threadpool(to_processor_messages, request.messages)
+        if images and model_config.get("type") != "multimodal":
+            raise HTTPException(status_code=400, detail=f"Model '{request.model}' does not accept image input")
+        if not await run_in_threadpool(model_manager.ensure_loaded, request.model):
+            raise HTTPException(status_code=503, detail=f"Model '{request.model}' failed to load")
+
+        kwargs = generation_kwargs(request)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        cancel = threading.Event()
+        chunks = model_manager.stream_generate(request.model, messages, images or None, cancel=cancel, priority=request.priority, session_id=request.user, **kwargs)
+
+        if request.stream:
+            # 先取第一段：调度器已满或生成失败时返回 429/500，而不是 200 加错误事件
+            try:
+                first = await run_in_threadpool(next, chunks, "")
+            except SchedulerFullError as e:
+                raise HTTPException(status_code=429, detail=str(e)) from e
+            except Exception as e:
+                logger.error(f"流式生成失败: {e}")
+                raise HTTPException(status_code=500, detail=str(e)) from e
+
+            async def event_stream():
+                try:
+                    yield _chunk(completion_id, created, request.model, {"role": "assistant"})
+                    if first:
+                        yield _chunk(completion_id, created, request.model, {"content": first})
+                    async for new_text in iterate_in_threadpool(chunks):
+                        if new_text:
+                            yield _chunk(completion_id, created, request.model, {"content": new_text})
+                except Exception as e:
+                    logger.error(f"流式生成失败: {e}")
+                    yield f"data: {json.dumps({'error': {'message': str(e), 'type': 'server_error'}}, ensure_ascii=False)}\n\n"
+                    return
+                finally:
+                    # 客户端断开时让生成在下一个 token 结束并释放调度槽位
+                    cancel.set()
+                    with suppress(ValueError):
+                        # 迭代线程仍在取下一段时无法关闭，生成结束后生成器随之结束
+                        chunks.close()
+                yield _chunk(completion_id, created, request.model, {}, "stop")
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        try:
+            content = await run_in_threadpool(lambda: "".join(chunks))
+        except SchedulerFullError as e:
+            raise HTTPException(status_code=429, detail=str(e)) from e
+        except Exception as e:
+            logger.error(f"生成失败: {e}")
+            raise HTTPException(status_code=500, detail=str(e)) from e
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": request.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    api_config = Config().get_config().get("api", {}) or {}
+    parser = argparse.ArgumentParser(description="独立运行 OpenAI 兼容的本地模型 API")
+    parser.add_argument("--host", default=api_config.get("host", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=api_config.get("port", 13002))
+    args = parser.parse_args()
+    if not model_manager.start_worker() and Config().get_config().get("model_reaper", {}).get("enabled", False):
+        model_reaper.start()
+    uvicorn.run(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
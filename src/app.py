@@ -19,6 +19,18 @@ async def start():
     # 创建 Gradio 界面
     gradio_demo = demo()
 
+    from .model_manager import model_manager, model_reaper
+
+    # 进程外推理：本地模型在独立进程中运行，模型回收由推理进程负责
+    if not model_manager.start_worker() and gen_config.get("model_reaper", {}).get("enabled", False):
+        # 启动模型回收线程：空闲超时或内存压力时自动卸载本地模型
+        model_reaper.start()
+
+    # 后台任务：启动工作线程并恢复上次未完成的任务
+    from .jobs import job_manager
+
+    job_manager.start()
+
     # Launch the Gradio interface with better signal handling
     import atexit
     import signal
@@ -61,6 +73,11 @@ async def start():
         "debug": True,
     }
 
+    # 各并发组的上限之和不能超过 Gradio 的工作线程数
+    from .gradio.queue_config import concurrency_limits
+
+    launch_kwargs["max_threads"] = max(40, sum(concurrency_limits().values()) + 8)
+
     # 如果证书文件存在，启用 HTTPS
     if os.path.exists(cert_file) and os.path.exists(key_file):
         launch_kwargs["ssl_certfile"] = cert_file
@@ -70,6 +87,21 @@ async def start():
     else:
         logger.info("Running in HTTP mode (no SSL certificates found)")
 
+    api_config = gen_config.get("api", {})
+    if api_config.get("enabled", False) and api_config.get("mount", True):
+        # 在同一端口同时提供 Gradio 界面和 OpenAI 兼容 API（/v1/chat/completions、/v1/models）
+        import uvicorn
+
+        import gradio as gr
+
+        from .api_server import create_app
+
+        app = gr.mount_gradio_app(create_app(), gradio_demo, path="/")
+        logger.info(f"OpenAI-compatible API mounted at {server_host}:{server_port}/v1")
+        server = uvicorn.Server(uvicorn.Config(app, host=server_host, port=server_port, ssl_certfile=launch_kwargs.get("ssl_certfile"), ssl_keyfile=launch_kwargs.get("ssl_keyfile")))
+        await server.serve()
+        return
+
     try:
         # 直接 launch，Gradio 会自动处理队列
         gradio_demo.launch(server_port=server_port, **launch_kwargs)
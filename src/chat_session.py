@@ -0,0 +1,166 @@
+"""
+多轮对话会话管理
+为每个会话保存对话历史，本地模型额外保存上一轮的 KV cache，下一轮只需 prefill 新增的 token
+"""
+
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any
+
+from loguru import logger
+
+from src.utils.config import Config
+
+
+@dataclass
+class ChatSession:
+    """单个对话会话"""
+
+    session_id: str
+    model_key: str
+    messages: list[dict[str, Any]] = field(default_factory=list)
+    # 本地模型的 KV cache 以及它所覆盖的 token id 序列
+    past_key_values: Any = None
+    cached_token_ids: list[int] = field(default_factory=list)
+    cache_bytes: int = 0
+    last_access: float = field(default_factory=time.monotonic)
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+    def drop_cache(self):
+        """丢弃 KV cache，下一轮将完整 prefill"""
+        self.past_key_values = None
+        self.cached_token_ids = []
+        self.cache_bytes = 0
+
+
+def cache_nbytes(cache: Any) -> int:
+    """统计 KV cache 占用的字节数，兼容新旧两种 DynamicCache 结构"""
+    if cache is None:
+        return 0
+    tensors = []
+    if hasattr(cache, "layers"):
+        for layer in cache.layers:
+            tensors.extend([getattr(layer, "keys", None), getattr(layer, "values", None)])
+    else:
+        tensors.extend(getattr(cache, "key_cache", []))
+        tensors.extend(getattr(cache, "value_cache", []))
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None and hasattr(t, "numel"))
+
+
+def common_prefix_length(cached: list[int], current: list[int]) -> int:
+    """计算两个 token 序列的最长公共前缀长度"""
+    n = min(len(cached), len(current))
+    i = 0
+    while i < n and cached[i] == current[i]:
+        i += 1
+    return i
+
+
+class ChatSessionStore:
+    """会话存储：按会话保存历史和 KV cache，带单会话内存上限、总量上限和空闲释放
+
+    KV cache 在空闲超时后释放，对话历史保留到会话数达到上限时按最久未使用淘汰
+    """
+
+    def __init__(self, max_sessions: int = 64, max_cache_mb_per_session: int = 1024, max_total_cache_mb: int = 4096, idle_ttl_seconds: int = 1800):
+        self.max_sessions = max_sessions
+        self.max_cache_bytes = max_cache_mb_per_session * 1024 * 1024
+        self.max_total_cache_bytes = max_total_cache_mb * 1024 * 1024
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._sessions: dict[str, ChatSession] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "ChatSessionStore":
+        """从全局配置的 chat 段创建"""
+        chat_config = Config().get_config().get("chat", {}) or {}
+        return cls(
+            max_sessions=chat_config.get("max_sessions", 64),
+            max_cache_mb_per_session=chat_config.get("max_cache_mb_per_session", 1024),
+            max_total_cache_mb=chat_config.get("max_total_cache_mb", 4096),
+            idle_ttl_seconds=chat_config.get("idle_ttl_seconds", 1800),
+        )
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def get_or_create(self, session_id: str, model_key: str) -> ChatSession:
+        """获取会话；切换模型后旧历史的 KV cache 不再可用，重新开始"""
+        self.evict_idle()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.model_key != model_key:
+                if session is None and len(self._sessions) >= self.max_sessions:
+                    oldest = min(self._sessions.values(), key=lambda s: s.last_access)
+                    logger.info(f"会话数达到上限，淘汰最久未使用的会话: {oldest.session_id}")
+                    del self._sessions[oldest.session_id]
+                history = session.messages if session is not None else []
+                session = ChatSession(session_id=session_id, model_key=model_key, messages=history)
+                self._sessions[session_id] = session
+            session.touch()
+            return session
+
+    def get(self, session_id: str) -> ChatSession | None:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def reset(self, session_id: str):
+        """清空会话历史和 KV cache"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def update_cache(self, session: ChatSession, past_key_values: Any, token_ids: list[int]):
+        """保存本轮生成后的 KV cache；超出单会话上限时直接丢弃"""
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_cache_bytes:
+            logger.info(f"会话 {session.session_id} 的 KV cache ({nbytes / 1024 / 1024:.1f} MB) 超过上限，丢弃缓存")
+            session.drop_cache()
+            return
+        session.past_key_values = past_key_values
+        session.cached_token_ids = token_ids
+        session.cache_bytes = nbytes
+        self._enforce_total_limit(keep=session.session_id)
+
+    def _enforce_total_limit(self, keep: str):
+        """总缓存超限时，按最久未使用顺序丢弃其它会话的 KV cache（保留历史）"""
+        with self._lock:
+            total = sum(s.cache_bytes for s in self._sessions.values())
+            if total <= self.max_total_cache_bytes:
+                return
+            for session in sorted(self._sessions.values(), key=lambda s: s.last_access):
+                if session.session_id == keep or session.past_key_values is None:
+                    continue
+                total -= session.cache_bytes
+                session.drop_cache()
+                if total <= self.max_total_cache_bytes:
+                    break
+
+    def drop_model_caches(self, model_key: str):
+        """模型被卸载时释放该模型所有会话的 KV cache，保留对话历史"""
+        with self._lock:
+            for session in self._sessions.values():
+                if session.model_key == model_key:
+                    session.drop_cache()
+
+    def evict_idle(self):
+        """释放空闲超时会话的 KV cache；保留对话历史，下一轮完整 prefill"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if s.past_key_values is not None and now - s.last_access > self.idle_ttl_seconds]
+            for session in expired:
+                session.drop_cache()
+        if expired:
+            logger.info(f"释放 {len(expired)} 个空闲会话的 KV cache")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "cache_bytes": sum(s.cache_bytes for s in self._sessions.values())}
+
+
+# 全局会话存储实例
+chat_session_store = ChatSessionStore.from_config()
@@ -0,0 +1,145 @@
+"""
+CPU 推理配置
+在无 GPU 的节点上为本地模型提供：bf16 自动选择、加载时 int8 量化、线程数设置和按模型绑核
+"""
+
+import importlib.util
+import os
+from contextlib import contextmanager
+from typing import Any
+
+import torch
+from loguru import logger
+
+QUANTIZATION_MODES = ("dynamic_int8", "int8_weight_only")
+
+
+def cpu_supports_bf16() -> bool:
+    """CPU 是否有原生 bf16 指令（x86 AVX512-BF16/AMX，ARM BF16）"""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            cpuinfo = f.read()
+    except OSError:
+        return False
+    flags = set()
+    for line in cpuinfo.splitlines():
+        if line.startswith(("flags", "Features")):
+            flags.update(line.split(":", 1)[1].split())
+    return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+
+
+def parse_cores(cores: str | list[int] | None) -> set[int] | None:
+    """解析核心列表，支持 [0, 1, 2] 或 "0-3,8-11" """
+    if cores is None:
+        return None
+    if isinstance(cores, list):
+        return {int(c) for c in cores}
+    result = set()
+    for item in str(cores).split(","):
+        part = item.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            result.update(range(int(start), int(end) + 1))
+        else:
+            result.add(int(part))
+    return result
+
+
+class CpuProfile:
+    """单个模型的 CPU 执行配置"""
+
+    _interop_configured = False
+
+    def __init__(self, profile_config: dict[str, Any]):
+        self.config = profile_config
+        self.model_id = profile_config.get("model_id")
+        self.quantization = profile_config.get("quantization")
+        if self.quantization and self.quantization not in QUANTIZATION_MODES:
+            logger.warning(f"未知的 CPU 量化方式 '{self.quantization}'，已忽略")
+            self.quantization = None
+        if self.quantization == "int8_weight_only" and importlib.util.find_spec("torchao") is None:
+            logger.warning("未安装 torchao，int8_weight_only 回退为 dynamic_int8")
+            self.quantization = "dynamic_int8"
+        self.cores = parse_cores(profile_config.get("cores"))
+        self.num_threads = profile_config.get("num_threads") or (len(self.cores) if self.cores else None)
+
+    @classmethod
+    def resolve(cls, model_config: dict[str, Any], device_map: Any) -> "CpuProfile | None":
+        """模型配置了 cpu_profile 且本次在 CPU 上运行时返回配置，否则返回 None"""
+        profile_config = model_config.get("cpu_profile")
+        if not profile_config:
+            return None
+        on_cpu = device_map == "cpu" or not torch.cuda.is_available()
+        if profile_config.get("enabled", "auto") == "auto" and not on_cpu:
+            return None
+        if profile_config.get("enabled") is False:
+            return None
+        return cls(profile_config)
+
+    def dtype(self) -> torch.dtype:
+        """dynamic_int8 需要 float32 权重；其余情况 auto 时按 CPU 能力选择 bf16"""
+        dtype = self.config.get("dtype", "auto")
+        if self.quantization == "dynamic_int8":
+            return torch.float32
+        if dtype == "auto":
+            return torch.bfloat16 if cpu_supports_bf16() else torch.float32
+        return getattr(torch, dtype)
+
+    def load_kwargs(self) -> dict[str, Any]:
+        """from_pretrained 的 CPU 相关参数"""
+        kwargs: dict[str, Any] = {"device_map": "cpu", "dtype": self.dtype()}
+        if self.quantization == "int8_weight_only":
+            from transformers import TorchAoConfig
+
+            kwargs["quantization_config"] = TorchAoConfig("int8_weight_only")
+        return kwargs
+
+    def apply_global_threads(self):
+        """设置 inter-op 线程数（进程内只能设置一次）"""
+        interop = self.config.get("num_interop_threads")
+        if interop and not CpuProfile._interop_configured:
+            try:
+                torch.set_num_interop_threads(int(interop))
+                CpuProfile._interop_configured = True
+            except RuntimeError as e:
+                logger.warning(f"无法设置 inter-op 线程数: {e}")
+
+    def quantize(self, model):
+        """加载后对 Linear 层做动态 int8 量化；原地替换，避免复制整个 fp32 模型使峰值内存翻倍"""
+        if self.quantization != "dynamic_int8":
+            return model
+        logger.info("对模型 Linear 层执行动态 int8 量化")
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    @contextmanager
+    def pinned(self):
+        """在当前（生成）线程上绑定核心并设置 intra-op 线程数，结束后恢复
+
+        绑核只作用于当前线程，但 torch.set_num_threads 是进程级设置：两个 CPU 模型同时生成时
+        以最后设置的线程数为准，结束时的恢复也会覆盖另一个模型的设置，此时只有绑核按模型生效
+        """
+        previous_threads = torch.get_num_threads()
+        previous_affinity = None
+        if self.cores and hasattr(os, "sched_setaffinity"):
+            previous_affinity = os.sched_getaffinity(0)
+            try:
+                # Linux 上 pid=0 只作用于调用线程，OpenMP 工作线程会继承该亲和性
+                os.sched_setaffinity(0, self.cores)
+            except OSError as e:
+                logger.warning(f"绑核失败 {sorted(self.cores)}: {e}")
+                previous_affinity = None
+        if self.num_threads:
+            torch.set_num_threads(int(self.num_threads))
+        try:
+            yield
+        finally:
+            torch.set_num_threads(previous_threads)
+            if previous_affinity is not None:
+                os.sched_setaffinity(0, previous_affinity)
+
+    def describe(self) -> str:
+        cores = f"{min(self.cores)}-{max(self.cores)}" if self.cores else "all"
+        return f"dtype={self.dtype()}, quantization={self.quantization or 'none'}, threads={self.num_threads or torch.get_num_threads()}, cores={cores}"
@@ -0,0 +1,84 @@
+"""
+设备放置与卸载预算
+- 按模型配置 placement.max_memory 为每个设备（GPU 序号、cpu）设置显存/内存预算，超出部分由 accelerate 卸载到 CPU 或磁盘（offload_folder）
+- 未指定某块 GPU 的预算时，可用 reserve_mb 为 KV cache 和批处理预留显存，其余空闲显存作为该 GPU 的预算
+- 输入张量放到模型第一层（输入 embedding）实际所在的设备
+- 加载后报告各设备剩余可用于 KV cache 和批处理的内存
+"""
+
+from typing import Any
+
+import torch
+from loguru import logger
+
+from src.kv_cache_policy import available_memory
+
+# 只有由 accelerate 自动切分的 device_map 才会使用 max_memory
+AUTO_DEVICE_MAPS = ("auto", "balanced", "balanced_low_0", "sequential")
+MB = 1024 * 1024
+
+
+def normalize_max_memory(max_memory: dict[str, Any]) -> dict[int | str, int | str]:
+    """JSON 中的 GPU 序号是字符串，accelerate 需要整数键"""
+    return {int(key) if str(key).isdigit() else key: value for key, value in max_memory.items()}
+
+
+def placement_kwargs(placement_config: dict[str, Any], device_map: Any) -> dict[str, Any]:
+    """根据 placement 配置生成 from_pretrained 的 max_memory / offload 参数"""
+    if not placement_config:
+        return {}
+    if not (isinstance(device_map, str) and device_map in AUTO_DEVICE_MAPS):
+        logger.warning(f"device_map={device_map} 不是自动切分模式，忽略 placement 配置")
+        return {}
+
+    kwargs: dict[str, Any] = {}
+    max_memory = normalize_max_memory(placement_config.get("max_memory") or {})
+    reserve_mb = placement_config.get("reserve_mb")
+    if reserve_mb is not None and torch.cuda.is_available():
+        for index in range(torch.cuda.device_count()):
+            if index not in max_memory:
+                budget = available_memory(torch.device("cuda", index)) - int(reserve_mb) * MB
+                max_memory[index] = max(budget, 0)
+    if max_memory:
+        kwargs["max_memory"] = max_memory
+
+    offload_folder = placement_config.get("offload_folder")
+    if offload_folder:
+        kwargs["offload_folder"] = offload_folder
+        kwargs["offload_buffers"] = bool(placement_config.get("offload_buffers", False))
+    return kwargs
+
+
+def input_device(model) -> torch.device:
+    """模型输入 embedding 所在的执行设备；按 hf_device_map 切分时以第一层为准"""
+    device_map = getattr(model, "hf_device_map", None)
+    if device_map:
+        embeddings = model.get_input_embeddings()
+        name = next((n for n, module in model.named_modules() if module is embeddings), "")
+        matches = [key for key in device_map if key in ("", name) or name.startswith(f"{key}.")]
+        device = device_map[max(matches, key=len)] if matches else next(iter(device_map.values()))
+        if device in ("cpu", "disk"):
+            # 卸载到 CPU/磁盘的层由 accelerate hook 在执行时搬运，输入留在 CPU
+            return torch.device("cpu")
+        return torch.device("cuda", device) if isinstance(device, int) else torch.device(device)
+    return next(model.parameters()).device
+
+
+def memory_headroom(model) -> dict[str, int]:
+    """模型所在各设备当前剩余可用于 KV cache 和批处理的内存（字节）"""
+    device_map = getattr(model, "hf_device_map", None)
+    if device_map:
+        devices = {torch.device("cuda", d) if isinstance(d, int) else torch.device("cpu" if d == "disk" else d) for d in device_map.values()}
+    else:
+        devices = {next(model.parameters()).device}
+    return {str(device): available_memory(device) for device in sorted(devices, key=str)}
+
+
+def describe_placement(model) -> str:
+    device_map = getattr(model, "hf_device_map", None) or {}
+    counts: dict[str, int] = {}
+    for device in device_map.values():
+        counts[str(device)] = counts.get(str(device), 0) + 1
+    layout = ", ".join(f"{device}: {count} 个模块" for device, count in counts.items()) or str(next(model.parameters()).device)
+    headroom = ", ".join(f"{device} {free / MB:.0f} MB" for device, free in memory_headroom(model).items())
+    return f"放置 [{layout}]，剩余可用于 KV cache/批处理: {headroom}"
@@ -0,0 +1,107 @@
+"""
+本地模型执行模式
+eager: 默认的 PyTorch eager + 动态 KV cache
+compiled: 预分配的静态 KV cache + torch.compile 编译 forward，编译产物持久化到本地目录，重启后可直接复用
+"""
+
+import os
+import queue
+import time
+from contextlib import contextmanager
+from typing import Any
+
+import torch
+from loguru import logger
+from transformers import StaticCache
+
+from src.device_placement import input_device
+
+DEFAULT_COMPILE_CACHE_DIR = "./cache/torch_compile"
+DEFAULT_MAX_CACHE_LEN = 4096
+DEFAULT_WARMUP_PROMPT_LENGTHS = [32, 128, 512]
+
+
+def configure_compile_cache(cache_dir: str = DEFAULT_COMPILE_CACHE_DIR):
+    """启用 inductor 的 FX graph 持久化缓存，需在第一次编译前调用"""
+    cache_dir = os.path.abspath(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    try:
+        import torch._inductor.config as inductor_config
+
+        inductor_config.fx_graph_cache = True
+    except Exception as e:
+        logger.warning(f"无法启用 inductor 编译缓存: {e}")
+    logger.info(f"torch.compile 缓存目录: {os.environ['TORCHINDUCTOR_CACHE_DIR']}")
+
+
+class CompiledExecution:
+    """compiled 执行模式：管理编译后的 forward 和一组可复用的静态 KV cache"""
+
+    def __init__(self, model, execution_config: dict[str, Any]):
+        self.model = model
+        self.config = execution_config
+        self.max_cache_len = int(execution_config.get("max_cache_len", DEFAULT_MAX_CACHE_LEN))
+        self.cache_slots = int(execution_config.get("static_cache_slots", 1))
+        self._caches: queue.SimpleQueue = queue.SimpleQueue()
+
+    def apply(self):
+        """编译模型 forward；CUDA 上使用 reduce-overhead（CUDA graphs），CPU 上使用默认模式"""
+        configure_compile_cache(self.config.get("compile_cache_dir", DEFAULT_COMPILE_CACHE_DIR))
+        device_type = next(self.model.parameters()).device.type
+        mode = self.config.get("compile_mode") or ("reduce-overhead" if device_type == "cuda" else "default")
+        self.model.forward = torch.compile(self.model.forward, mode=mode, fullgraph=self.config.get("fullgraph", False))
+        # 已手动编译，关闭 generate() 内部的自动编译，避免重复编译
+        self.model.generation_config.disable_compile = True
+        for _ in range(self.cache_slots):
+            self._caches.put(self._new_cache())
+        logger.info(f"已启用 compiled 执行模式: compile_mode={mode}, max_cache_len={self.max_cache_len}, device={device_type}")
+
+    def _new_cache(self) -> StaticCache:
+        return StaticCache(config=self.model.config, max_cache_len=self.max_cache_len)
+
+    @contextmanager
+    def static_cache(self, generation_kwargs: dict[str, Any]):
+        """为一次 generate 调用取出一个静态 KV cache，用完归还；超出容量时回退到动态 cache"""
+        prompt_len = generation_kwargs["input_ids"].shape[-1] if "input_ids" in generation_kwargs else 0
+        if prompt_len >= self.max_cache_len:
+            logger.warning(f"输入长度 {prompt_len} 超出静态 cache 容量 {self.max_cache_len}，本次使用动态 cache")
+            yield generation_kwargs
+            return
+
+        max_new_tokens = generation_kwargs.get("max_new_tokens", 0)
+        if prompt_len + max_new_tokens > self.max_cache_len:
+            generation_kwargs["max_new_tokens"] = self.max_cache_len - prompt_len
+            logger.debug(f"max_new_tokens 截断为 {generation_kwargs['max_new_tokens']} 以适配静态 cache")
+
+        try:
+            cache = self._caches.get_nowait()
+            pooled = True
+        except queue.Empty:
+            cache = self._new_cache()
+            pooled = False
+        try:
+            yield {**generation_kwargs, "past_key_values": cache}
+        finally:
+            if pooled:
+                cache.reset()
+                self._caches.put(cache)
+
+    def warmup(self, processor):
+        """用常见输入长度各跑一次短生成，触发编译（或从持久化缓存加载）"""
+        lengths = self.config.get("warmup_prompt_lengths", DEFAULT_WARMUP_PROMPT_LENGTHS)
+        if not lengths:
+            return
+        tokenizer = getattr(processor, "tokenizer", processor)
+        token_id = tokenizer.eos_token_id if tokenizer.eos_token_id is not None else 0
+        device = input_device(self.model)
+        for length in lengths:
+            if length >= self.max_cache_len:
+                continue
+            input_ids = torch.full((1, length), token_id, dtype=torch.long, device=device)
+            generation_kwargs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids), "max_new_tokens": 4, "do_sample": False}
+            start = time.perf_counter()
+            with self.static_cache(generation_kwargs) as kwargs:
+                self.model.generate(**kwargs)
+            logger.info(f"预热完成: prompt_len={length}, 耗时 {time.perf_counter() - start:.1f}s")
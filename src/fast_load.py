@@ -0,0 +1,149 @@
+"""
+模型快速加载
+- safetensors 权重通过 mmap 加载，并在加载 tokenizer 的同时用 posix_fadvise 预读到 page cache
+- 优先使用 fast (Rust) tokenizer，失败时回退到慢速版本
+- processor / tokenizer 首次加载后保存快照到本地磁盘，后续直接从本地目录加载；快照按源文件版本
+  （HF 缓存中的提交、配置文件的大小和修改时间）和 use_fast 区分，上游模型更新后自动失效
+- 记录各阶段耗时（config、tokenizer、weights、device placement）
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+
+from loguru import logger
+from transformers import AutoProcessor
+
+DEFAULT_SNAPSHOT_DIR = "./cache/processors"
+# 决定 processor 内容的源文件（tokenizer / processor 配置、词表、自定义代码）
+PROCESSOR_FILE_SUFFIXES = (".json", ".model", ".txt", ".tiktoken", ".py", ".jinja")
+
+
+class LoadTimer:
+    """记录模型加载各阶段耗时"""
+
+    def __init__(self, model_key: str):
+        self.model_key = model_key
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def report(self) -> str:
+        parts = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases.items())
+        return f"模型 '{self.model_key}' 加载耗时 {self.total:.2f}s ({parts})"
+
+
+def resolve_local_dir(model_id: str) -> str | None:
+    """返回模型在本地的目录（本地路径或 HF 缓存中的快照），未下载时返回 None"""
+    if os.path.isdir(model_id):
+        return model_id
+    try:
+        from huggingface_hub import snapshot_download
+
+        return snapshot_download(model_id, local_files_only=True)
+    except Exception:
+        return None
+
+
+def _readahead(paths: list[str]):
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except (OSError, AttributeError) as e:
+            logger.debug(f"预读失败 {path}: {e}")
+            return
+
+
+def prefetch_weights(model_id: str) -> threading.Thread | None:
+    """后台预读 safetensors 权重文件到 page cache，返回预读线程"""
+    local_dir = resolve_local_dir(model_id)
+    if local_dir is None:
+        return None
+    paths = [os.path.join(local_dir, name) for name in sorted(os.listdir(local_dir)) if name.endswith(".safetensors")]
+    if not paths:
+        return None
+    thread = threading.Thread(target=_readahead, args=(paths,), daemon=True, name=f"prefetch-{os.path.basename(local_dir)}")
+    thread.start()
+    return thread
+
+
+def has_safetensors(model_id: str) -> bool:
+    local_dir = resolve_local_dir(model_id)
+    return local_dir is not None and any(name.endswith(".safetensors") for name in os.listdir(local_dir))
+
+
+def _source_fingerprint(model_id: str, use_fast: bool) -> str | None:
+    """源 processor 文件的版本：本地目录（HF 缓存中包含提交哈希）、各配置文件的大小和修改时间，以及 use_fast；未下载时返回 None"""
+    local_dir = resolve_local_dir(model_id)
+    if local_dir is None:
+        return None
+    parts = [os.path.realpath(local_dir), f"use_fast={use_fast}"]
+    for name in sorted(os.listdir(local_dir)):
+        if name.endswith(PROCESSOR_FILE_SUFFIXES):
+            stat = os.stat(os.path.join(local_dir, name))
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+
+def _snapshot_path(model_id: str, snapshot_dir: str, use_fast: bool, fingerprint: str) -> str:
+    # fast / slow 快照分目录存放，清理旧版本时互不影响
+    name = re.sub(r"[^A-Za-z0-9_.-]", "--", model_id)
+    return os.path.join(snapshot_dir, name, "fast" if use_fast else "slow", fingerprint)
+
+
+def load_processor(model_id: str, use_fast: bool = True, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> Any:
+    """加载 processor：优先读取与源文件版本一致的本地快照；否则加载（fast 优先，失败回退）并保存快照"""
+    fingerprint = _source_fingerprint(model_id, use_fast)
+    snapshot_path = fingerprint and _snapshot_path(model_id, snapshot_dir, use_fast, fingerprint)
+    if snapshot_path and os.path.isdir(snapshot_path):
+        try:
+            return AutoProcessor.from_pretrained(snapshot_path, trust_remote_code=True, use_fast=use_fast)
+        except Exception as e:
+            logger.warning(f"processor 快照加载失败，重新加载: {e}")
+
+    processor = None
+    if use_fast:
+        try:
+            processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True, use_fast=True)
+        except Exception as e:
+            logger.warning(f"fast tokenizer 加载失败，回退到慢速版本: {e}")
+    if processor is None:
+        processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True, use_fast=False)
+
+    # 首次加载时模型可能刚下载，加载后重新计算源文件版本
+    fingerprint = fingerprint or _source_fingerprint(model_id, use_fast)
+    if fingerprint is None:
+        return processor
+    snapshot_path = _snapshot_path(model_id, snapshot_dir, use_fast, fingerprint)
+    try:
+        # 同一模型旧版本的快照已失效
+        versions_dir = os.path.dirname(snapshot_path)
+        if os.path.isdir(versions_dir):
+            for name in os.listdir(versions_dir):
+                if name != fingerprint:
+                    shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+        os.makedirs(snapshot_path, exist_ok=True)
+        processor.save_pretrained(snapshot_path)
+        logger.info(f"processor 快照已保存: {snapshot_path}")
+    except Exception as e:
+        logger.warning(f"保存 processor 快照失败: {e}")
+    return processor
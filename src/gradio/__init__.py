@@ -7,11 +7,7 @@ import os
 import torch
 from loguru import logger
 
-# 设备配置
-device = torch.device("cuda:6" if torch.cuda.is_available() else "cpu")
-
-
-# 设备信息日志
+# 设备信息日志（模型的实际放置见 model_config.json 的 device_map / placement）
 logger.info(f"CUDA_VISIBLE_DEVICES={os.environ.get('CUDA_VISIBLE_DEVICES')}")
 logger.info(f"torch.__version__={torch.__version__}")
 logger.info(f"torch.version.cuda={torch.version.cuda}")
@@ -20,7 +16,6 @@ logger.info(f"cuda device count={torch.cuda.device_count()}")
 if torch.cuda.is_available():
     logger.info(f"current device={torch.cuda.current_device()}")
     logger.info(f"device name={torch.cuda.get_device_name(torch.cuda.current_device())}")
-logger.info(f"Using device={device}")
 
 
 def create_interface():
@@ -0,0 +1,235 @@
+"""
+后台任务的任务类型和界面函数
+- pdf: 每页一个单元，本地多模态模型逐页分析
+- video: 单个单元，本地多模态模型分析视频抽帧
+- tts: 长文本按段落切分，每段合成一个音频文件
+- embeddings: 每批文本一个单元
+任务以 bulk 优先级排队，会话标识为 job:<任务ID>；任务使用提交时会话选择的模型和在线服务地址
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+from typing import Any
+
+from loguru import logger
+
+import gradio as gr
+
+from ..jobs import TERMINAL_STATUSES, JobHandler, job_manager
+from ..model_manager import model_manager
+from .multimodal_generation import count_pdf_pages, downsample_video, render_pdf_page
+from .online_client import client_for, get_online_model_id, is_online_model
+from .session import session_model_key, session_state
+from .speech import synthesize_speech
+
+TTS_SEGMENT_CHARS = 500
+EMBEDDINGS_BATCH_SIZE = 64
+
+
+def _ensure_model(model_key: str):
+    if not model_manager.ensure_loaded(model_key):
+        raise RuntimeError(f"模型 '{model_key}' 加载失败")
+
+
+def split_text_segments(text: str, max_chars: int = TTS_SEGMENT_CHARS) -> list[str]:
+    """按段落切分长文本，过长的段落按句末标点再切分"""
+    segments = []
+    for paragraph in (p.strip() for p in text.splitlines()):
+        if not paragraph:
+            continue
+        current = ""
+        for char in paragraph:
+            current += char
+            if len(current) >= max_chars and char in "。！？.!?；;，, ":
+                segments.append(current.strip())
+                current = ""
+        if current.strip():
+            segments.append(current.strip())
+    return segments
+
+
+class PdfJob(JobHandler):
+    def count_units(self, job: dict[str, Any]) -> int:
+        return count_pdf_pages(job["params"]["pdf_path"])
+
+    def run_unit(self, job: dict[str, Any], index: int):
+        params = job["params"]
+        _ensure_model(params["model_key"])
+        image = render_pdf_page(params["pdf_path"], index)
+        messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": params["text"]}]}]
+        yield from model_manager.stream_generate(params["model_key"], messages, [image], priority="bulk", session_id=f"job:{job['id']}", **params["generation"])
+
+    def render(self, job: dict[str, Any], outputs: dict[int, str]) -> str:
+        total = job["total_units"] or len(outputs)
+        return "".join(f"--- Page {index + 1}/{total} ---\n{outputs[index]}\n\n" for index in sorted(outputs))
+
+
+class VideoJob(JobHandler):
+    def count_units(self, job: dict[str, Any]) -> int:
+        return 1
+
+    def run_unit(self, job: dict[str, Any], index: int):
+        params = job["params"]
+        _ensure_model(params["model_key"])
+        frames = downsample_video(params["video_path"])
+        if not frames:
+            raise RuntimeError("无法读取视频帧")
+        messages = [{"role": "user", "content": [*({"type": "image"} for _ in frames), {"type": "text", "text": params["text"]}]}]
+        for new_text in model_manager.stream_generate(params["model_key"], messages, frames, priority="bulk", session_id=f"job:{job['id']}", **params["generation"]):
+            yield new_text.replace("<|im_end|>", "")
+
+
+class TtsJob(JobHandler):
+    def count_units(self, job: dict[str, Any]) -> int:
+        return len(job["params"]["segments"])
+
+    def run_unit(self, job: dict[str, Any], index: int):
+        params = job["params"]
+        client = client_for(params.get("server_url"), params.get("api_key", ""))
+        with client.scheduler.slot("bulk", f"job:{job['id']}"):
+            result = synthesize_speech(params["segments"][index], params["model"], params["voice"], params["speed"], client)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error", "语音合成失败"))
+        target = job_manager.store.job_dir(job["id"]) / f"segment-{index + 1:04d}{os.path.splitext(result['audio_path'])[1]}"
+        shutil.move(result["audio_path"], target)
+        yield str(target)
+
+    def render(self, job: dict[str, Any], outputs: dict[int, str]) -> str:
+        return "\n".join(f"{index + 1}. {os.path.basename(outputs[index])}" for index in sorted(outputs))
+
+
+class EmbeddingsJob(JobHandler):
+    def count_units(self, job: dict[str, Any]) -> int:
+        return math.ceil(len(job["params"]["texts"]) / EMBEDDINGS_BATCH_SIZE)
+
+    def run_unit(self, job: dict[str, Any], index: int):
+        params = job["params"]
+        client = client_for(params.get("server_url"), params.get("api_key", ""))
+        start = index * EMBEDDINGS_BATCH_SIZE
+        payload = {"model": params["model"], "input": params["texts"][start : start + EMBEDDINGS_BATCH_SIZE]}
+        if params.get("task") and params["task"] != "text-matching":
+            payload["task"] = params["task"]
+        if params.get("encoding_format") and params["encoding_format"] != "float":
+            payload["encoding_format"] = params["encoding_format"]
+        with client.scheduler.slot("bulk", f"job:{job['id']}"):
+            response = client.session.post(f"{client.base_url}/embeddings", json=payload, timeout=60)
+        if response.status_code != 200:
+            raise RuntimeError(f"API 错误: {response.status_code} - {response.text}")
+        data = response.json().get("data", [])
+        for item in data:
+            item["index"] = start + item.get("index", 0)
+        yield json.dumps(data, ensure_ascii=False)
+
+    def render(self, job: dict[str, Any], outputs: dict[int, str]) -> str:
+        data = [item for index in sorted(outputs) for item in json.loads(outputs[index])]
+        return json.dumps({"model": job["params"]["model"], "data": data}, indent=2, ensure_ascii=False)
+
+
+# 界面上生成参数控件的顺序，提交 PDF / 视频任务时这些控件的取值按此顺序传入
+GENERATION_SETTINGS = ("max_new_tokens", "temperature", "top_p", "top_k", "repetition_penalty", "kv_cache_mode")
+
+
+def _generation(settings: tuple) -> dict[str, Any]:
+    return {**dict(zip(GENERATION_SETTINGS, settings, strict=True)), "do_sample": True}
+
+
+def _local_multimodal_model(request: gr.Request | None) -> str:
+    """后台 PDF / 视频任务使用会话选择的本地多模态模型"""
+    model_key = session_model_key(request)
+    if is_online_model(model_key) or model_manager.get_available_models().get(model_key, {}).get("type") != "multimodal":
+        raise gr.Error("后台任务需要先选择本地多模态模型")
+    return model_key
+
+
+def _upstream(request: gr.Request | None) -> tuple[dict[str, Any], dict[str, Any]]:
+    """会话连接的在线服务，执行时不依赖会话仍然存在；返回 (随任务保存的参数, 只保存在内存中的 API key)"""
+    state = session_state(request)
+    return {"server_url": state.server_url}, {"api_key": state.api_key}
+
+
+def _submitted(job_id: str) -> tuple[str, str]:
+    return job_id, f"**已提交后台任务** `{job_id}`，关闭页面后任务继续执行，可在 Jobs 页用任务 ID 查看进度"
+
+
+def submit_pdf_job(text: str, pdf_path: str | None, request: gr.Request = None, *settings: Any) -> tuple[str, str]:
+    """settings 为 GENERATION_SETTINGS 顺序的生成参数；Gradio 按位置传参，request 按其位置注入"""
+    if not pdf_path:
+        raise gr.Error("请先上传PDF")
+    params = {"text": text, "model_key": _local_multimodal_model(request), "generation": {**_generation(settings), "speculative": "prompt_lookup"}}
+    return _submitted(job_manager.submit("pdf", params, files={"pdf_path": pdf_path}))
+
+
+def submit_video_job(text: str, video_path: str | None, request: gr.Request = None, *settings: Any) -> tuple[str, str]:
+    """settings 同 submit_pdf_job"""
+    if not video_path:
+        raise gr.Error("请先上传视频")
+    params = {"text": text, "model_key": _local_multimodal_model(request), "generation": _generation(settings)}
+    return _submitted(job_manager.submit("video", params, files={"video_path": video_path}))
+
+
+def submit_tts_job(text: str, voice: str = "", speed: float = 1.0, request: gr.Request = None) -> tuple[str, str]:
+    model_key = session_model_key(request)
+    if not is_online_model(model_key):
+        raise gr.Error("文字转语音功能仅支持在线模型，请先连接到在线服务器并选择模型")
+    segments = split_text_segments(text or "")
+    if not segments:
+        raise gr.Error("请输入要转换的文本")
+    upstream, secrets = _upstream(request)
+    return _submitted(job_manager.submit("tts", {"segments": segments, "model": get_online_model_id(model_key), "voice": voice, "speed": speed, **upstream}, secrets=secrets))
+
+
+def submit_embeddings_job(text_input: str, model: str = "jina-embeddings-v3", task: str = "text-matching", encoding_format: str = "float", request: gr.Request = None) -> tuple[str, str]:
+    texts = [line.strip() for line in (text_input or "").splitlines() if line.strip()]
+    if not texts:
+        raise gr.Error("请输入文本")
+    upstream, secrets = _upstream(request)
+    return _submitted(job_manager.submit("embeddings", {"texts": texts, "model": model, "task": task, "encoding_format": encoding_format, **upstream}, secrets=secrets))
+
+
+def format_job_status(job: dict[str, Any]) -> str:
+    total = job["total_units"] if job["total_units"] is not None else "?"
+    lines = [f"## 任务 `{job['id']}`", f"- 类型: {job['kind']}", f"- 状态: **{job['status']}**", f"- 进度: {job['completed_units']}/{total}"]
+    if job.get("error"):
+        lines.append(f"- 错误: {job['error']}")
+    return "\n".join(lines)
+
+
+def follow_job(job_id: str):
+    """持续显示任务进度和部分结果，直到任务结束；页面断开不影响任务本身"""
+    job_id = (job_id or "").strip()
+    if not job_id:
+        yield "", "**Error:** 请输入任务 ID", []
+        return
+    found = False
+    for job in job_manager.follow(job_id):
+        found = True
+        text = job["result"] + job["partial"]
+        files = job_manager.files(job_id) if job["status"] in TERMINAL_STATUSES else []
+        yield text, format_job_status(job) + ("\n\n" + text if text else ""), files
+    if not found:
+        yield "", f"**Error:** 任务 `{job_id}` 不存在", []
+
+
+def cancel_job(job_id: str) -> str:
+    ok = job_manager.cancel((job_id or "").strip())
+    return "已请求取消任务" if ok else "任务不存在或已结束"
+
+
+def retry_job(job_id: str) -> str:
+    ok = job_manager.retry((job_id or "").strip())
+    logger.info(f"重试后台任务 {job_id}: {ok}")
+    return "已重新排队，已完成的单元不会重复执行" if ok else "只能重试失败或已取消的任务"
+
+
+def list_jobs() -> list[list[Any]]:
+    return [[job["id"], job["kind"], job["status"], f"{job['completed_units']}/{job['total_units'] if job['total_units'] is not None else '?'}", job.get("error") or ""] for job in job_manager.store.list_jobs()]
+
+
+job_manager.register("pdf", PdfJob())
+job_manager.register("video", VideoJob())
+job_manager.register("tts", TtsJob())
+job_manager.register("embeddings", EmbeddingsJob())
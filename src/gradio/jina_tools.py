@@ -3,19 +3,18 @@ Jina AI 工具模块
 提供 Embeddings 和 Rerank 功能
 """
 
+from __future__ import annotations
+
 import json
 
 from loguru import logger
 
-from .online_client import online_client
+import gradio as gr
+
+from .session import session_client
 
 
-def generate_embeddings(
-    text_input: str,
-    model: str = "jina-embeddings-v3",
-    task: str = "text-matching",
-    encoding_format: str = "float"
-) -> tuple[str, str]:
+def generate_embeddings(text_input: str, model: str = "jina-embeddings-v3", task: str = "text-matching", encoding_format: str = "float", request: gr.Request = None) -> tuple[str, str]:
     """
     生成文本的 embeddings
 
@@ -28,6 +27,7 @@ def generate_embeddings(
     Returns:
         (raw_output, markdown_output)
     """
+    client = session_client(request)
     try:
         if not text_input or not text_input.strip():
             error_msg = "请输入文本"
@@ -43,17 +43,19 @@ def generate_embeddings(
         logger.info(f"生成 embeddings，模型: {model}, 文本数量: {len(texts)}, 任务: {task}, 编码: {encoding_format}")
 
         # 调用 embeddings API
-        url = f"{online_client.base_url}/embeddings"
+        url = f"{client.base_url}/embeddings"
         payload = {"model": model, "input": texts}
-        
+
         # 添加可选参数
         if task and task != "text-matching":
             payload["task"] = task
-        
+
         if encoding_format and encoding_format != "float":
             payload["encoding_format"] = encoding_format
 
-        response = online_client.session.post(url, json=payload, timeout=60)
+        # 批量 embeddings 按 bulk 优先级占用上游并发槽位
+        with client.scheduler.slot("bulk"):
+            response = client.session.post(url, json=payload, timeout=60)
 
         if response.status_code == 200:
             result = response.json()
@@ -94,7 +96,7 @@ def generate_embeddings(
         return error_msg, f"**Error:** {error_msg}"
 
 
-def rerank_documents(query: str, documents: str, model: str = "jina-reranker-v2-base-multilingual", top_n: int = 3) -> tuple[str, str]:
+def rerank_documents(query: str, documents: str, model: str = "jina-reranker-v2-base-multilingual", top_n: int = 3, request: gr.Request = None) -> tuple[str, str]:
     """
     对文档进行重排序
 
@@ -107,6 +109,7 @@ def rerank_documents(query: str, documents: str, model: str = "jina-reranker-v2-
     Returns:
         (raw_output, markdown_output)
     """
+    client = session_client(request)
     try:
         if not query or not query.strip():
             error_msg = "请输入查询文本"
@@ -126,10 +129,10 @@ def rerank_documents(query: str, documents: str, model: str = "jina-reranker-v2-
         logger.info(f"Rerank 文档，模型: {model}, 查询: {query[:50]}..., 文档数量: {len(doc_list)}")
 
         # 调用 rerank API
-        url = f"{online_client.base_url}/rerank"
+        url = f"{client.base_url}/rerank"
         payload = {"model": model, "query": query, "documents": doc_list, "top_n": min(top_n, len(doc_list)), "return_documents": True}
 
-        response = online_client.session.post(url, json=payload, timeout=60)
+        response = client.session.post(url, json=payload, timeout=60)
 
         if response.status_code == 200:
             result = response.json()
@@ -154,7 +157,7 @@ def rerank_documents(query: str, documents: str, model: str = "jina-reranker-v2-
                 for i, item in enumerate(result["results"], 1):
                     score = item.get("relevance_score", 0)
                     index = item.get("index", -1)
-                    
+
                     # 处理 document 字段，可能是字符串或字典
                     doc_field = item.get("document", "")
                     if isinstance(doc_field, dict):
@@ -185,71 +188,66 @@ def rerank_documents(query: str, documents: str, model: str = "jina-reranker-v2-
         return error_msg, f"**Error:** {error_msg}"
 
 
-def search_web(
-    query: str = "",
-    url: str = "",
-    respond_with: str = "default",
-    with_images_summary: bool = False,
-    with_links_summary: bool = False
-) -> tuple[str, str]:
+def search_web(query: str = "", url: str = "", respond_with: str = "default", with_images_summary: bool = False, with_links_summary: bool = False, request: gr.Request = None) -> tuple[str, str]:
     """
     搜索网页或抓取特定 URL
-    
+
     Args:
         query: 搜索查询文本
         url: 要抓取的 URL
         respond_with: 响应格式 (default, no-content, markdown, html, text, screenshot)
         with_images_summary: 是否包含图片摘要
         with_links_summary: 是否包含链接摘要
-        
+
     Returns:
         (raw_output, markdown_output)
     """
+    client = session_client(request)
     try:
         if not query and not url:
             error_msg = "请输入搜索查询或 URL"
             return error_msg, f"**Error:** {error_msg}"
-        
+
         logger.info(f"搜索网页，查询: {query or 'N/A'}, URL: {url or 'N/A'}, 响应格式: {respond_with}")
-        
+
         # 调用 search API
-        api_url = f"{online_client.base_url}/search"
+        api_url = f"{client.base_url}/search"
         params = {}
         if query:
             params["q"] = query
         if url:
             params["url"] = url
-        
+
         # 设置自定义请求头
         headers = {"Accept": "application/json"}
-        
+
         if respond_with and respond_with != "default":
             headers["X-Respond-With"] = respond_with
-        
+
         if with_images_summary:
             headers["X-With-Images-Summary"] = "true"
-        
+
         if with_links_summary:
             headers["X-With-Links-Summary"] = "true"
-        
-        response = online_client.session.get(api_url, params=params, headers=headers, timeout=120)
-        
+
+        response = client.session.get(api_url, params=params, headers=headers, timeout=120)
+
         if response.status_code == 200:
             result = response.json()
-            
+
             # 格式化输出
             raw_output = json.dumps(result, indent=2, ensure_ascii=False)
-            
+
             # Markdown 输出
             markdown_lines = ["# Search 结果\n"]
             if query:
                 markdown_lines.append(f"**查询**: {query}\n")
             if url:
                 markdown_lines.append(f"**URL**: {url}\n")
-            
+
             if isinstance(result, dict):
                 data = result.get("data", result)
-                
+
                 if isinstance(data, dict):
                     if data.get("title"):
                         markdown_lines.append(f"\n## {data['title']}\n")
@@ -269,80 +267,76 @@ def search_web(
                             markdown_lines.append(f"\n### {i}. {title}\n")
                             if url:
                                 markdown_lines.append(f"URL: {url}\n")
-            
+
             markdown_output = "".join(markdown_lines)
-            
+
             logger.info("搜索成功")
             return raw_output, markdown_output
         else:
             error_msg = f"API 错误: {response.status_code} - {response.text}"
             logger.error(error_msg)
             return error_msg, f"**Error:** {error_msg}"
-            
+
     except Exception as e:
         error_msg = f"搜索失败: {str(e)}"
         logger.error(error_msg)
         return error_msg, f"**Error:** {error_msg}"
 
 
-def read_url(
-    url: str,
-    engine: str = "direct",
-    with_images_summary: bool = False,
-    with_links_summary: bool = False
-) -> tuple[str, str]:
+def read_url(url: str, engine: str = "direct", with_images_summary: bool = False, with_links_summary: bool = False, request: gr.Request = None) -> tuple[str, str]:
     """
     读取 URL 内容并转换为 LLM 友好格式
-    
+
     Args:
         url: 要读取的 URL
         engine: 引擎类型 (direct 或 browser)
         with_images_summary: 是否包含图片摘要
         with_links_summary: 是否包含链接摘要
-        
+
     Returns:
         (raw_output, markdown_output)
     """
+    client = session_client(request)
     try:
         if not url or not url.strip():
             error_msg = "请输入 URL"
             return error_msg, f"**Error:** {error_msg}"
-        
+
         # 确保 URL 有协议
         if not url.startswith(("http://", "https://")):
             url = "https://" + url
-        
+
         logger.info(f"读取 URL: {url}, 引擎: {engine}")
-        
+
         # 调用 reader API
-        api_url = f"{online_client.base_url}/reader/{url}"
+        api_url = f"{client.base_url}/reader/{url}"
         headers = {"Accept": "application/json"}
-        
+
         if engine:
             headers["X-Engine"] = engine
-        
+
         if with_images_summary:
             headers["X-With-Images-Summary"] = "true"
-        
+
         if with_links_summary:
             headers["X-With-Links-Summary"] = "true"
-        
-        response = online_client.session.get(api_url, headers=headers, timeout=120)
-        
+
+        response = client.session.get(api_url, headers=headers, timeout=120)
+
         if response.status_code == 200:
             result = response.json()
-            
+
             # 格式化输出
             raw_output = json.dumps(result, indent=2, ensure_ascii=False)
-            
+
             # Markdown 输出
             markdown_lines = ["# Reader 结果\n"]
             markdown_lines.append(f"**URL**: {url}\n")
             markdown_lines.append(f"**引擎**: {engine}\n\n")
-            
+
             if isinstance(result, dict):
                 data = result.get("data", result)
-                
+
                 if isinstance(data, dict):
                     if data.get("title"):
                         markdown_lines.append(f"## {data['title']}\n\n")
@@ -356,16 +350,16 @@ def read_url(
                             markdown_lines.append(f"*完整内容共 {len(content)} 字符，请查看 Raw Output*\n")
                         else:
                             markdown_lines.append(f"### 内容\n\n{content}\n")
-            
+
             markdown_output = "".join(markdown_lines)
-            
+
             logger.info(f"读取成功，内容长度: {len(result.get('data', {}).get('content', ''))}")
             return raw_output, markdown_output
         else:
             error_msg = f"API 错误: {response.status_code} - {response.text}"
             logger.error(error_msg)
             return error_msg, f"**Error:** {error_msg}"
-            
+
     except Exception as e:
         error_msg = f"读取 URL 失败: {str(e)}"
         logger.error(error_msg)
@@ -3,26 +3,28 @@
 包含图像、视频、PDF、GIF等处理和生成功能
 """
 
+from __future__ import annotations
+
 import base64
 import time
 from io import BytesIO
-from threading import Thread
 from typing import Any
 
 import cv2
 import numpy as np
-import torch
 from loguru import logger
 from PIL import Image
-from transformers import TextIteratorStreamer
+
+import gradio as gr
 
 from ..model_manager import model_manager
-from .online_client import get_online_model_id, is_online_model, online_client
+from ..session_state import session_state_store
+from .online_client import OnlineClient, get_online_model_id, is_online_model, online_client
+from .session import session_client, session_model_key, session_state, update_session
 
 # 常量定义
 MAX_MAX_NEW_TOKENS = 4096
 DEFAULT_MAX_NEW_TOKENS = 1024
-device = torch.device("cuda:6" if torch.cuda.is_available() else "cpu")
 
 
 def extract_gif_frames(gif_path: str):
@@ -56,27 +58,22 @@ def downsample_video(video_path):
     return frames
 
 
-def convert_pdf_to_images(file_path: str, dpi: int = 200):
-    """PDF转图片"""
-    try:
-        import fitz
-    except ImportError:
-        logger.error("PyMuPDF 未安装，无法处理PDF文件")
-        return []
+def count_pdf_pages(file_path: str) -> int:
+    """PDF页数"""
+    import fitz
+
+    with fitz.open(file_path) as pdf_document:
+        return len(pdf_document)
+
+
+def render_pdf_page(file_path: str, page_num: int, dpi: int = 200) -> Image.Image:
+    """只渲染PDF的指定页，预览和逐页生成时按需调用"""
+    import fitz
 
-    if not file_path:
-        return []
-    images = []
-    pdf_document = fitz.open(file_path)
     zoom = dpi / 72.0
-    mat = fitz.Matrix(zoom, zoom)
-    for page_num in range(len(pdf_document)):
-        page = pdf_document.load_page(page_num)
-        pix = page.get_pixmap(matrix=mat)
-        img_data = pix.tobytes("png")
-        images.append(Image.open(BytesIO(img_data)))
-    pdf_document.close()
-    return images
+    with fitz.open(file_path) as pdf_document:
+        pix = pdf_document.load_page(page_num).get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return Image.open(BytesIO(pix.tobytes("png")))
 
 
 def encode_image_to_base64(image: Image.Image) -> str:
@@ -88,23 +85,25 @@ def encode_image_to_base64(image: Image.Image) -> str:
 
 
 def get_initial_pdf_state() -> dict[str, Any]:
-    """获取初始PDF状态"""
-    return {"pages": [], "total_pages": 0, "current_page_index": 0}
+    """获取初始PDF状态：只保存文档引用和页码，页面图像按需渲染"""
+    return {"document": None, "total_pages": 0, "current_page_index": 0}
 
 
-def load_and_preview_pdf(file_path: str | None) -> tuple[Image.Image | None, dict[str, Any], str]:
-    """加载并预览PDF"""
+def load_and_preview_pdf(file_path: str | None, request: gr.Request = None) -> tuple[Image.Image | None, dict[str, Any], str]:
+    """加载并预览PDF；文件保存到共享的文件存储，会话状态中只记录引用"""
     state = get_initial_pdf_state()
     if not file_path:
         return None, state, '<div style="text-align:center;">No file loaded</div>'
     try:
-        pages = convert_pdf_to_images(file_path)
-        if not pages:
+        total_pages = count_pdf_pages(file_path)
+        if not total_pages:
             return None, state, '<div style="text-align:center;">Could not load file</div>'
-        state["pages"] = pages
-        state["total_pages"] = len(pages)
+        ref = session_state_store.artifacts.put_file(file_path)
+        update_session(request, documents={**session_state(request).documents, "pdf": ref})
+        state["document"] = ref
+        state["total_pages"] = total_pages
         page_info_html = f'<div style="text-align:center;">Page 1 / {state["total_pages"]}</div>'
-        return pages[0], state, page_info_html
+        return render_pdf_page(session_state_store.artifacts.path(ref), 0), state, page_info_html
     except Exception as e:
         logger.error(f"PDF预览失败: {e}")
         return None, state, f'<div style="text-align:center;">Failed to load preview: {e}</div>'
@@ -112,7 +111,7 @@ def load_and_preview_pdf(file_path: str | None) -> tuple[Image.Image | None, dic
 
 def navigate_pdf_page(direction: str, state: dict[str, Any]):
     """PDF页面导航"""
-    if not state or not state["pages"]:
+    if not state or not state.get("document"):
         return None, state, '<div style="text-align:center;">No file loaded</div>'
     current_index = state["current_page_index"]
     total_pages = state["total_pages"]
@@ -123,15 +122,15 @@ def navigate_pdf_page(direction: str, state: dict[str, Any]):
     else:
         new_index = current_index
     state["current_page_index"] = new_index
-    image_preview = state["pages"][new_index]
+    image_preview = render_pdf_page(session_state_store.artifacts.path(state["document"]), new_index)
     page_info_html = f'<div style="text-align:center;">Page {new_index + 1} / {total_pages}</div>'
     return image_preview, state, page_info_html
 
 
 # @spaces.GPU
-def generate_image(text: str, image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
-    """图像生成函数，支持本地和在线模型"""
-    current_model_key = model_manager.current_model_key
+def generate_image(text: str, image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, request: gr.Request = None):
+    """图像生成函数，支持本地和在线模型，使用会话选择的模型"""
+    current_model_key = session_model_key(request)
 
     if image is None:
         yield "Please upload an image.", "Please upload an image."
@@ -140,37 +139,29 @@ def generate_image(text: str, image: Image.Image, max_new_tokens: int = 1024, te
     # 检查是否为在线模型
     if is_online_model(current_model_key):
         # 递归调用在线生成函数
-        yield from _generate_image_online(text, image, current_model_key, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+        yield from _generate_image_online(text, image, current_model_key, max_new_tokens, temperature, top_p, top_k, repetition_penalty, session_client(request))
     else:
         # 递归调用本地生成函数
-        yield from _generate_image_local(text, image, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+        yield from _generate_image_local(text, image, max_new_tokens, temperature, top_p, top_k, repetition_penalty, current_model_key)
 
 
-def _generate_image_local(text: str, image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
+def _generate_image_local(text: str, image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, model_key: str | None = None):
     """本地模型图像生成"""
-    current_model = model_manager.get_current_model()
-    current_processor = model_manager.get_current_processor()
-
-    if current_model is None or current_processor is None:
-        yield "模型未加载", "模型未加载"
+    model_key = model_key or model_manager.current_model_key
+    if not model_manager.ensure_loaded(model_key):
+        yield "模型加载失败", "模型加载失败"
         return
 
     # 检查模型类型
-    model_info = model_manager.get_current_model_info()
+    model_info = model_manager.get_available_models().get(model_key, {})
     if model_info.get("type") != "multimodal":
         yield "当前本地模型不支持图像处理，请切换到多模态模型", "当前本地模型不支持图像处理，请切换到多模态模型"
         return
 
     try:
         messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": text}]}]
-        prompt_full = current_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = current_processor(text=[prompt_full], images=[image], return_tensors="pt", padding=True).to(device)
-        streamer = TextIteratorStreamer(current_processor, skip_prompt=True, skip_special_tokens=True)
-        generation_kwargs = {**inputs, "streamer": streamer, "max_new_tokens": max_new_tokens}
-        thread = Thread(target=current_model.generate, kwargs=generation_kwargs)
-        thread.start()
         buffer = ""
-        for new_text in streamer:
+        for new_text in model_manager.stream_generate(model_key, messages, [image], max_new_tokens=max_new_tokens):
             buffer += new_text
             time.sleep(0.01)
             yield buffer, buffer
@@ -179,7 +170,7 @@ def _generate_image_local(text: str, image: Image.Image, max_new_tokens: int = 1
         yield f"生成出错: {str(e)}", f"生成出错: {str(e)}"
 
 
-def _generate_image_online(text: str, image: Image.Image, model_key: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
+def _generate_image_online(text: str, image: Image.Image, model_key: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, client: OnlineClient | None = None):
     """在线模型图像生成"""
     try:
         model_id = get_online_model_id(model_key)
@@ -196,7 +187,7 @@ def _generate_image_online(text: str, image: Image.Image, model_key: str, max_ne
 
         # 使用流式生成 - 传递结构化的消息而不是JSON字符串
         buffer = ""
-        for chunk in online_client.stream_generate_text(model_id, messages, **params):
+        for chunk in (client or online_client).stream_generate_text(model_id, messages, **params):
             if chunk:
                 buffer += chunk
                 yield buffer, buffer
@@ -207,21 +198,19 @@ def _generate_image_online(text: str, image: Image.Image, model_key: str, max_ne
 
 
 # @spaces.GPU
-def generate_video(text: str, video_path: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
-    """视频生成函数"""
+def generate_video(text: str, video_path: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, kv_cache_mode: str = "auto", request: gr.Request = None):
+    """视频生成函数（bulk 优先级）"""
     if video_path is None:
         yield "Please upload a video.", "Please upload a video."
         return
 
-    current_model = model_manager.get_current_model()
-    current_processor = model_manager.get_current_processor()
-
-    if current_model is None or current_processor is None:
-        yield "模型未加载", "模型未加载"
+    model_key = session_model_key(request)
+    if not model_manager.ensure_loaded(model_key):
+        yield "模型加载失败", "模型加载失败"
         return
 
     # 检查模型类型
-    model_info = model_manager.get_current_model_info()
+    model_info = model_manager.get_available_models().get(model_key, {})
     if model_info.get("type") != "multimodal":
         yield "当前模型不支持视频处理，请切换到多模态模型", "当前模型不支持视频处理，请切换到多模态模型"
         return
@@ -234,14 +223,19 @@ def generate_video(text: str, video_path: str, max_new_tokens: int = 1024, tempe
         messages = [{"role": "user", "content": [{"type": "text", "text": text}]}]
         for _frame in frames:
             messages[0]["content"].insert(0, {"type": "image"})
-        prompt_full = current_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = current_processor(text=[prompt_full], images=frames, return_tensors="pt", padding=True).to(device)
-        streamer = TextIteratorStreamer(current_processor, skip_prompt=True, skip_special_tokens=True)
-        generation_kwargs = {**inputs, "streamer": streamer, "max_new_tokens": max_new_tokens, "do_sample": True, "temperature": temperature, "top_p": top_p, "top_k": top_k, "repetition_penalty": repetition_penalty}
-        thread = Thread(target=current_model.generate, kwargs=generation_kwargs)
-        thread.start()
+        generation_kwargs = {
+            "max_new_tokens": max_new_tokens,
+            "do_sample": True,
+            "temperature": temperature,
+            "top_p": top_p,
+            "top_k": top_k,
+            "repetition_penalty": repetition_penalty,
+            "kv_cache_mode": kv_cache_mode,
+            "priority": "bulk",
+            "session_id": request.session_hash if request is not None else None,
+        }
         buffer = ""
-        for new_text in streamer:
+        for new_text in model_manager.stream_generate(model_key, messages, frames, **generation_kwargs):
             buffer += new_text
             buffer = buffer.replace("<|im_end|>", "")
             time.sleep(0.01)
@@ -252,40 +246,50 @@ def generate_video(text: str, video_path: str, max_new_tokens: int = 1024, tempe
 
 
 # @spaces.GPU
-def generate_pdf(text: str, state: dict[str, Any], max_new_tokens: int = 2048, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
-    """PDF生成函数"""
-    if not state or not state["pages"]:
+def generate_pdf(
+    text: str,
+    state: dict[str, Any],
+    max_new_tokens: int = 2048,
+    temperature: float = 0.6,
+    top_p: float = 0.9,
+    top_k: int = 50,
+    repetition_penalty: float = 1.2,
+    kv_cache_mode: str = "auto",
+    speculative: str = "prompt_lookup",
+    request: gr.Request = None,
+):
+    """PDF生成函数，默认使用 prompt lookup 投机解码（摘要类输出大量复用输入内容）
+
+    以 bulk 优先级逐页生成，每页单独排队，交互式请求可以在页与页之间插队
+    """
+    if not state or not state.get("document"):
         yield "Please upload a PDF file first.", "Please upload a PDF file first."
         return
 
-    current_model = model_manager.get_current_model()
-    current_processor = model_manager.get_current_processor()
-
-    if current_model is None or current_processor is None:
-        yield "模型未加载", "模型未加载"
+    model_key = session_model_key(request)
+    if not model_manager.ensure_loaded(model_key):
+        yield "模型加载失败", "模型加载失败"
         return
 
     # 检查模型类型
-    model_info = model_manager.get_current_model_info()
+    model_info = model_manager.get_available_models().get(model_key, {})
     if model_info.get("type") != "multimodal":
         yield "当前模型不支持PDF处理，请切换到多模态模型", "当前模型不支持PDF处理，请切换到多模态模型"
         return
 
     try:
-        page_images = state["pages"]
+        pdf_path = session_state_store.artifacts.path(state["document"])
+        total_pages = state["total_pages"]
+        session_id = request.session_hash if request is not None else None
         full_response = ""
-        for i, image in enumerate(page_images):
-            page_header = f"--- Page {i + 1}/{len(page_images)} ---\n"
+        for i in range(total_pages):
+            image = render_pdf_page(pdf_path, i)
+            page_header = f"--- Page {i + 1}/{total_pages} ---\n"
             yield full_response + page_header, full_response + page_header
             messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": text}]}]
-            prompt_full = current_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-            inputs = current_processor(text=[prompt_full], images=[image], return_tensors="pt", padding=True).to(device)
-            streamer = TextIteratorStreamer(current_processor, skip_prompt=True, skip_special_tokens=True)
-            generation_kwargs = {**inputs, "streamer": streamer, "max_new_tokens": max_new_tokens}
-            thread = Thread(target=current_model.generate, kwargs=generation_kwargs)
-            thread.start()
+            generation_kwargs = {"max_new_tokens": max_new_tokens, "kv_cache_mode": kv_cache_mode, "speculative": speculative, "priority": "bulk", "session_id": session_id}
             page_buffer = ""
-            for new_text in streamer:
+            for new_text in model_manager.stream_generate(model_key, messages, [image], **generation_kwargs):
                 page_buffer += new_text
                 yield full_response + page_header + page_buffer, full_response + page_header + page_buffer
                 time.sleep(0.01)
@@ -296,34 +300,32 @@ def generate_pdf(text: str, state: dict[str, Any], max_new_tokens: int = 2048, t
 
 
 # @spaces.GPU
-def generate_caption(image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
-    """图像描述生成函数，支持本地和在线模型"""
+def generate_caption(image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, request: gr.Request = None):
+    """图像描述生成函数，支持本地和在线模型，使用会话选择的模型"""
     if image is None:
         yield "Please upload an image to caption.", "Please upload an image to caption."
         return
 
-    current_model_key = model_manager.current_model_key
+    current_model_key = session_model_key(request)
 
     # 检查是否为在线模型
     if is_online_model(current_model_key):
         # 递归调用在线生成函数
-        yield from _generate_caption_online(image, current_model_key, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+        yield from _generate_caption_online(image, current_model_key, max_new_tokens, temperature, top_p, top_k, repetition_penalty, session_client(request))
     else:
         # 递归调用本地生成函数
-        yield from _generate_caption_local(image, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+        yield from _generate_caption_local(image, max_new_tokens, temperature, top_p, top_k, repetition_penalty, current_model_key)
 
 
-def _generate_caption_local(image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
+def _generate_caption_local(image: Image.Image, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, model_key: str | None = None):
     """本地模型图像描述生成"""
-    current_model = model_manager.get_current_model()
-    current_processor = model_manager.get_current_processor()
-
-    if current_model is None or current_processor is None:
-        yield "模型未加载", "模型未加载"
+    model_key = model_key or model_manager.current_model_key
+    if not model_manager.ensure_loaded(model_key):
+        yield "模型加载失败", "模型加载失败"
         return
 
     # 检查模型类型
-    model_info = model_manager.get_current_model_info()
+    model_info = model_manager.get_available_models().get(model_key, {})
     if model_info.get("type") != "multimodal":
         yield "当前本地模型不支持图像描述，请切换到多模态模型", "当前本地模型不支持图像描述，请切换到多模态模型"
         return
@@ -339,14 +341,8 @@ def _generate_caption_local(image: Image.Image, max_new_tokens: int = 1024, temp
             "only return the formatted caption, attributes, and class_name."
         )
         messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": system_prompt}]}]
-        prompt_full = current_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = current_processor(text=[prompt_full], images=[image], return_tensors="pt", padding=True).to(device)
-        streamer = TextIteratorStreamer(current_processor, skip_prompt=True, skip_special_tokens=True)
-        generation_kwargs = {**inputs, "streamer": streamer, "max_new_tokens": max_new_tokens}
-        thread = Thread(target=current_model.generate, kwargs=generation_kwargs)
-        thread.start()
         buffer = ""
-        for new_text in streamer:
+        for new_text in model_manager.stream_generate(model_key, messages, [image], max_new_tokens=max_new_tokens):
             buffer += new_text
             time.sleep(0.01)
             yield buffer, buffer
@@ -355,7 +351,7 @@ def _generate_caption_local(image: Image.Image, max_new_tokens: int = 1024, temp
         yield f"生成出错: {str(e)}", f"生成出错: {str(e)}"
 
 
-def _generate_caption_online(image: Image.Image, model_key: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
+def _generate_caption_online(image: Image.Image, model_key: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, client: OnlineClient | None = None):
     """在线模型图像描述生成"""
     try:
         model_id = get_online_model_id(model_key)
@@ -383,7 +379,7 @@ def _generate_caption_online(image: Image.Image, model_key: str, max_new_tokens:
 
         # 使用流式生成
         buffer = ""
-        for chunk in online_client.stream_generate_text(model_id, messages, **params):
+        for chunk in (client or online_client).stream_generate_text(model_id, messages, **params):
             if chunk:
                 buffer += chunk
                 yield buffer, buffer
@@ -394,21 +390,19 @@ def _generate_caption_online(image: Image.Image, model_key: str, max_new_tokens:
 
 
 # @spaces.GPU
-def generate_gif(text: str, gif_path: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
-    """GIF生成函数"""
+def generate_gif(text: str, gif_path: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, kv_cache_mode: str = "auto", request: gr.Request = None):
+    """GIF生成函数（bulk 优先级）"""
     if gif_path is None:
         yield "Please upload a GIF.", "Please upload a GIF."
         return
 
-    current_model = model_manager.get_current_model()
-    current_processor = model_manager.get_current_processor()
-
-    if current_model is None or current_processor is None:
-        yield "模型未加载", "模型未加载"
+    model_key = session_model_key(request)
+    if not model_manager.ensure_loaded(model_key):
+        yield "模型加载失败", "模型加载失败"
         return
 
     # 检查模型类型
-    model_info = model_manager.get_current_model_info()
+    model_info = model_manager.get_available_models().get(model_key, {})
     if model_info.get("type") != "multimodal":
         yield "当前模型不支持GIF处理，请切换到多模态模型", "当前模型不支持GIF处理，请切换到多模态模型"
         return
@@ -421,14 +415,19 @@ def generate_gif(text: str, gif_path: str, max_new_tokens: int = 1024, temperatu
         messages = [{"role": "user", "content": [{"type": "text", "text": text}]}]
         for _frame in frames:
             messages[0]["content"].insert(0, {"type": "image"})
-        prompt_full = current_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = current_processor(text=[prompt_full], images=frames, return_tensors="pt", padding=True).to(device)
-        streamer = TextIteratorStreamer(current_processor, skip_prompt=True, skip_special_tokens=True)
-        generation_kwargs = {**inputs, "streamer": streamer, "max_new_tokens": max_new_tokens, "do_sample": True, "temperature": temperature, "top_p": top_p, "top_k": top_k, "repetition_penalty": repetition_penalty}
-        thread = Thread(target=current_model.generate, kwargs=generation_kwargs)
-        thread.start()
+        generation_kwargs = {
+            "max_new_tokens": max_new_tokens,
+            "do_sample": True,
+            "temperature": temperature,
+            "top_p": top_p,
+            "top_k": top_k,
+            "repetition_penalty": repetition_penalty,
+            "kv_cache_mode": kv_cache_mode,
+            "priority": "bulk",
+            "session_id": request.session_hash if request is not None else None,
+        }
         buffer = ""
-        for new_text in streamer:
+        for new_text in model_manager.stream_generate(model_key, messages, frames, **generation_kwargs):
             buffer += new_text
             buffer = buffer.replace("<|im_end|>", "")
             time.sleep(0.01)
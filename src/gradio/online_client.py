@@ -4,6 +4,7 @@ Online模式客户端模块
 """
 
 import json
+import threading
 from typing import Any
 from urllib.parse import urlparse
 
@@ -14,15 +15,25 @@ from loguru import logger
 class OnlineClient:
     """Online模式客户端，用于连接远程服务端"""
 
-    def __init__(self, base_url: str = "http://localhost:8080/v1", api_key: str = ""):
+    def __init__(self, base_url: str = "http://localhost:8080/v1", api_key: str = "", scheduler=None):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
+        self._scheduler = scheduler
         self.session = requests.Session()
         self.session.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
         if api_key:
             self.session.headers.update({"X-API-Key": api_key})
         self._configure_proxy()
 
+    @property
+    def scheduler(self):
+        """上游并发调度器；未注入时延迟使用全局 online_scheduler，本模块可脱离 src 包单独导入"""
+        if self._scheduler is None:
+            from ..scheduler import online_scheduler
+
+            self._scheduler = online_scheduler
+        return self._scheduler
+
     def set_api_key(self, api_key: str):
         """设置 API Key"""
         self.api_key = api_key
@@ -100,8 +111,16 @@ class OnlineClient:
             logger.error(f"获取模型列表异常: {e}")
             return []
 
-    def generate_text(self, model_id: str, prompt_or_messages, **kwargs) -> str:
-        """使用远程模型生成文本"""
+    def generate_text(self, model_id: str, prompt_or_messages, priority: str = "interactive", session_id: str | None = None, **kwargs) -> str:
+        """使用远程模型生成文本，按优先级占用上游并发槽位"""
+        try:
+            with self.scheduler.slot(priority, session_id):
+                return self._generate_text(model_id, prompt_or_messages, **kwargs)
+        except Exception as e:
+            logger.error(f"文本生成异常: {e}")
+            return f"生成异常: {str(e)}"
+
+    def _generate_text(self, model_id: str, prompt_or_messages, **kwargs) -> str:
         try:
             # 判断输入是消息数组还是文本提示
             if isinstance(prompt_or_messages, list):
@@ -156,8 +175,16 @@ class OnlineClient:
             logger.error(f"文本生成异常: {e}")
             return f"生成异常: {str(e)}"
 
-    def stream_generate_text(self, model_id: str, prompt_or_messages, **kwargs):
-        """流式文本生成"""
+    def stream_generate_text(self, model_id: str, prompt_or_messages, priority: str = "interactive", session_id: str | None = None, **kwargs):
+        """流式文本生成，按优先级占用上游并发槽位"""
+        try:
+            with self.scheduler.slot(priority, session_id):
+                yield from self._stream_generate_text(model_id, prompt_or_messages, **kwargs)
+        except Exception as e:
+            logger.error(f"流式生成异常: {e}")
+            yield f"生成异常: {str(e)}"
+
+    def _stream_generate_text(self, model_id: str, prompt_or_messages, **kwargs):
         try:
             # 判断输入是消息数组还是文本提示
             if isinstance(prompt_or_messages, list):
@@ -245,25 +272,44 @@ class OnlineClient:
             return None
 
 
-# 全局online客户端实例
+# 全局online客户端实例（未设置服务地址的会话使用）
 online_client = OnlineClient("http://localhost:8080/v1")
 
+# 按会话的服务地址和 API Key 复用的客户端
+MAX_SESSION_CLIENTS = 256
+_session_clients: dict[tuple[str, str], OnlineClient] = {}
+_session_clients_lock = threading.Lock()
+
+
+def client_for(server_url: str | None, api_key: str = "") -> OnlineClient:
+    """会话使用的在线客户端；相同服务地址和 API Key 的会话共享连接池"""
+    if not server_url:
+        return online_client
+    key = (server_url.rstrip("/"), api_key or "")
+    with _session_clients_lock:
+        client = _session_clients.pop(key, None) or OnlineClient(*key)
+        # 重新插入以保持最近使用顺序，超出上限时丢弃最久未使用的客户端
+        _session_clients[key] = client
+        while len(_session_clients) > MAX_SESSION_CLIENTS:
+            _session_clients.pop(next(iter(_session_clients)))
+        return client
 
-def connect_to_server(server_url: str) -> dict[str, Any]:
-    """连接到指定的服务器"""
-    global online_client
 
+def connect_to_server(server_url: str, client: OnlineClient | None = None) -> dict[str, Any]:
+    """连接到指定的服务器；未指定 client 时更新全局客户端的地址"""
     try:
-        # 更新客户端URL
-        online_client.base_url = server_url.rstrip("/")
-        # 根据目标地址调整代理设置（本地禁用代理，外网遵循环境变量）
-        online_client._configure_proxy()
+        if client is None:
+            client = online_client
+            # 更新客户端URL
+            client.base_url = server_url.rstrip("/")
+            # 根据目标地址调整代理设置（本地禁用代理，外网遵循环境变量）
+            client._configure_proxy()
 
         # 测试连接
-        logger.debug(f"测试连接到 {online_client.base_url}")
-        if online_client.test_connection():
+        logger.debug(f"测试连接到 {client.base_url}")
+        if client.test_connection():
             # 获取模型列表
-            models = online_client.get_available_models()
+            models = client.get_available_models()
 
             # 格式化模型选项
             model_choices = []
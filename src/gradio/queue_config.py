@@ -0,0 +1,64 @@
+"""
+Gradio 队列与并发分组
+按后端容量为每类事件设置独立的并发组，避免长任务（PDF、视频）阻塞文本请求：
+- text / vision: 按会话所选模型的后端再分为 _local 和 _online 两组，本地组使用本地模型槽位，在线组使用在线服务上游并发
+- long_job: PDF、视频、GIF 等长任务，单独限流
+- tts / asr / tools: 语音合成、语音识别和 Jina 工具各自的上游并发
+队列总长度超过 max_size 时直接拒绝新请求；排队中的请求在界面上显示队列位置和预计等待时间
+"""
+
+from typing import Any
+
+from src.utils.config import Config
+
+DEFAULT_QUEUE_CONFIG = {
+    "max_size": 64,
+    "local_slots": 1,
+    "online_concurrency": 8,
+    "long_job_concurrency": 1,
+    "tts_concurrency": 2,
+    "asr_concurrency": 4,
+    "tools_concurrency": 8,
+}
+
+
+def queue_config() -> dict[str, Any]:
+    return {**DEFAULT_QUEUE_CONFIG, **(Config().get_config().get("queue", {}) or {})}
+
+
+def local_capacity(config: dict[str, Any]) -> int:
+    """本地模型可同时执行的生成数：启用推理进程时为进程数 × 每进程槽位"""
+    worker_config = Config().get_config().get("inference_worker", {}) or {}
+    if worker_config.get("enabled", False):
+        workers = len(worker_config.get("addresses") or []) or int(worker_config.get("workers", 1))
+        return workers * int(config["local_slots"])
+    return int(config["local_slots"])
+
+
+def concurrency_limits(config: dict[str, Any] | None = None) -> dict[str, int]:
+    """各并发组的并发上限"""
+    config = config or queue_config()
+    local = local_capacity(config)
+    online = int(config["online_concurrency"])
+    return {
+        "text_local": local,
+        "text_online": online,
+        "vision_local": local,
+        "vision_online": online,
+        "long_job": int(config["long_job_concurrency"]),
+        "tts": int(config["tts_concurrency"]),
+        "asr": int(config["asr_concurrency"]),
+        "tools": int(config["tools_concurrency"]),
+    }
+
+
+def event_options(group: str, limits: dict[str, int] | None = None) -> dict[str, Any]:
+    """事件绑定参数：同组事件共享并发上限，排队时显示进度"""
+    limits = limits or concurrency_limits()
+    return {"concurrency_id": group, "concurrency_limit": limits[group], "show_progress": "full", "trigger_mode": "once"}
+
+
+def configure_queue(demo):
+    """启用队列：超过 max_size 时拒绝新请求，并按需推送队列位置"""
+    config = queue_config()
+    return demo.queue(max_size=int(config["max_size"]), default_concurrency_limit=1, status_update_rate="auto")
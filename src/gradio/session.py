@@ -0,0 +1,43 @@
+"""
+界面请求的会话状态
+按 Gradio 的 session_hash 读取会话状态（src/session_state.py），未设置的字段使用进程默认值：
+模型默认为 model_manager.current_model_key，在线服务默认为全局 online_client
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+import gradio as gr
+
+from ..model_manager import model_manager
+from ..session_state import SessionState, session_state_store
+from .online_client import OnlineClient, client_for
+
+
+def session_id(request: gr.Request | None) -> str | None:
+    return request.session_hash if request is not None else None
+
+
+def session_state(request: gr.Request | None) -> SessionState:
+    return session_state_store.get(session_id(request))
+
+
+def update_session(request: gr.Request | None, **changes) -> SessionState:
+    return session_state_store.update(session_id(request), **changes)
+
+
+def session_model_key(request: gr.Request | None) -> str:
+    """会话选择的模型"""
+    return session_state(request).model_key or model_manager.current_model_key
+
+
+def session_model_info(request: gr.Request | None) -> dict[str, Any]:
+    """会话选择的本地模型配置，在线模型返回空字典"""
+    return model_manager.get_available_models().get(session_model_key(request), {})
+
+
+def session_client(request: gr.Request | None) -> OnlineClient:
+    """会话连接的在线服务客户端"""
+    state = session_state(request)
+    return client_for(state.server_url, state.api_key)
@@ -3,23 +3,44 @@ Speech-to-Text 和 Text-to-Speech 功能实现
 使用兼容 OpenAI API 的方式接入服务
 """
 
+from __future__ import annotations
+
 import os
+import struct
 import tempfile
+from collections.abc import Iterator
 
+import numpy as np
 from loguru import logger
 
 import gradio as gr
 
-from .online_client import get_online_model_id, is_online_model, online_client
+from .online_client import OnlineClient, get_online_model_id, is_online_model, online_client
+
+# 流式播放时每次交给前端的最短音频长度（秒）
+STREAM_CHUNK_SECONDS = 0.5
+
+
+def _request_client(request: gr.Request | None) -> OnlineClient:
+    """会话连接的在线服务客户端；没有会话时使用全局客户端"""
+    if request is None:
+        return online_client
+    from .session import session_client
 
+    return session_client(request)
 
-def get_available_voices() -> dict:
+
+def get_available_voices(client: OnlineClient | None = None) -> dict:
     """
     从在线服务器获取可用的声音列表
 
+    Args:
+        client: 在线服务客户端，默认使用全局客户端
+
     Returns:
         dict: 包含 success 和 voices/error 的字典
     """
+    client = client or online_client
     try:
         # 尝试多个可能的端点
         endpoints = [
@@ -29,10 +50,10 @@ def get_available_voices() -> dict:
 
         for endpoint in endpoints:
             try:
-                url = f"{online_client.base_url}{endpoint}"
+                url = f"{client.base_url}{endpoint}"
                 logger.info(f"尝试获取声音列表: {url}")
 
-                response = online_client.session.get(url, timeout=10)
+                response = client.session.get(url, timeout=10)
 
                 if response.status_code == 200:
                     result = response.json()
@@ -76,13 +97,14 @@ def get_available_voices() -> dict:
         return {"success": True, "voices": []}
 
 
-def generate_speech_to_text(audio_path: str) -> tuple[str, str]:
+def generate_speech_to_text(audio_path: str, request: gr.Request = None) -> tuple[str, str]:
     """
     语音转文字功能，使用 OpenAI 兼容的 API
-    直接使用 online_client 的服务地址（即用户在 UI 中输入的服务器地址）
+    使用当前会话连接的服务地址（即用户在 UI 中输入的服务器地址）
 
     Args:
         audio_path: 音频文件路径
+        request: Gradio 请求，用于读取会话状态
 
     Returns:
         Tuple[str, str]: (原始输出, Markdown格式输出)
@@ -93,12 +115,13 @@ def generate_speech_to_text(audio_path: str) -> tuple[str, str]:
         return error_msg, f"**Error:** {error_msg}"
 
     try:
-        # 使用 online_client 的服务地址进行 STT
+        # 使用会话的服务地址进行 STT
+        client = _request_client(request)
         model_id = "whisper-1"
-        logger.info(f"使用服务地址 {online_client.base_url} 进行语音转文字, 模型: {model_id}, 音频文件: {audio_path}")
+        logger.info(f"使用服务地址 {client.base_url} 进行语音转文字, 模型: {model_id}, 音频文件: {audio_path}")
 
         # 调用 OpenAI 兼容的 /audio/transcriptions 端点
-        result = transcribe_audio(audio_path, model_id)
+        result = transcribe_audio(audio_path, model_id, client)
 
         if result.get("success"):
             transcription = result.get("text", "")
@@ -118,18 +141,20 @@ def generate_speech_to_text(audio_path: str) -> tuple[str, str]:
         return error_msg, f"**Error:** {error_msg}"
 
 
-def transcribe_audio(audio_path: str, model: str = "whisper-1") -> dict:
+def transcribe_audio(audio_path: str, model: str = "whisper-1", client: OnlineClient | None = None) -> dict:
     """
     使用 OpenAI 兼容的 API 进行音频转录
-    使用 online_client 的服务地址（即用户在 UI 中输入的服务器地址）
+    使用会话连接的服务地址（即用户在 UI 中输入的服务器地址）
 
     Args:
         audio_path: 音频文件路径
         model: 模型名称，默认为 whisper-1
+        client: 在线服务客户端，默认使用全局客户端
 
     Returns:
         dict: 包含 success 和 text/error 的字典
     """
+    client = client or online_client
     try:
         # 打开音频文件
         with open(audio_path, "rb") as audio_file:
@@ -138,18 +163,18 @@ def transcribe_audio(audio_path: str, model: str = "whisper-1") -> dict:
             data = {"model": model}
 
             # 调用 OpenAI 兼容的 /audio/transcriptions 端点
-            url = f"{online_client.base_url}/audio/transcriptions"
+            url = f"{client.base_url}/audio/transcriptions"
             logger.info(f"发送转录请求到: {url}")
 
             # 临时移除 Content-Type header，让 requests 自动设置 multipart/form-data
-            original_headers = online_client.session.headers.copy()
-            if "Content-Type" in online_client.session.headers:
-                del online_client.session.headers["Content-Type"]
+            original_headers = client.session.headers.copy()
+            if "Content-Type" in client.session.headers:
+                del client.session.headers["Content-Type"]
 
-            response = online_client.session.post(url, files=files, data=data, timeout=120)
+            response = client.session.post(url, files=files, data=data, timeout=120)
 
             # 恢复原始 headers
-            online_client.session.headers.update(original_headers)
+            client.session.headers.update(original_headers)
 
             if response.status_code == 200:
                 result = response.json()
@@ -173,7 +198,7 @@ def transcribe_audio(audio_path: str, model: str = "whisper-1") -> dict:
         return {"success": False, "error": error_msg}
 
 
-def generate_text_to_speech(text: str, voice: str = "", speed: float = 1.0) -> tuple[str | None, str]:
+def generate_text_to_speech(text: str, voice: str = "", speed: float = 1.0, request: gr.Request = None) -> tuple[str | None, str]:
     """
     文字转语音功能，使用 OpenAI 兼容的 API
 
@@ -181,6 +206,7 @@ def generate_text_to_speech(text: str, voice: str = "", speed: float = 1.0) -> t
         text: 要转换的文本
         voice: 语音类型
         speed: 语速 (0.25 - 4.0)
+        request: Gradio 请求，用于读取会话选择的模型和服务地址
 
     Returns:
         tuple[str | None, str]: (音频文件路径或None, 状态消息)
@@ -191,9 +217,9 @@ def generate_text_to_speech(text: str, voice: str = "", speed: float = 1.0) -> t
         return None, f"**Error:** {error_msg}"
 
     try:
-        from ..model_manager import model_manager
+        from .session import session_model_key
 
-        current_model_key = model_manager.current_model_key
+        current_model_key = session_model_key(request)
 
         # 检查是否为在线模型
         if not is_online_model(current_model_key):
@@ -206,7 +232,7 @@ def generate_text_to_speech(text: str, voice: str = "", speed: float = 1.0) -> t
         logger.info(f"使用在线模型进行文字转语音: {model_id}, 文本长度: {len(text)}")
 
         # 调用 OpenAI 兼容的 /audio/speech 端点
-        result = synthesize_speech(text, model_id, voice, speed)
+        result = synthesize_speech(text, model_id, voice, speed, _request_client(request))
 
         if result.get("success"):
             audio_path = result.get("audio_path")
@@ -226,7 +252,109 @@ def generate_text_to_speech(text: str, voice: str = "", speed: float = 1.0) -> t
         return None, f"**Error:** {error_msg}"
 
 
-def synthesize_speech(text: str, model: str = "tts-1", voice: str = "", speed: float = 1.0) -> dict:
+def stream_text_to_speech(text: str, voice: str = "", speed: float = 1.0, request: gr.Request = None):
+    """
+    流式文字转语音，服务端每合成一段就开始播放
+
+    Yields:
+        tuple: (音频片段 (采样率, 采样数组) 或 None, 状态消息)
+    """
+    if not text or not text.strip():
+        error_msg = "请输入要转换的文本"
+        gr.Warning(error_msg)
+        yield None, f"**Error:** {error_msg}"
+        return
+
+    try:
+        from .session import session_model_key
+
+        current_model_key = session_model_key(request)
+        if not is_online_model(current_model_key):
+            error_msg = "文字转语音功能仅支持在线模型，请先连接到在线服务器并选择模型"
+            gr.Warning(error_msg)
+            yield None, f"**Error:** {error_msg}"
+            return
+
+        model_id = get_online_model_id(current_model_key)
+        logger.info(f"使用在线模型进行流式文字转语音: {model_id}, 文本长度: {len(text)}")
+
+        seconds = 0.0
+        for sample_rate, samples in stream_speech(text, model_id, voice, speed, _request_client(request)):
+            seconds += len(samples) / sample_rate
+            yield (sample_rate, samples), f"正在合成... 已生成 {seconds:.1f} 秒音频"
+        yield gr.skip(), f"## 语音合成成功\n\n文本长度: {len(text)} 字符，音频时长: {seconds:.1f} 秒"
+
+    except Exception as e:
+        logger.error(f"流式文字转语音异常: {str(e)}", exc_info=True)
+        error_msg = f"处理失败: {str(e)}"
+        gr.Warning(error_msg)
+        yield None, f"**Error:** {error_msg}"
+
+
+def parse_wav_header(data: bytes) -> tuple[int, int, int] | None:
+    """
+    解析 WAV 头，返回 (采样率, 声道数, 音频数据起始位置)；数据不足时返回 None
+    流式 WAV 的长度字段为 0xFFFFFFFF，这里不依赖长度字段
+    """
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("服务端返回的不是 WAV 音频")
+    pos, sample_rate, channels = 12, None, 1
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack("<4sI", data[pos : pos + 8])
+        if chunk_id == b"data":
+            return (sample_rate, channels, pos + 8) if sample_rate else None
+        if chunk_id == b"fmt ":
+            if pos + 24 > len(data):
+                return None
+            channels, sample_rate = struct.unpack("<HI", data[pos + 10 : pos + 16])
+        pos += 8 + size + (size & 1)
+    return None
+
+
+def stream_speech(text: str, model: str = "tts-1", voice: str = "", speed: float = 1.0, client: OnlineClient | None = None) -> Iterator[tuple[int, np.ndarray]]:
+    """
+    请求流式 WAV（stream=true），边接收边返回 16 位 PCM 片段
+    不支持流式的服务端会一次性返回完整 WAV，同样可以解析
+
+    Yields:
+        tuple[int, np.ndarray]: (采样率, 采样数组)
+    """
+    client = client or online_client
+    payload = {"model": model, "input": text, "voice": voice, "speed": speed, "response_format": "wav", "stream": True}
+    url = f"{client.base_url}/audio/speech"
+    logger.info(f"发送流式语音合成请求到: {url}")
+
+    with client.session.post(url, json=payload, stream=True, timeout=120) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text}")
+
+        buffer = b""
+        header = None
+        for chunk in response.iter_content(chunk_size=None):
+            buffer += chunk
+            if header is None:
+                header = parse_wav_header(buffer)
+                if header is None:
+                    continue
+                buffer = buffer[header[2] :]
+            sample_rate, channels, _ = header
+            frame_bytes = 2 * channels
+            if len(buffer) >= sample_rate * frame_bytes * STREAM_CHUNK_SECONDS:
+                usable = len(buffer) - len(buffer) % frame_bytes
+                yield sample_rate, np.frombuffer(buffer[:usable], dtype="<i2").reshape(-1, channels).squeeze()
+                buffer = buffer[usable:]
+
+        if header is None:
+            raise RuntimeError("服务端返回的音频不完整")
+        sample_rate, channels, _ = header
+        usable = len(buffer) - len(buffer) % (2 * channels)
+        if usable:
+            yield sample_rate, np.frombuffer(buffer[:usable], dtype="<i2").reshape(-1, channels).squeeze()
+
+
+def synthesize_speech(text: str, model: str = "tts-1", voice: str = "", speed: float = 1.0, client: OnlineClient | None = None) -> dict:
     """
     使用 OpenAI 兼容的 API 进行语音合成
 
@@ -235,19 +363,21 @@ def synthesize_speech(text: str, model: str = "tts-1", voice: str = "", speed: f
         model: 模型名称，默认为 tts-1
         voice: 语音类型
         speed: 语速
+        client: 在线服务客户端，默认使用全局客户端
 
     Returns:
         dict: 包含 success 和 audio_path/error 的字典
     """
+    client = client or online_client
     try:
         # 准备请求数据
         payload = {"model": model, "input": text, "voice": voice, "speed": speed}
 
         # 调用 OpenAI 兼容的 /audio/speech 端点
-        url = f"{online_client.base_url}/audio/speech"
+        url = f"{client.base_url}/audio/speech"
         logger.info(f"发送语音合成请求到: {url}")
 
-        response = online_client.session.post(url, json=payload, timeout=120)
+        response = client.session.post(url, json=payload, timeout=120)
 
         if response.status_code == 200:
             # 保存音频文件到临时目录
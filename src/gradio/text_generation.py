@@ -2,51 +2,51 @@
 文本生成功能模块
 """
 
+from __future__ import annotations
+
 import time
 from threading import Thread
 
 from loguru import logger
-from transformers import TextIteratorStreamer
+from transformers import DynamicCache, TextIteratorStreamer
+
+import gradio as gr
 
+from ..chat_session import ChatSession, chat_session_store, common_prefix_length
+from ..device_placement import input_device
 from ..model_manager import model_manager
-from .online_client import get_online_model_id, is_online_model, online_client
+from .online_client import OnlineClient, get_online_model_id, is_online_model, online_client
+from .session import session_client, session_model_key, update_session
 
 
 # @spaces.GPU  # 暂时注释掉装饰器
-def generate_text(text: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
-    """纯文本生成函数，支持本地和在线模型"""
-    current_model_key = model_manager.current_model_key
+def generate_text(text: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, request: gr.Request = None):
+    """纯文本生成函数，支持本地和在线模型，使用会话选择的模型"""
+    current_model_key = session_model_key(request)
+    session_id = request.session_hash if request is not None else None
 
     # 检查是否为在线模型
     if is_online_model(current_model_key):
-        yield from _generate_text_online(text, current_model_key, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+        yield from _generate_text_online(text, current_model_key, max_new_tokens, temperature, top_p, top_k, repetition_penalty, session_id, session_client(request))
     else:
-        yield from _generate_text_local(text, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+        yield from _generate_text_local(text, max_new_tokens, temperature, top_p, top_k, repetition_penalty, session_id, current_model_key)
 
 
-def _generate_text_local(text: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
+def _generate_text_local(text: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, session_id: str | None = None, model_key: str | None = None):
     """本地模型文本生成"""
-    current_model = model_manager.get_current_model()
-    current_processor = model_manager.get_current_processor()
+    current_model_key = model_key or model_manager.current_model_key
 
-    if current_model is None or current_processor is None:
-        yield "模型未加载", "模型未加载"
+    if not model_manager.ensure_loaded(current_model_key):
+        yield "模型加载失败", "模型加载失败"
         return
 
     try:
         # 构建消息
         messages = [{"role": "user", "content": text}]
-        prompt_full = current_processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = current_processor(text=[prompt_full], return_tensors="pt", padding=True).to(next(current_model.parameters()).device)
-
-        streamer = TextIteratorStreamer(current_processor, skip_prompt=True, skip_special_tokens=True)
-        generation_kwargs = {**inputs, "streamer": streamer, "max_new_tokens": max_new_tokens, "do_sample": True, "temperature": temperature, "top_p": top_p, "top_k": top_k, "repetition_penalty": repetition_penalty}
-
-        thread = Thread(target=current_model.generate, kwargs=generation_kwargs)
-        thread.start()
+        generation_kwargs = {"max_new_tokens": max_new_tokens, "do_sample": True, "temperature": temperature, "top_p": top_p, "top_k": top_k, "repetition_penalty": repetition_penalty, "session_id": session_id}
 
         buffer = ""
-        for new_text in streamer:
+        for new_text in model_manager.stream_generate(current_model_key, messages, **generation_kwargs):
             buffer += new_text
             time.sleep(0.01)
             yield buffer, buffer
@@ -56,7 +56,9 @@ def _generate_text_local(text: str, max_new_tokens: int = 1024, temperature: flo
         yield f"生成出错: {str(e)}", f"生成出错: {str(e)}"
 
 
-def _generate_text_online(text: str, model_key: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2):
+def _generate_text_online(
+    text: str, model_key: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, session_id: str | None = None, client: OnlineClient | None = None
+):
     """在线模型文本生成"""
     try:
         model_id = get_online_model_id(model_key)
@@ -67,7 +69,7 @@ def _generate_text_online(text: str, model_key: str, max_new_tokens: int = 1024,
 
         # 使用流式生成
         buffer = ""
-        for chunk in online_client.stream_generate_text(model_id, text, **params):
+        for chunk in (client or online_client).stream_generate_text(model_id, text, session_id=session_id, **params):
             if chunk:
                 buffer += chunk
                 yield buffer, buffer
@@ -77,17 +79,142 @@ def _generate_text_online(text: str, model_key: str, max_new_tokens: int = 1024,
         yield f"生成出错: {str(e)}", f"生成出错: {str(e)}"
 
 
-def switch_model(model_key: str) -> str:
-    """切换模型，支持本地和在线模型"""
+def generate_chat(text: str, history: list | None, session_id: str, max_new_tokens: int = 1024, temperature: float = 0.6, top_p: float = 0.9, top_k: int = 50, repetition_penalty: float = 1.2, request: gr.Request = None):
+    """多轮对话生成，返回 (对话历史, 会话ID)"""
+    history = history or []
+    if not text or not text.strip():
+        yield history, session_id
+        return
+
+    session_id = session_id or chat_session_store.new_session_id()
+    current_model_key = session_model_key(request)
+    session = chat_session_store.get_or_create(session_id, current_model_key)
+    if not session.messages and history:
+        # 会话由其它实例创建（或已被淘汰）时，从界面保存的历史恢复；KV cache 只是本实例的加速
+        session.messages = [{"role": m["role"], "content": m["content"]} for m in history if isinstance(m, dict) and m.get("role") in ("user", "assistant")]
+    session.messages.append({"role": "user", "content": text})
+
+    if is_online_model(current_model_key):
+        chunks = _generate_chat_online(session, max_new_tokens, temperature, top_p, top_k, repetition_penalty, session_client(request))
+    elif model_manager.worker is not None:
+        chunks = _generate_chat_worker(session, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+    else:
+        chunks = _generate_chat_local(session, max_new_tokens, temperature, top_p, top_k, repetition_penalty)
+
+    buffer = ""
+    try:
+        for buffer in chunks:
+            yield [*session.messages, {"role": "assistant", "content": buffer}], session_id
+    except Exception as e:
+        logger.error(f"对话生成出错: {str(e)}")
+        session.messages.pop()
+        session.drop_cache()
+        yield [*session.messages, {"role": "user", "content": text}, {"role": "assistant", "content": f"生成出错: {str(e)}"}], session_id
+        return
+
+    session.messages.append({"role": "assistant", "content": buffer})
+    session.touch()
+    yield list(session.messages), session_id
+
+
+def _generate_chat_local(session: ChatSession, max_new_tokens: int, temperature: float, top_p: float, top_k: int, repetition_penalty: float):
+    """本地模型多轮对话：复用上一轮的 KV cache，只 prefill 新增的 token"""
+    with model_manager.loaded(session.model_key) as (current_model, current_processor):
+        prompt_full = current_processor.apply_chat_template(session.messages, tokenize=False, add_generation_prompt=True)
+        inputs = current_processor(text=[prompt_full], return_tensors="pt", padding=True).to(input_device(current_model))
+        input_ids = inputs["input_ids"][0].tolist()
+
+        generation_kwargs = {**inputs, "max_new_tokens": max_new_tokens, "do_sample": True, "temperature": temperature, "top_p": top_p, "top_k": top_k, "repetition_penalty": repetition_penalty, "return_dict_in_generate": True}
+
+        if session.past_key_values is not None:
+            # 聊天模板对历史回复的渲染可能与生成时的 token 不完全一致，只复用公共前缀，且至少留一个 token 做 prefill
+            prefix_len = min(common_prefix_length(session.cached_token_ids, input_ids), len(input_ids) - 1)
+            if prefix_len > 0:
+                session.past_key_values.crop(prefix_len)
+                generation_kwargs["past_key_values"] = session.past_key_values
+                logger.debug(f"会话 {session.session_id} 复用 {prefix_len} 个 token 的 KV cache，新增 prefill {len(input_ids) - prefix_len} 个 token")
+            else:
+                session.drop_cache()
+        if "past_key_values" not in generation_kwargs:
+            # 显式使用动态 cache，保证能跨轮次保存和裁剪
+            generation_kwargs["past_key_values"] = DynamicCache()
+
+        streamer = TextIteratorStreamer(current_processor, skip_prompt=True, skip_special_tokens=True)
+        generation_kwargs["streamer"] = streamer
+        result = {}
+
+        def _run():
+            try:
+                result["output"] = model_manager.generate(session.model_key, session_id=session.session_id, **generation_kwargs)
+            except Exception as e:
+                result["error"] = e
+                streamer.end()
+
+        thread = Thread(target=_run)
+        thread.start()
+
+        buffer = ""
+        for new_text in streamer:
+            buffer += new_text
+            yield buffer
+        thread.join()
+
+        if "error" in result:
+            raise result["error"]
+
+        output = result["output"]
+        cache = output.past_key_values
+        if cache is not None:
+            cache_len = cache.get_seq_length()
+            chat_session_store.update_cache(session, cache, output.sequences[0][:cache_len].tolist())
+        yield buffer
+
+
+def _generate_chat_worker(session: ChatSession, max_new_tokens: int, temperature: float, top_p: float, top_k: int, repetition_penalty: float):
+    """进程外推理的多轮对话：KV cache 不跨进程保存，每轮发送完整历史"""
+    if not model_manager.ensure_loaded(session.model_key):
+        raise RuntimeError("模型加载失败")
+    params = {"max_new_tokens": max_new_tokens, "do_sample": True, "temperature": temperature, "top_p": top_p, "top_k": top_k, "repetition_penalty": repetition_penalty}
+
+    buffer = ""
+    for new_text in model_manager.stream_generate(session.model_key, list(session.messages), session_id=session.session_id, **params):
+        buffer += new_text
+        yield buffer
+
+
+def _generate_chat_online(session: ChatSession, max_new_tokens: int, temperature: float, top_p: float, top_k: int, repetition_penalty: float, client: OnlineClient | None = None):
+    """在线模型多轮对话：每轮发送完整历史"""
+    model_id = get_online_model_id(session.model_key)
+    params = {"max_tokens": max_new_tokens, "temperature": temperature, "top_p": top_p, "top_k": top_k, "repetition_penalty": repetition_penalty}
+
+    buffer = ""
+    for chunk in (client or online_client).stream_generate_text(model_id, list(session.messages), session_id=session.session_id, **params):
+        if chunk:
+            buffer += chunk
+            yield buffer
+
+
+def clear_chat(session_id: str):
+    """清空当前会话"""
+    if session_id:
+        chat_session_store.reset(session_id)
+    return [], ""
+
+
+def switch_model(model_key: str, request: gr.Request = None) -> str:
+    """切换模型，支持本地和在线模型；有会话时只改变该会话选择的模型"""
     if is_online_model(model_key):
         # 在线模型切换
         try:
             model_id = get_online_model_id(model_key)
-            model_info = online_client.get_model_info(model_id)
+            model_info = session_client(request).get_model_info(model_id)
             model_name = model_info.get("name", model_id) if model_info else model_id
 
-            # 更新当前模型key（不实际加载模型）
-            model_manager.current_model_key = model_key
+            # 更新会话选择的模型（不实际加载模型）；没有会话时更新进程默认模型
+            if request is not None:
+                update_session(request, model_key=model_key)
+            else:
+                model_manager.current_model_key = model_key
 
             logger.info(f"已切换到在线模型: {model_name}")
             return f"已切换到在线模型: {model_name}"
@@ -95,8 +222,10 @@ def switch_model(model_key: str) -> str:
             logger.error(f"在线模型切换失败: {e}")
             return f"在线模型切换失败: {str(e)}"
     # 本地模型切换
-    elif model_manager.switch_model(model_key):
-        model_info = model_manager.get_current_model_info()
+    elif model_manager.ensure_loaded(model_key) if request is not None else model_manager.switch_model(model_key):
+        if request is not None:
+            update_session(request, model_key=model_key)
+        model_info = model_manager.get_available_models().get(model_key, {})
         logger.info(f"已切换到本地模型: {model_info.get('name', 'Unknown')}")
         return f"已切换到本地模型: {model_info.get('name', 'Unknown')}"
     else:
@@ -104,8 +233,8 @@ def switch_model(model_key: str) -> str:
         return "模型切换失败"
 
 
-def connect_to_online_server(server_url: str) -> dict:
+def connect_to_online_server(server_url: str, client: OnlineClient | None = None) -> dict:
     """连接到在线服务器"""
     from .online_client import connect_to_server
 
-    return connect_to_server(server_url)
+    return connect_to_server(server_url, client)
@@ -2,46 +2,73 @@
 Gradio UI组件
 """
 
+from __future__ import annotations
+
+import uuid
+
 import gradio as gr
 
+from .background_jobs import cancel_job, follow_job, list_jobs, retry_job, submit_embeddings_job, submit_pdf_job, submit_tts_job, submit_video_job
 from .jina_tools import generate_embeddings, read_url, rerank_documents, search_web
 from .multimodal_generation import DEFAULT_MAX_NEW_TOKENS, MAX_MAX_NEW_TOKENS, generate_caption, generate_gif, generate_image, generate_pdf, generate_video, get_initial_pdf_state, load_and_preview_pdf, navigate_pdf_page
-from .online_client import is_online_model
-from .speech import generate_speech_to_text, generate_text_to_speech, get_available_voices
+from .online_client import client_for, is_online_model
+from .queue_config import concurrency_limits, configure_queue, event_options
+from .session import session_client, session_model_key, session_state, update_session
+from .speech import generate_speech_to_text, get_available_voices, stream_text_to_speech
+from .text_generation import clear_chat, generate_chat, generate_text, switch_model
 from .text_generation import connect_to_online_server as connect_to_server
-from .text_generation import generate_text, switch_model
 from .theme import css, get_theme
 
 default_online_url = "http://localhost:8080/v1"
 
 
-def handle_set_api_key(api_key: str):
-    """处理设置 API Key"""
-    from loguru import logger
+def _bind_by_backend(triggers, group: str, limits: dict[str, int], **event) -> list:
+    """按会话所选模型的后端绑定事件：本地模型和在线服务各用一个并发组（<group>_local / <group>_online）
+
+    Gradio 的并发组在绑定时确定，所以触发后先由不排队的分派函数写入对应后端的隐藏中继组件，
+    再由中继组件的 change 事件在该后端的并发组中执行。返回两个中继事件，便于继续链式绑定
+    """
+    local_relay = gr.Textbox(visible=False)
+    online_relay = gr.Textbox(visible=False)
+
+    def dispatch(request: gr.Request = None):
+        token = uuid.uuid4().hex
+        if is_online_model(session_model_key(request)):
+            return gr.skip(), token
+        return token, gr.skip()
 
-    from .online_client import online_client
+    for trigger in triggers:
+        trigger(fn=dispatch, outputs=[local_relay, online_relay], queue=False, show_progress="hidden", show_api=False)
+    return [local_relay.change(**event, **event_options(f"{group}_local", limits)), online_relay.change(**event, **event_options(f"{group}_online", limits))]
+
+
+def handle_set_api_key(api_key: str, request: gr.Request = None):
+    """处理设置 API Key（只作用于当前会话）"""
+    from loguru import logger
 
     if api_key and api_key.strip():
-        online_client.set_api_key(api_key.strip())
+        update_session(request, api_key=api_key.strip())
         logger.info("API Key 已更新")
         gr.Info("✅ API Key 已设置")
         return '<div style="padding:6px 10px;border-radius:6px;background:#e8f5e9;color:#1b5e20;">🔑 API Key 已设置</div>'
     else:
-        online_client.set_api_key("")
+        update_session(request, api_key="")
         logger.info("API Key 已清除")
         gr.Info("API Key 已清除")
         return '<div style="padding:6px 10px;border-radius:6px;background:#fff3e0;color:#e65100;">⚠️ API Key 已清除</div>'
 
 
-def handle_connect_server(server_url: str):
-    """处理连接服务器"""
+def handle_connect_server(server_url: str, request: gr.Request = None):
+    """处理连接服务器；服务地址保存在会话状态中，不影响其它会话"""
     from loguru import logger
 
     # 强制打印，确保函数被调用
     print(f"\n{'=' * 50}\n[CONNECT] handle_connect_server called with URL: {server_url}\n{'=' * 50}\n", flush=True)
     logger.debug(f"[UI] 连接服务器：{server_url}")
     try:
-        result = connect_to_server(server_url)
+        result = connect_to_server(server_url, client_for(server_url, session_state(request).api_key))
+        if result.get("success"):
+            update_session(request, server_url=server_url.rstrip("/"))
         logger.info(f"[UI] handle_connect_server called, url={server_url}, success={result.get('success')}, error={result.get('error')}")
         logger.debug(f"[UI] 连接服务器结果: {result}")
     except Exception as exc:  # 捕获并显示异常，避免静默失败
@@ -70,8 +97,8 @@ def handle_connect_server(server_url: str):
         )
 
 
-def handle_use_online_model(online_model_key: str):
-    """处理使用在线模型"""
+def handle_use_online_model(online_model_key: str, request: gr.Request = None):
+    """处理使用在线模型（只切换当前会话的模型）"""
     from loguru import logger
 
     logger.info(f"handle_use_online_model 被调用，模型: {online_model_key}")
@@ -80,7 +107,7 @@ def handle_use_online_model(online_model_key: str):
         gr.Warning("请先选择在线模型")
         return gr.Textbox(), gr.Dropdown()
 
-    switch_model(online_model_key)
+    switch_model(online_model_key, request)
     gr.Info(f"已切换到在线模型: {online_model_key.split(':', 1)[1]}")
 
     # 更新当前模型显示
@@ -93,7 +120,7 @@ def handle_use_online_model(online_model_key: str):
     if "indextts2" in model_name or "tts" in model_name:
         logger.info("检测到 TTS 模型，开始获取语音列表...")
         # 自动请求语音列表
-        voices_result = get_available_voices()
+        voices_result = get_available_voices(session_client(request))
         logger.info(f"语音列表结果: {voices_result}")
         if voices_result.get("success"):
             voices = voices_result.get("voices", [])
@@ -121,9 +148,9 @@ def update_model_status(model_key: str):
         return "当前模型: 未连接在线模型"
 
 
-def update_tts_voices():
+def update_tts_voices(request: gr.Request = None):
     """更新 TTS 声音列表"""
-    result = get_available_voices()
+    result = get_available_voices(session_client(request))
     if result.get("success"):
         voices = result.get("voices", [])
         return gr.Dropdown(choices=voices, value=voices[0] if voices else "alloy")
@@ -138,6 +165,7 @@ def create_interface():
 
     with gr.Blocks(theme=get_theme(), css=css) as demo:
         pdf_state = gr.State(value=get_initial_pdf_state())
+        chat_session_id = gr.State(value="")
         gr.Markdown("# LLM Web UI", elem_id="main-title")
 
         # 模型选择区域
@@ -173,8 +201,16 @@ def create_interface():
                     top_p = gr.Slider(label="Top-p (nucleus sampling)", minimum=0.05, maximum=1.0, step=0.05, value=0.9, scale=1)
                     top_k = gr.Slider(label="Top-k", minimum=1, maximum=1000, step=1, value=50, scale=1)
                     repetition_penalty = gr.Slider(label="Repetition penalty", minimum=1.0, maximum=2.0, step=0.05, value=1.2, scale=1)
+                    kv_cache_mode = gr.Dropdown(label="KV cache mode", choices=["auto", "dynamic", "quantized", "offloaded", "sliding_window"], value="auto", info="本地模型长上下文（视频/PDF/GIF）的 KV cache 策略", scale=1)
                 text_submit = gr.Button("Submit", variant="primary", scale=1)
 
+            with gr.TabItem("Chat"), gr.Column():
+                chatbot = gr.Chatbot(type="messages", label="Chat", height=420)
+                chat_input = gr.Textbox(label="Message", placeholder="Enter your message here...", lines=2, scale=3)
+                with gr.Row():
+                    chat_submit = gr.Button("Send", variant="primary", scale=1)
+                    chat_clear = gr.Button("Clear", variant="secondary", scale=1)
+
             with gr.TabItem("Image Inference"), gr.Column():
                 image_query = gr.Textbox(label="Query Input", placeholder="Enter your query here...", scale=2)
                 image_upload = gr.Image(type="pil", label="Image", height=290, scale=1)
@@ -183,13 +219,17 @@ def create_interface():
             with gr.TabItem("Video Inference"), gr.Column():
                 video_query = gr.Textbox(label="Query Input", placeholder="Enter your query here...", scale=2)
                 video_upload = gr.Video(label="Video", height=290, scale=1)
-                video_submit = gr.Button("Submit", variant="primary", scale=1)
+                with gr.Row():
+                    video_submit = gr.Button("Submit", variant="primary", scale=1)
+                    video_job_submit = gr.Button("后台运行", variant="secondary", scale=1)
 
             with gr.TabItem("PDF Inference"), gr.Row():
                 with gr.Column(scale=1):
                     pdf_query = gr.Textbox(label="Query Input", placeholder="e.g., 'Summarize this document'")
                     pdf_upload = gr.File(label="Upload PDF", file_types=[".pdf"])
-                    pdf_submit = gr.Button("Submit", variant="primary")
+                    with gr.Row():
+                        pdf_submit = gr.Button("Submit", variant="primary")
+                        pdf_job_submit = gr.Button("后台运行", variant="secondary")
                 with gr.Column(scale=1):
                     pdf_preview_img = gr.Image(label="PDF Preview", height=290)
                     with gr.Row():
@@ -215,8 +255,10 @@ def create_interface():
                 with gr.Row():
                     tts_voice = gr.Dropdown(choices=[], value="", label="Voice", scale=1)
                     tts_speed = gr.Slider(label="Speed", minimum=0.25, maximum=4.0, step=0.25, value=1.0, scale=1)
-                tts_submit = gr.Button("Generate Speech", variant="primary", scale=1)
-                tts_audio_output = gr.Audio(label="Generated Audio", type="filepath", show_download_button=True, scale=1)
+                with gr.Row():
+                    tts_submit = gr.Button("Generate Speech", variant="primary", scale=1)
+                    tts_job_submit = gr.Button("后台运行（长文本）", variant="secondary", scale=1)
+                tts_audio_output = gr.Audio(label="Generated Audio", streaming=True, autoplay=True, show_download_button=True, scale=1)
 
             with gr.TabItem("Embeddings"), gr.Column():
                 gr.Markdown("### 文本向量化\n将文本转换为向量表示，每行一个文本")
@@ -230,7 +272,9 @@ def create_interface():
                         label="输出数据类型 (encoding_format)",
                         info="float: 浮点数 | int8/uint8: 整数 | base64: 字符串",
                     )
-                embeddings_submit = gr.Button("生成 Embeddings", variant="primary", scale=1)
+                with gr.Row():
+                    embeddings_submit = gr.Button("生成 Embeddings", variant="primary", scale=1)
+                    embeddings_job_submit = gr.Button("后台运行（批量）", variant="secondary", scale=1)
 
             with gr.TabItem("Rerank"), gr.Column():
                 gr.Markdown("### 文档重排序\n根据查询相关性对文档进行排序")
@@ -264,6 +308,17 @@ def create_interface():
                         reader_with_links = gr.Checkbox(label="包含链接摘要 (X-With-Links-Summary)", value=False)
                 reader_submit = gr.Button("读取", variant="primary", scale=1)
 
+            with gr.TabItem("Jobs"), gr.Column():
+                gr.Markdown("### 后台任务\n长任务在服务端执行，关闭页面不会中断；重启后从最后完成的单元继续")
+                with gr.Row():
+                    job_id_input = gr.Textbox(label="任务 ID", scale=3)
+                    job_follow_btn = gr.Button("查看进度", variant="primary", scale=1)
+                    job_cancel_btn = gr.Button("取消", variant="secondary", scale=1)
+                    job_retry_btn = gr.Button("重试", variant="secondary", scale=1)
+                job_files = gr.File(label="任务文件", file_count="multiple", interactive=False)
+                jobs_refresh_btn = gr.Button("刷新任务列表", variant="secondary")
+                jobs_table = gr.Dataframe(headers=["任务 ID", "类型", "状态", "进度", "错误"], interactive=False)
+
         # 输出行 - 左右布局
         with gr.Row():
             with gr.Column(scale=1):
@@ -272,11 +327,19 @@ def create_interface():
             with gr.Column(scale=1), gr.Accordion("(Result.md)", open=False):
                 markdown_output = gr.Markdown(label="(Result.Md)", latex_delimiters=[{"left": "$$", "right": "$$", "display": True}, {"left": "$", "right": "$", "display": False}])
 
-        # 事件绑定
-        # 文本生成事件绑定
-        text_submit.click(fn=generate_text, inputs=[text_query, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
-        # 支持 Ctrl+Enter 快捷键
-        text_query.submit(fn=generate_text, inputs=[text_query, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        # 事件绑定：按后端容量划分并发组，长任务不阻塞文本请求
+        limits = concurrency_limits()
+        long_job_events = event_options("long_job", limits)
+
+        # 文本生成事件绑定（支持 Ctrl+Enter 快捷键）
+        _bind_by_backend([text_submit.click, text_query.submit], "text", limits, fn=generate_text, inputs=[text_query, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+
+        # 多轮对话事件绑定：生成结束后清空输入框
+        chat_inputs = [chat_input, chatbot, chat_session_id, max_new_tokens, temperature, top_p, top_k, repetition_penalty]
+        chat_events = _bind_by_backend([chat_submit.click, chat_input.submit], "text", limits, fn=generate_chat, inputs=chat_inputs, outputs=[chatbot, chat_session_id])
+        for chat_event in chat_events:
+            chat_event.then(fn=lambda: "", outputs=[chat_input], queue=False)
+        chat_clear.click(fn=clear_chat, inputs=[chat_session_id], outputs=[chatbot, chat_session_id])
 
         # 模型切换事件绑定
         # switch_model_btn.click(fn=switch_model, inputs=[model_dropdown], outputs=[current_model_display])
@@ -299,39 +362,50 @@ def create_interface():
         use_online_model_btn.click(fn=handle_use_online_model, inputs=[online_model_dropdown], outputs=[current_model_display, tts_voice])
 
         # 多模态事件绑定
-        image_submit.click(fn=generate_image, inputs=[image_query, image_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
-        # 支持 Ctrl+Enter 快捷键
-        image_query.submit(fn=generate_image, inputs=[image_query, image_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        # 图像理解（支持 Ctrl+Enter 快捷键）
+        _bind_by_backend([image_submit.click, image_query.submit], "vision", limits, fn=generate_image, inputs=[image_query, image_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
 
-        video_submit.click(fn=generate_video, inputs=[video_query, video_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        video_submit.click(fn=generate_video, inputs=[video_query, video_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode], outputs=[output, markdown_output], **long_job_events)
         # 支持 Ctrl+Enter 快捷键
-        video_query.submit(fn=generate_video, inputs=[video_query, video_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        video_query.submit(fn=generate_video, inputs=[video_query, video_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode], outputs=[output, markdown_output], **long_job_events)
 
-        pdf_submit.click(fn=generate_pdf, inputs=[pdf_query, pdf_state, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        pdf_submit.click(fn=generate_pdf, inputs=[pdf_query, pdf_state, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode], outputs=[output, markdown_output], **long_job_events)
         # 支持 Ctrl+Enter 快捷键
-        pdf_query.submit(fn=generate_pdf, inputs=[pdf_query, pdf_state, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        pdf_query.submit(fn=generate_pdf, inputs=[pdf_query, pdf_state, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode], outputs=[output, markdown_output], **long_job_events)
 
-        gif_submit.click(fn=generate_gif, inputs=[gif_query, gif_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        gif_submit.click(fn=generate_gif, inputs=[gif_query, gif_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode], outputs=[output, markdown_output], **long_job_events)
         # 支持 Ctrl+Enter 快捷键
-        gif_query.submit(fn=generate_gif, inputs=[gif_query, gif_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        gif_query.submit(fn=generate_gif, inputs=[gif_query, gif_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode], outputs=[output, markdown_output], **long_job_events)
 
-        caption_submit.click(fn=generate_caption, inputs=[caption_image_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
+        _bind_by_backend([caption_submit.click], "vision", limits, fn=generate_caption, inputs=[caption_image_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty], outputs=[output, markdown_output])
 
-        speech_submit.click(fn=generate_speech_to_text, inputs=[audio_input], outputs=[output, markdown_output])
+        speech_submit.click(fn=generate_speech_to_text, inputs=[audio_input], outputs=[output, markdown_output], **event_options("asr", limits))
 
-        tts_submit.click(fn=generate_text_to_speech, inputs=[tts_text_input, tts_voice, tts_speed], outputs=[tts_audio_output, markdown_output])
+        tts_submit.click(fn=stream_text_to_speech, inputs=[tts_text_input, tts_voice, tts_speed], outputs=[tts_audio_output, markdown_output], **event_options("tts", limits))
 
         # Embeddings 事件绑定
-        embeddings_submit.click(fn=generate_embeddings, inputs=[embeddings_text_input, embeddings_model, embeddings_task, embeddings_encoding], outputs=[output, markdown_output])
+        embeddings_submit.click(fn=generate_embeddings, inputs=[embeddings_text_input, embeddings_model, embeddings_task, embeddings_encoding], outputs=[output, markdown_output], **event_options("tools", limits))
 
         # Rerank 事件绑定
-        rerank_submit.click(fn=rerank_documents, inputs=[rerank_query, rerank_docs_input, rerank_model, rerank_top_n], outputs=[output, markdown_output])
+        rerank_submit.click(fn=rerank_documents, inputs=[rerank_query, rerank_docs_input, rerank_model, rerank_top_n], outputs=[output, markdown_output], **event_options("tools", limits))
 
         # Search 事件绑定
-        search_submit.click(fn=search_web, inputs=[search_query, search_url, search_respond_with, search_with_images, search_with_links], outputs=[output, markdown_output])
+        search_submit.click(fn=search_web, inputs=[search_query, search_url, search_respond_with, search_with_images, search_with_links], outputs=[output, markdown_output], **event_options("tools", limits))
 
         # Reader 事件绑定
-        reader_submit.click(fn=read_url, inputs=[reader_url, reader_engine, reader_with_images, reader_with_links], outputs=[output, markdown_output])
+        reader_submit.click(fn=read_url, inputs=[reader_url, reader_engine, reader_with_images, reader_with_links], outputs=[output, markdown_output], **event_options("tools", limits))
+
+        # 后台任务事件绑定：提交后立即返回任务 ID，再持续显示进度（轮询本地存储，不占用模型并发）
+        follow_events = {"fn": follow_job, "inputs": [job_id_input], "outputs": [output, markdown_output, job_files], "concurrency_limit": None}
+        pdf_job_submit.click(fn=submit_pdf_job, inputs=[pdf_query, pdf_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode], outputs=[job_id_input, markdown_output], queue=False).success(**follow_events)
+        video_job_inputs = [video_query, video_upload, max_new_tokens, temperature, top_p, top_k, repetition_penalty, kv_cache_mode]
+        video_job_submit.click(fn=submit_video_job, inputs=video_job_inputs, outputs=[job_id_input, markdown_output], queue=False).success(**follow_events)
+        tts_job_submit.click(fn=submit_tts_job, inputs=[tts_text_input, tts_voice, tts_speed], outputs=[job_id_input, markdown_output], queue=False).success(**follow_events)
+        embeddings_job_submit.click(fn=submit_embeddings_job, inputs=[embeddings_text_input, embeddings_model, embeddings_task, embeddings_encoding], outputs=[job_id_input, markdown_output], queue=False).success(**follow_events)
+        job_follow_btn.click(**follow_events)
+        job_cancel_btn.click(fn=cancel_job, inputs=[job_id_input], outputs=[markdown_output], queue=False)
+        job_retry_btn.click(fn=retry_job, inputs=[job_id_input], outputs=[markdown_output], queue=False).success(**follow_events)
+        jobs_refresh_btn.click(fn=list_jobs, outputs=[jobs_table], queue=False)
 
         # PDF相关事件绑定
         pdf_upload.change(fn=load_and_preview_pdf, inputs=[pdf_upload], outputs=[pdf_preview_img, pdf_state, page_info])
@@ -340,4 +414,4 @@ def create_interface():
 
         next_page_btn.click(fn=lambda s: navigate_pdf_page("next", s), inputs=[pdf_state], outputs=[pdf_preview_img, pdf_state, page_info])
 
-    return demo
+    return configure_queue(demo)
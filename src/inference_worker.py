@@ -0,0 +1,317 @@
+"""
+进程外本地推理
+模型运行在独立的推理进程中，UI 进程只负责界面：
+- 请求通过 multiprocessing.connection（TCP + authkey）发送，token 文本流式返回；连接上传输的是 pickle，
+  自行启动的推理进程使用随机 authkey，地址不在本机时必须配置 authkey
+- 图像以 numpy 数组形式放入共享内存，只传递共享内存名称、形状和 dtype
+- 推理进程由 UI 进程监管，异常退出后自动重启并重新加载之前的模型
+- spawn: false 时连接外部启动的推理进程（python -m src.inference_worker），多个 UI 实例可共享同一个模型进程
+"""
+
+import argparse
+import secrets
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any
+
+import numpy as np
+from loguru import logger
+
+from src.utils.config import Config
+
+CONNECT_TIMEOUT_SECONDS = 120
+# 未配置 authkey 时，只在本机地址上使用的默认密钥
+DEFAULT_AUTHKEY = "llm-web-ui"
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """解析 "host:port" 形式的地址"""
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def resolve_authkey(configured: str | None, addresses: list[str], spawn: bool) -> bytes:
+    """确定连接推理进程的 authkey
+
+    - 配置了 authkey 时使用配置；地址不在本机时不允许使用公开的默认密钥
+    - 未配置且由本进程启动推理进程时生成随机密钥，只在父子进程之间传递
+    - 未配置且连接外部推理进程时，地址都在本机才使用默认密钥
+    """
+    remote = [address for address in addresses if parse_address(address)[0] not in LOOPBACK_HOSTS]
+    if configured:
+        if remote and configured == DEFAULT_AUTHKEY:
+            raise ValueError(f"推理进程地址 {', '.join(remote)} 不在本机，不能使用默认 authkey，请在 inference_worker.authkey 中设置密钥")
+        return configured.encode()
+    if spawn:
+        return secrets.token_hex(32).encode()
+    if remote:
+        raise ValueError(f"推理进程地址 {', '.join(remote)} 不在本机，请在 inference_worker.authkey 中设置与推理进程相同的密钥")
+    return DEFAULT_AUTHKEY.encode()
+
+
+def pack_arrays(arrays: list[np.ndarray]) -> tuple[list[dict[str, Any]], list[SharedMemory]]:
+    """把数组复制到共享内存，返回可通过连接发送的描述，以及需要由发送方释放的共享内存"""
+    descriptors, segments = [], []
+    for array in arrays:
+        contiguous = np.ascontiguousarray(array)
+        shm = SharedMemory(create=True, size=max(contiguous.nbytes, 1))
+        np.ndarray(contiguous.shape, dtype=contiguous.dtype, buffer=shm.buf)[...] = contiguous
+        descriptors.append({"name": shm.name, "shape": contiguous.shape, "dtype": contiguous.dtype.str})
+        segments.append(shm)
+    return descriptors, segments
+
+
+def unpack_arrays(descriptors: list[dict[str, Any]]) -> list[np.ndarray]:
+    """从共享内存读取数组（复制一份，之后发送方即可释放共享内存）"""
+    arrays = []
+    for descriptor in descriptors:
+        shm = SharedMemory(name=descriptor["name"])
+        # 共享内存由发送方负责释放，避免本进程的 resource_tracker 重复清理
+        resource_tracker.unregister(shm._name, "shared_memory")
+        try:
+            arrays.append(np.ndarray(descriptor["shape"], dtype=np.dtype(descriptor["dtype"]), buffer=shm.buf).copy())
+        finally:
+            shm.close()
+    return arrays
+
+
+def release_arrays(segments: list[SharedMemory]):
+    for shm in segments:
+        shm.close()
+        with suppress(FileNotFoundError):
+            shm.unlink()
+
+
+class StopOnEvent:
+    """事件置位后让 generate 在下一个 token 结束的 stopping criteria（客户端断开时使用）"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def _handle_generate(conn: Connection, request: dict[str, Any], manager):
+    from PIL import Image
+
+    images = [Image.fromarray(array) for array in unpack_arrays(request.get("images", []))]
+    model_key = request["model_key"]
+    if manager.base_key(model_key) not in manager.models and not manager.load_model(model_key):
+        conn.send({"type": "error", "message": f"模型 '{model_key}' 加载失败"})
+        return
+
+    cancelled = threading.Event()
+    try:
+        for new_text in manager.stream_generate(model_key, request["messages"], images or None, cancel=cancelled, **request.get("generation", {})):
+            conn.send({"type": "token", "text": new_text})
+    except (BrokenPipeError, ConnectionResetError, EOFError):
+        cancelled.set()
+        logger.info("客户端已断开，取消生成")
+        return
+    conn.send({"type": "done"})
+
+
+def _handle_connection(conn: Connection, manager):
+    """处理单个连接上的请求，直到客户端关闭连接"""
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, ConnectionResetError):
+                return
+            try:
+                op = request.get("op")
+                if op == "generate":
+                    _handle_generate(conn, request, manager)
+                elif op == "load":
+                    conn.send({"type": "done", "ok": manager.base_key(request["model_key"]) in manager.models or manager.load_model(request["model_key"])})
+                elif op == "ping":
+                    conn.send({"type": "done", "models": list(manager.models)})
+                else:
+                    conn.send({"type": "error", "message": f"未知的请求类型: {op}"})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                logger.error(f"推理请求处理失败: {e}")
+                try:
+                    conn.send({"type": "error", "message": str(e)})
+                except OSError:
+                    return
+
+
+def serve(address: str, authkey: bytes):
+    """推理进程入口：加载模型管理器并监听请求"""
+    from src.model_manager import model_manager, model_reaper
+
+    if Config().get_config().get("model_reaper", {}).get("enabled", False):
+        model_reaper.start()
+
+    with Listener(parse_address(address), authkey=authkey) as listener:
+        logger.info(f"推理进程已启动，监听 {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.warning(f"拒绝连接: {e}")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn, model_manager), daemon=True).start()
+
+
+class InferenceWorkerSupervisor:
+    """推理进程的启动、监管和客户端"""
+
+    def __init__(self, addresses: list[str], authkey: bytes, spawn: bool = True, restart_backoff_seconds: float = 5):
+        self.addresses = addresses
+        self.authkey = authkey
+        self.spawn = spawn
+        self.restart_backoff_seconds = restart_backoff_seconds
+        # 已请求加载的模型，推理进程重启后重新加载
+        self.loaded_models: set[str] = set()
+        self._processes = {}
+        # 等待重启的推理进程地址 -> 重启时间
+        self._restart_at: dict[str, float] = {}
+        self._inflight = dict.fromkeys(addresses, 0)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls) -> "InferenceWorkerSupervisor | None":
+        worker_config = Config().get_config().get("inference_worker", {}) or {}
+        if not worker_config.get("enabled", False):
+            return None
+        host = worker_config.get("host", "127.0.0.1")
+        port = int(worker_config.get("port", 7870))
+        addresses = worker_config.get("addresses") or [f"{host}:{port + i}" for i in range(int(worker_config.get("workers", 1)))]
+        spawn = worker_config.get("spawn", True)
+        return cls(
+            addresses,
+            authkey=resolve_authkey(worker_config.get("authkey"), addresses, spawn),
+            spawn=spawn,
+            restart_backoff_seconds=worker_config.get("restart_backoff_seconds", 5),
+        )
+
+    def start(self):
+        if self.spawn:
+            for address in self.addresses:
+                self._spawn(address)
+            threading.Thread(target=self._monitor, daemon=True, name="inference-worker-monitor").start()
+        logger.info(f"本地推理使用独立进程: {', '.join(self.addresses)}")
+
+    def stop(self):
+        self._stop.set()
+        for process in self._processes.values():
+            process.terminate()
+
+    def _spawn(self, address: str):
+        process = get_context("spawn").Process(target=serve, args=(address, self.authkey), daemon=True, name=f"inference-worker-{address}")
+        process.start()
+        self._processes[address] = process
+        logger.info(f"推理进程已启动 (pid={process.pid}, {address})")
+
+    def _monitor(self):
+        """推理进程退出（崩溃、OOM）后重启，并重新加载之前的模型；各进程的重启等待互不阻塞"""
+        while not self._stop.wait(1):
+            now = time.monotonic()
+            for address, process in list(self._processes.items()):
+                if process.is_alive() or self._stop.is_set():
+                    continue
+                if address not in self._restart_at:
+                    logger.error(f"推理进程异常退出 (pid={process.pid}, exitcode={process.exitcode})，{self.restart_backoff_seconds}s 后重启")
+                    self._restart_at[address] = now + self.restart_backoff_seconds
+                if now < self._restart_at[address]:
+                    continue
+                del self._restart_at[address]
+                self._spawn(address)
+                for model_key in list(self.loaded_models):
+                    threading.Thread(target=self._request_load, args=(address, model_key), daemon=True).start()
+
+    @contextmanager
+    def _connect(self, address: str):
+        """连接推理进程；进程启动或重启期间重试"""
+        deadline = time.monotonic() + CONNECT_TIMEOUT_SECONDS
+        while True:
+            try:
+                conn = Client(parse_address(address), authkey=self.authkey)
+                break
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"无法连接推理进程 {address}") from None
+                time.sleep(0.5)
+        with conn:
+            yield conn
+
+    @contextmanager
+    def _acquire(self) -> Iterator[str]:
+        """选择进行中请求最少的推理进程"""
+        with self._lock:
+            address = min(self.addresses, key=lambda a: self._inflight[a])
+            self._inflight[address] += 1
+        try:
+            yield address
+        finally:
+            with self._lock:
+                self._inflight[address] -= 1
+
+    def _request_load(self, address: str, model_key: str) -> bool:
+        with self._connect(address) as conn:
+            conn.send({"op": "load", "model_key": model_key})
+            response = conn.recv()
+        return response.get("type") == "done" and bool(response.get("ok"))
+
+    def load(self, model_key: str) -> bool:
+        """在所有推理进程中加载模型"""
+        ok = all(self._request_load(address, model_key) for address in self.addresses)
+        if ok:
+            self.loaded_models.add(model_key)
+        return ok
+
+    def is_loaded(self, model_key: str) -> bool:
+        return model_key in self.loaded_models
+
+    def stream(self, model_key: str, messages: list[dict[str, Any]], images: list | None = None, *, cancel: threading.Event | None = None, **generation_kwargs) -> Iterator[str]:
+        """发送生成请求并逐段返回文本；cancel 置位后关闭连接，推理进程随之停止生成"""
+        descriptors, segments = pack_arrays([np.asarray(image.convert("RGB")) for image in images or []])
+        try:
+            with self._acquire() as address, self._connect(address) as conn:
+                conn.send({"op": "generate", "model_key": model_key, "messages": messages, "images": descriptors, "generation": generation_kwargs})
+                while True:
+                    try:
+                        response = conn.recv()
+                    except (EOFError, ConnectionResetError):
+                        raise RuntimeError("推理进程连接中断，进程可能已退出并正在重启") from None
+                    if response["type"] == "token":
+                        if cancel is not None and cancel.is_set():
+                            return
+                        yield response["text"]
+                    elif response["type"] == "done":
+                        return
+                    else:
+                        raise RuntimeError(response.get("message", "推理失败"))
+        finally:
+            release_arrays(segments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="独立启动本地推理进程，供一个或多个 UI 实例共享")
+    worker_config = Config().get_config().get("inference_worker", {}) or {}
+    parser.add_argument("--address", default=f"{worker_config.get('host', '127.0.0.1')}:{worker_config.get('port', 7870)}")
+    parser.add_argument("--authkey", default=worker_config.get("authkey"), help="连接认证密钥；监听地址不在本机时必须设置")
+    args = parser.parse_args()
+    try:
+        authkey = resolve_authkey(args.authkey, [args.address], spawn=False)
+    except ValueError as e:
+        parser.error(str(e))
+    serve(args.address, authkey)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+后台任务
+PDF 多页分析、长文本语音合成、批量 embeddings、视频推理等长任务不再依附于单个浏览器连接：
+- submit 立即返回任务 ID，任务由固定数量的工作线程执行
+- 每个任务拆分为若干单元（PDF 的一页、一段文本、一批 embeddings），每完成一个单元就写入 SQLite，
+  上传的输入文件和生成的文件保存在任务目录中
+- 进程重启后未完成的任务从最后完成的单元继续；失败或取消的任务可以重试，已完成的单元不会重新执行
+- API key 等敏感参数只保存在进程内存中，不写入 SQLite；进程重启后恢复的任务不再带有这些参数
+- 界面通过 status 轮询或 follow 持续获取进度和部分结果
+"""
+
+import json
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from src.utils.config import Config
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+DEFAULT_JOBS_CONFIG = {"workers": 1, "db_path": "./cache/jobs/jobs.db", "files_dir": "./cache/jobs/files", "poll_interval_seconds": 1.0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total_units INTEGER,
+    completed_units INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_units (
+    job_id TEXT NOT NULL,
+    unit_index INTEGER NOT NULL,
+    output TEXT NOT NULL,
+    finished REAL NOT NULL,
+    PRIMARY KEY (job_id, unit_index)
+);
+"""
+
+
+class JobCancelledError(RuntimeError):
+    """任务执行中被取消"""
+
+
+class JobHandler(ABC):
+    """任务类型：把任务拆分为单元并逐个执行"""
+
+    @abstractmethod
+    def count_units(self, job: dict[str, Any]) -> int:
+        """任务的单元数"""
+
+    @abstractmethod
+    def run_unit(self, job: dict[str, Any], index: int) -> Iterator[str]:
+        """执行第 index 个单元，逐段返回输出；拼接后的文本作为该单元的结果保存"""
+
+    def render(self, job: dict[str, Any], outputs: dict[int, str]) -> str:
+        """把已完成单元的结果合并为展示文本"""
+        return "\n\n".join(outputs[index] for index in sorted(outputs))
+
+
+class JobStore:
+    """任务状态与单元结果的 SQLite 存储；大文件放在每个任务的目录中"""
+
+    def __init__(self, db_path: str, files_dir: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.files_dir = Path(files_dir)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def job_dir(self, job_id: str) -> Path:
+        path = self.files_dir / job_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def create(self, job_id: str, kind: str, params: dict[str, Any]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO jobs (id, kind, status, params, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)", (job_id, kind, json.dumps(params, ensure_ascii=False), now, now))
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def list_jobs(self, limit: int = 50) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def update(self, job_id: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {columns}, updated = ? WHERE id = ?", (*fields.values(), time.time(), job_id))
+
+    def transition(self, job_id: str, from_status: str, to_status: str) -> bool:
+        """仅当任务当前处于 from_status 时改为 to_status（单条 UPDATE，不会覆盖并发的状态变更）"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?", (to_status, time.time(), job_id, from_status))
+        return cursor.rowcount == 1
+
+    def save_unit(self, job_id: str, index: int, output: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO job_units (job_id, unit_index, output, finished) VALUES (?, ?, ?, ?)", (job_id, index, output, now))
+            self._conn.execute("UPDATE jobs SET completed_units = (SELECT COUNT(*) FROM job_units WHERE job_id = ?), updated = ? WHERE id = ?", (job_id, now, job_id))
+
+    def unit_outputs(self, job_id: str) -> dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT unit_index, output FROM job_units WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["unit_index"]: row["output"] for row in rows}
+
+    def unfinished(self) -> list[str]:
+        """排队中或执行中（上次进程退出时被打断）的任务"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created").fetchall()
+        return [row["id"] for row in rows]
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> dict[str, Any]:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        return job
+
+
+class JobManager:
+    """提交、执行、恢复和查询后台任务"""
+
+    def __init__(self, store: JobStore, workers: int = 1, poll_interval_seconds: float = 1.0):
+        self.store = store
+        self.workers = max(int(workers), 1)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.handlers: dict[str, JobHandler] = {}
+        self._queue: queue.Queue[str] = queue.Queue()
+        # 执行中单元的部分输出，只保存在内存中
+        self._partial: dict[str, str] = {}
+        # 不写入数据库的敏感参数（如 API key），执行时合并到任务参数中
+        self._secrets: dict[str, dict[str, Any]] = {}
+        self._cancelled: set[str] = set()
+        self._started = False
+
+    @classmethod
+    def from_config(cls) -> "JobManager":
+        config = {**DEFAULT_JOBS_CONFIG, **(Config().get_config().get("jobs", {}) or {})}
+        return cls(JobStore(config["db_path"], config["files_dir"]), workers=config["workers"], poll_interval_seconds=config["poll_interval_seconds"])
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    def start(self):
+        """启动工作线程，并重新排队上次未完成的任务"""
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, daemon=True, name=f"job-worker-{i}").start()
+        resumed = self.store.unfinished()
+        for job_id in resumed:
+            self.store.update(job_id, status="queued")
+            self._queue.put(job_id)
+        logger.info(f"后台任务已启动: {self.workers} 个工作线程，恢复 {len(resumed)} 个未完成任务")
+
+    def submit(self, kind: str, params: dict[str, Any], files: dict[str, str] | None = None, secrets: dict[str, Any] | None = None) -> str:
+        """创建任务并排队；files 中的输入文件复制到任务目录，路径写入同名参数
+
+        secrets 只保存在内存中，执行时与 params 合并，任务完成后丢弃
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job_id = uuid.uuid4().hex
+        params = dict(params)
+        for name, source in (files or {}).items():
+            target = self.store.job_dir(job_id) / f"input-{name}{Path(source).suffix}"
+            shutil.copyfile(source, target)
+            params[name] = str(target)
+        if secrets:
+            self._secrets[job_id] = dict(secrets)
+        self.store.create(job_id, kind, params)
+        self._queue.put(job_id)
+        logger.info(f"已提交后台任务 {job_id} ({kind})")
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return False
+        # 排队中的任务直接取消；已被工作线程开始执行的任务在下一段输出时中止
+        if not self.store.transition(job_id, "queued", "cancelled"):
+            self._cancelled.add(job_id)
+        return True
+
+    def retry(self, job_id: str) -> bool:
+        """重新排队失败或取消的任务，已完成的单元保留"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in ("failed", "cancelled"):
+            return False
+        self.store.update(job_id, status="queued", error=None)
+        self._queue.put(job_id)
+        return True
+
+    def status(self, job_id: str) -> dict[str, Any] | None:
+        """任务状态、已完成单元合并后的结果，以及执行中单元的部分输出"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        handler = self.handlers.get(job["kind"])
+        outputs = self.store.unit_outputs(job_id)
+        job["result"] = handler.render(job, outputs) if handler else ""
+        job["partial"] = self._partial.get(job_id, "")
+        return job
+
+    def follow(self, job_id: str) -> Iterator[dict[str, Any]]:
+        """持续返回任务状态，直到任务结束"""
+        while True:
+            job = self.status(job_id)
+            if job is None:
+                return
+            yield job
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            time.sleep(self.poll_interval_seconds)
+
+    def files(self, job_id: str) -> list[str]:
+        """任务生成的文件（不含输入文件）"""
+        path = self.store.files_dir / job_id
+        if not path.exists():
+            return []
+        return sorted(str(p) for p in path.iterdir() if p.is_file() and not p.name.startswith("input-"))
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _check_cancelled(self, job_id: str):
+        if job_id in self._cancelled:
+            raise JobCancelledError(job_id)
+
+    def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return
+        job["params"] = {**job["params"], **self._secrets.get(job_id, {})}
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            self.store.update(job_id, status="failed", error=f"未知的任务类型: {job['kind']}")
+            return
+
+        if not self.store.transition(job_id, "queued", "running"):
+            # 读取状态后任务已被取消
+            return
+        try:
+            total = job["total_units"]
+            if total is None:
+                total = handler.count_units(job)
+                self.store.update(job_id, total_units=total)
+            done = self.store.unit_outputs(job_id)
+            for index in range(total):
+                if index in done:
+                    continue
+                buffer = ""
+                for chunk in handler.run_unit(job, index):
+                    self._check_cancelled(job_id)
+                    buffer += chunk
+                    self._partial[job_id] = buffer
+                self.store.save_unit(job_id, index, buffer)
+                self._partial.pop(job_id, None)
+                self._check_cancelled(job_id)
+            self.store.update(job_id, status="completed")
+            self._secrets.pop(job_id, None)
+            logger.info(f"后台任务 {job_id} 已完成 ({total} 个单元)")
+        except JobCancelledError:
+            self.store.update(job_id, status="cancelled")
+            logger.info(f"后台任务 {job_id} 已取消")
+        except Exception as e:
+            logger.error(f"后台任务 {job_id} 失败: {e}")
+            self.store.update(job_id, status="failed", error=str(e))
+        finally:
+            self._partial.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+
+# 全局后台任务管理器
+job_manager = JobManager.from_config()
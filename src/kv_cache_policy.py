@@ -0,0 +1,118 @@
+"""
+KV cache 策略
+根据估算的上下文长度和可用内存，为每次生成选择 KV cache 模式：
+- dynamic: 默认动态 cache
+- quantized: 量化 KV cache（需要 optimum-quanto 或 hqq）
+- offloaded: 按层卸载到 CPU 的 cache
+- sliding_window: 滑动窗口 cache（仅模型本身支持滑动窗口注意力时可用）
+"""
+
+import importlib.util
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any
+
+import torch
+from loguru import logger
+
+KV_CACHE_MODES = ("auto", "dynamic", "quantized", "offloaded", "sliding_window")
+QUANT_BACKENDS = {"quanto": "optimum.quanto", "HQQ": "hqq"}
+
+
+def estimate_kv_bytes(model_config, num_tokens: int, dtype_bytes: int = 2) -> int:
+    """估算 num_tokens 个 token 的 KV cache 字节数：2 (K/V) × 层数 × KV 头数 × 头维度 × token 数 × 元素字节"""
+    config = getattr(model_config, "text_config", None) or model_config
+    num_layers = getattr(config, "num_hidden_layers", 0)
+    num_heads = getattr(config, "num_attention_heads", 1)
+    num_kv_heads = getattr(config, "num_key_value_heads", None) or num_heads
+    head_dim = getattr(config, "head_dim", None) or getattr(config, "hidden_size", 0) // num_heads
+    return 2 * num_layers * num_kv_heads * head_dim * num_tokens * dtype_bytes
+
+
+def available_memory(device: torch.device) -> int:
+    """返回设备当前可用内存（字节）；CPU 使用 /proc/meminfo 的 MemAvailable"""
+    if device.type == "cuda":
+        free, _total = torch.cuda.mem_get_info(device)
+        return free
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def sliding_window_supported(model_config) -> bool:
+    config = getattr(model_config, "text_config", None) or model_config
+    return bool(getattr(config, "sliding_window", None)) and getattr(config, "use_sliding_window", True)
+
+
+class KVCachePolicy:
+    """KV cache 模式选择器；记录进行中请求的预估占用，让并发的长上下文请求共同参与内存预算"""
+
+    def __init__(self):
+        self._reserved: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, model, cache_config: dict[str, Any], context_tokens: int, requested: str | None = None) -> tuple[str, int]:
+        """返回 (模式, 按该模式预估的 KV 字节数)"""
+        mode = requested if requested and requested != "auto" else cache_config.get("mode", "auto")
+        dtype_bytes = torch.finfo(model.dtype).bits // 8 if model.dtype.is_floating_point else 2
+        full_bytes = estimate_kv_bytes(model.config, context_tokens, dtype_bytes)
+        nbits = int(cache_config.get("nbits", 4))
+        quant_bytes = full_bytes * nbits // (dtype_bytes * 8)
+
+        if mode != "auto":
+            return mode, quant_bytes if mode == "quantized" else full_bytes
+
+        device = next(model.parameters()).device
+        with self._lock:
+            reserved = self._reserved.get(str(device), 0)
+        budget = int(available_memory(device) * float(cache_config.get("memory_fraction", 0.8))) - reserved
+
+        if full_bytes <= budget:
+            return "dynamic", full_bytes
+        if quant_bytes <= budget and self._quant_backend(cache_config) is not None:
+            return "quantized", quant_bytes
+        if sliding_window_supported(model.config):
+            return "sliding_window", full_bytes
+        return "offloaded", 0
+
+    @staticmethod
+    def _quant_backend(cache_config: dict[str, Any]) -> str | None:
+        backend = cache_config.get("quant_backend", "quanto")
+        module = QUANT_BACKENDS.get(backend)
+        if module and importlib.util.find_spec(module.split(".")[0]) is not None:
+            return backend
+        return None
+
+    def generation_kwargs(self, mode: str, cache_config: dict[str, Any]) -> dict[str, Any]:
+        """把模式转换为 generate() 参数"""
+        if mode == "quantized":
+            backend = self._quant_backend(cache_config)
+            if backend is None:
+                logger.warning("未安装量化 KV cache 后端 (optimum-quanto / hqq)，回退到 offloaded")
+                return {"cache_implementation": "offloaded"}
+            return {"cache_implementation": "quantized", "cache_config": {"backend": backend, "nbits": int(cache_config.get("nbits", 4)), "residual_length": int(cache_config.get("residual_length", 128))}}
+        if mode in ("offloaded", "sliding_window"):
+            return {"cache_implementation": mode}
+        return {}
+
+    @contextmanager
+    def reserve(self, device: torch.device, nbytes: int):
+        """在生成期间登记预估的 KV 占用"""
+        key = str(device)
+        with self._lock:
+            self._reserved[key] = self._reserved.get(key, 0) + nbytes
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved[key] -= nbytes
+
+
+# 全局 KV cache 策略实例
+kv_cache_policy = KVCachePolicy()
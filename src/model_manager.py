@@ -1,14 +1,32 @@
+import contextlib
+import ctypes
+import gc
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from typing import Any
 
 import torch
 from loguru import logger
 from transformers import (
+    AutoConfig,
     AutoModelForCausalLM,
-    AutoProcessor,
+    TextIteratorStreamer,
 )
 
+from src.adapters import DEFAULT_MAX_ADAPTERS, AdapterCache, is_adapter_entry
+from src.chat_session import chat_session_store
+from src.cpu_profile import CpuProfile
+from src.device_placement import describe_placement, input_device, memory_headroom, placement_kwargs
+from src.execution_mode import CompiledExecution
+from src.fast_load import LoadTimer, has_safetensors, load_processor, prefetch_weights
+from src.inference_worker import InferenceWorkerSupervisor, StopOnEvent
+from src.kv_cache_policy import kv_cache_policy
+from src.model_reaper import ModelReaper, process_rss
+from src.scheduler import local_scheduler
+from src.speculative import SPECULATIVE_MODES, speculative_kwargs, track_generation
 from src.utils.config import Config
 
 
@@ -21,6 +39,23 @@ class ModelManager:
         self.current_model_key = self.config.get("default_model", "qwen3-4b-fp8")
         self.models = {}
         self.processors = {}
+        self.executions = {}
+        self.cpu_profiles = {}
+        # 基础模型上挂载的 LoRA 适配器
+        self.adapters = {}
+        # 各模型加载阶段耗时
+        self.load_timings = {}
+        # 各模型加载后所在设备剩余可用于 KV cache 和批处理的内存（字节）
+        self.memory_headroom = {}
+        # 最近一次投机解码生成的统计（接受率、有效 tokens/s 等）
+        self.generation_stats = {}
+        # 最近使用时间、进行中的生成数，以及被自动回收（下次使用时重新加载）的模型
+        self.last_used = {}
+        self._in_use = {}
+        self.evicted = set()
+        self._lock = threading.RLock()
+        # 进程外推理（启用后本进程不加载模型，请求转发到推理进程）
+        self.worker = None
         # 加载全局配置以获取 CUDA 设置
         self.global_config = Config().get_config()
         self.default_device = self.global_config.get("cuda", {}).get("default_device", "auto")
@@ -56,16 +91,25 @@ class ModelManager:
             self.current_model_key = model_key
             return True
 
+        if self.worker is not None:
+            return self._load_in_worker(model_key)
+
         model_config = self.config["models"][model_key]
+        if is_adapter_entry(model_config):
+            return self._load_adapter(model_key, model_config)
+
         model_id = model_config["id"]
 
-        try:
-            logger.info(f"正在加载模型: {model_config['name']} ({model_id})")
-
-            # 加载processor
-            processor = AutoProcessor.from_pretrained(model_id, trust_remote_code=True, use_fast=False)
-            self.processors[model_key] = processor
+        # 配置了草稿模型时，先按普通模型加载并缓存，供投机解码使用
+        assistant_key = model_config.get("assistant_model")
+        if assistant_key and assistant_key not in self.models:
+            logger.info(f"加载草稿模型 '{assistant_key}' 用于投机解码")
+            previous_key = self.current_model_key
+            if not self.load_model(assistant_key):
+                logger.warning(f"草稿模型 '{assistant_key}' 加载失败，'{model_key}' 将不使用投机解码")
+            self.current_model_key = previous_key
 
+        try:
             # 根据配置选择模型类
             model_class = AutoModelForCausalLM  # 目前只支持文本模型
 
@@ -89,13 +133,70 @@ class ModelManager:
             if "dtype" in model_config:
                 load_kwargs["dtype"] = getattr(torch, model_config["dtype"])
 
+            # CPU 执行配置（可选）：无 GPU 时可替换为非 FP8 权重、选择 bf16/int8 并设置线程
+            cpu_profile = CpuProfile.resolve(model_config, load_kwargs["device_map"])
+            if cpu_profile is not None:
+                model_id = cpu_profile.model_id or model_id
+                load_kwargs.update(cpu_profile.load_kwargs())
+                cpu_profile.apply_global_threads()
+                logger.info(f"使用 CPU 执行配置: {cpu_profile.describe()}")
+            else:
+                # 设备预算（可选）：每个设备的 max_memory，超出部分卸载到 CPU / 磁盘
+                load_kwargs.update(placement_kwargs(model_config.get("placement", {}), load_kwargs["device_map"]))
+
+            logger.info(f"正在加载模型: {model_config['name']} ({model_id})")
+            timer = LoadTimer(model_key)
+
+            # 在加载 config / processor 的同时后台预读权重文件
+            prefetch_thread = prefetch_weights(model_id)
+
+            with timer.phase("config"):
+                load_kwargs["config"] = AutoConfig.from_pretrained(model_id, trust_remote_code=True)
+
+            # 加载processor（fast tokenizer 优先，并使用本地快照）
+            with timer.phase("tokenizer"):
+                processor = load_processor(model_id, use_fast=model_config.get("fast_tokenizer", True))
+            self.processors[model_key] = processor
+
+            # 执行模式配置（可选），默认 eager
+            execution_config = model_config.get("execution", {})
+            if "attn_implementation" in execution_config:
+                load_kwargs["attn_implementation"] = execution_config["attn_implementation"]
+
+            if has_safetensors(model_id):
+                # safetensors 通过 mmap 按需读取，配合上面的预读
+                load_kwargs["use_safetensors"] = True
+
             # 加载模型
-            model = model_class.from_pretrained(model_id, **load_kwargs)
-            model.eval()
+            with timer.phase("weights"):
+                if prefetch_thread is not None:
+                    prefetch_thread.join()
+                model = model_class.from_pretrained(model_id, **load_kwargs)
+                model.eval()
+
+            with timer.phase("device_placement"):
+                if cpu_profile is not None:
+                    model = cpu_profile.quantize(model)
+                    self.cpu_profiles[model_key] = cpu_profile
+
+                if execution_config.get("mode", "eager") == "compiled":
+                    execution = CompiledExecution(model, execution_config)
+                    execution.apply()
+                    with self._pinned(model_key):
+                        execution.warmup(processor)
+                    self.executions[model_key] = execution
 
             self.models[model_key] = model
             self.current_model_key = model_key
+            if self.adapter_keys(model_key):
+                self.adapters[model_key] = AdapterCache(model, model_config.get("max_adapters", DEFAULT_MAX_ADAPTERS))
+            self.last_used[model_key] = time.monotonic()
+            self.evicted.discard(model_key)
 
+            self.load_timings[model_key] = dict(timer.phases)
+            self.memory_headroom[model_key] = memory_headroom(model)
+            logger.info(timer.report())
+            logger.info(f"模型 '{model_key}' {describe_placement(model)}")
             logger.info(f"模型 '{model_config['name']}' 加载成功!")
             return True
 
@@ -103,17 +204,236 @@ class ModelManager:
             logger.error(f"加载模型失败: {e}")
             return False
 
+    def start_worker(self) -> bool:
+        """按配置启动进程外推理，之后本地模型的加载和生成都在推理进程中执行"""
+        self.worker = InferenceWorkerSupervisor.from_config()
+        if self.worker is None:
+            return False
+        self.worker.start()
+        return True
+
+    def ensure_loaded(self, model_key: str) -> bool:
+        """确保模型可用于生成（本进程或推理进程中），不改变界面当前选择的模型
+
+        生成前调用：会话选择的模型可能在其它实例上加载，或已被回收线程卸载，此时在本实例重新加载
+        """
+        if self.worker is not None:
+            return self.worker.is_loaded(model_key) or self.worker.load(model_key)
+        if self.base_key(model_key) in self.models:
+            return True
+        previous_key = self.current_model_key
+        ok = self.load_model(model_key)
+        self.current_model_key = previous_key
+        return ok
+
+    def _load_in_worker(self, model_key: str) -> bool:
+        if not self.worker.load(model_key):
+            logger.error(f"推理进程加载模型 '{model_key}' 失败")
+            return False
+        self.current_model_key = model_key
+        logger.info(f"推理进程已加载模型: {self.config['models'][model_key]['name']}")
+        return True
+
+    def _load_adapter(self, adapter_key: str, adapter_config: dict[str, Any]) -> bool:
+        """加载适配器条目：确保基础模型已加载，再把适配器挂载到基础模型上"""
+        base_key = adapter_config["base"]
+        if base_key not in self.models and not self.load_model(base_key):
+            logger.error(f"适配器 '{adapter_key}' 的基础模型 '{base_key}' 加载失败")
+            return False
+        if not self.adapters[base_key].load(adapter_key, adapter_config["adapter_path"]):
+            return False
+        self.current_model_key = adapter_key
+        self.last_used[base_key] = time.monotonic()
+        logger.info(f"已切换到适配器: {adapter_config.get('name', adapter_key)}（基础模型 '{base_key}'）")
+        return True
+
+    def base_key(self, model_key: str) -> str:
+        """适配器条目返回其基础模型，其它模型返回自身"""
+        model_config = self.config["models"].get(model_key, {})
+        return model_config["base"] if is_adapter_entry(model_config) else model_key
+
+    def adapter_keys(self, base_key: str) -> list[str]:
+        """配置中以 base_key 为基础模型的适配器条目"""
+        return [key for key, cfg in self.config["models"].items() if is_adapter_entry(cfg) and cfg["base"] == base_key]
+
     def get_current_model(self):
-        """获取当前加载的模型"""
-        if self.current_model_key in self.models:
-            return self.models[self.current_model_key]
-        return None
+        """获取当前加载的模型（适配器返回其基础模型）；被自动回收的模型在此按需重新加载"""
+        if self.base_key(self.current_model_key) in self.evicted:
+            logger.info(f"模型 '{self.current_model_key}' 已被回收，重新加载")
+            self.load_model(self.current_model_key)
+        return self.models.get(self.base_key(self.current_model_key))
 
     def get_current_processor(self):
-        """获取当前模型的处理器"""
-        if self.current_model_key in self.processors:
-            return self.processors[self.current_model_key]
-        return None
+        """获取当前模型的处理器（适配器与基础模型共用）"""
+        return self.processors.get(self.base_key(self.current_model_key))
+
+    def is_ready(self, model_key: str | None = None) -> bool:
+        """指定（默认为当前）本地模型是否已加载（本进程或推理进程中）；不会触发加载，被回收的模型由 ensure_loaded 重新加载"""
+        model_key = model_key or self.current_model_key
+        if self.worker is not None:
+            return self.worker.is_loaded(model_key)
+        base_key = self.base_key(model_key)
+        return base_key in self.models and base_key in self.processors
+
+    def stream_generate(self, model_key: str, messages: list[dict[str, Any]], images: list | None = None, *, cancel: threading.Event | None = None, **generation_kwargs):
+        """按聊天消息（可附带图像）生成，逐段返回文本；启用进程外推理时转发到推理进程
+
+        cancel 置位或调用方关闭生成器（如客户端断开）后，生成在下一个 token 结束并释放调度槽位
+        """
+        if self.worker is not None:
+            yield from self.worker.stream(model_key, messages, images, cancel=cancel, **generation_kwargs)
+            return
+
+        cancel = cancel or threading.Event()
+        generation_kwargs["stopping_criteria"] = [*generation_kwargs.get("stopping_criteria", []), StopOnEvent(cancel)]
+
+        with self.loaded(model_key) as (model, processor):
+            prompt_full = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            processor_kwargs = {"text": [prompt_full], "return_tensors": "pt", "padding": True}
+            if images:
+                processor_kwargs["images"] = images
+            inputs = processor(**processor_kwargs).to(input_device(model))
+
+            streamer = TextIteratorStreamer(processor, skip_prompt=True, skip_special_tokens=True)
+            errors = []
+
+            def _run():
+                try:
+                    self.generate(model_key, **inputs, streamer=streamer, **generation_kwargs)
+                except Exception as e:
+                    errors.append(e)
+                    streamer.end()
+
+            thread = threading.Thread(target=_run, daemon=True)
+            thread.start()
+            try:
+                yield from streamer
+            finally:
+                cancel.set()
+            thread.join()
+            if errors:
+                raise errors[0]
+
+    def generate(self, model_key: str, kv_cache_mode: str | None = None, speculative: str | None = None, priority: str = "interactive", session_id: str | None = None, **generation_kwargs):
+        """使用指定模型执行 generate，按模型配置附加执行模式、KV cache 策略和投机解码
+
+        kv_cache_mode 为单次请求指定 KV cache 模式（auto/dynamic/quantized/offloaded/sliding_window），
+        未指定时使用模型配置的 kv_cache.mode，默认 auto：按上下文长度和可用内存自动选择
+        speculative 为单次请求指定投机解码方式（off/assistant/prompt_lookup），未指定时使用模型配置
+        model_key 为适配器条目时在基础模型上启用该适配器后生成
+        priority / session_id 用于本地调度器排队：interactive 优先于 bulk，同一优先级内按会话公平分配
+        """
+        base_key = self.base_key(model_key)
+        adapter_key = model_key if base_key != model_key else None
+        # 适配器在 _using 确认基础模型已加载后再查找：回收后重新加载的基础模型有新的适配器缓存
+        with local_scheduler.slot(priority, session_id), self._using(base_key), self._pinned(base_key), self._activate_adapter(base_key, adapter_key):
+            return self._generate(base_key, kv_cache_mode, speculative, adapter_key=adapter_key, **generation_kwargs)
+
+    def _activate_adapter(self, base_key: str, adapter_key: str | None):
+        """在已加载的基础模型上启用适配器（adapter_key 为 None 时关闭适配器）"""
+        adapter_cache = self.adapters.get(base_key)
+        if adapter_cache is None:
+            if adapter_key is not None:
+                raise RuntimeError(f"适配器 '{adapter_key}' 的基础模型 '{base_key}' 没有适配器缓存")
+            return nullcontext()
+        return adapter_cache.activate(adapter_key, self.config["models"][adapter_key].get("adapter_path") if adapter_key else None)
+
+    @contextmanager
+    def loaded(self, model_key: str):
+        """持有本地模型直到退出：保证已加载且期间不会被回收，返回 (模型, 处理器)；适配器条目返回基础模型"""
+        base_key = self.base_key(model_key)
+        with self._using(base_key):
+            yield self.models[base_key], self.processors[base_key]
+
+    @contextmanager
+    def _using(self, model_key: str):
+        """生成期间标记模型（及其草稿模型）为使用中，回收线程不会卸载使用中的模型
+
+        标记前模型可能刚被回收线程卸载（调用方的 ensure_loaded 与此处之间），此时重新加载
+        """
+        keys = [model_key]
+        assistant_key = self.config["models"].get(model_key, {}).get("assistant_model")
+        if assistant_key in self.models:
+            keys.append(assistant_key)
+        with self._lock:
+            for key in keys:
+                self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            if model_key not in self.models and not self.ensure_loaded(model_key):
+                raise RuntimeError(f"模型 '{model_key}' 加载失败")
+            yield
+        finally:
+            with self._lock:
+                now = time.monotonic()
+                for key in keys:
+                    self._in_use[key] -= 1
+                    self.last_used[key] = now
+
+    def idle_models(self, now: float) -> list[tuple[str, float]]:
+        """返回当前未在使用的已加载模型及其空闲秒数"""
+        with self._lock:
+            return [(key, now - self.last_used.get(key, now)) for key in self.models if not self._in_use.get(key)]
+
+    def _pinned(self, model_key: str):
+        """模型有 CPU 执行配置时，在当前线程绑核并设置线程数"""
+        cpu_profile = self.cpu_profiles.get(model_key)
+        return cpu_profile.pinned() if cpu_profile is not None else nullcontext()
+
+    def _generate(self, model_key: str, kv_cache_mode: str | None, speculative: str | None, adapter_key: str | None = None, **generation_kwargs):
+        model = self.models[model_key]
+        if "past_key_values" in generation_kwargs:
+            return model.generate(**generation_kwargs)
+
+        model_config = self.config["models"].get(model_key, {})
+        cache_config = model_config.get("kv_cache", {})
+        input_ids = generation_kwargs.get("input_ids")
+        input_length = input_ids.shape[-1] if input_ids is not None else 0
+        context_tokens = input_length + generation_kwargs.get("max_new_tokens", 0)
+        mode, reserve_bytes = kv_cache_policy.resolve(model, cache_config, context_tokens, requested=kv_cache_mode)
+        if mode != "dynamic":
+            logger.info(f"模型 '{model_key}' 使用 {mode} KV cache，上下文长度约 {context_tokens} tokens")
+
+        spec_mode = self._resolve_speculative(model_key, speculative, generation_kwargs)
+        if spec_mode != "off" and mode != "dynamic":
+            # 投机解码需要可裁剪的动态 cache，内存受限时优先保证不 OOM
+            logger.info(f"KV cache 模式为 {mode}，本次关闭投机解码")
+            spec_mode = "off"
+
+        with kv_cache_policy.reserve(next(model.parameters()).device, reserve_bytes):
+            # 编译图不包含 LoRA 层，启用适配器时走 eager 路径
+            execution = self.executions.get(model_key) if adapter_key is None else None
+            if mode == "dynamic" and spec_mode == "off" and execution is not None:
+                with execution.static_cache(generation_kwargs) as kwargs:
+                    return model.generate(**kwargs)
+
+            kwargs = {**generation_kwargs, **kv_cache_policy.generation_kwargs(mode, cache_config)}
+            if spec_mode == "off":
+                return model.generate(**kwargs)
+
+            assistant_model = self.models.get(model_config.get("assistant_model", "")) if spec_mode == "assistant" else None
+            kwargs.update(speculative_kwargs(spec_mode, model_config.get("speculative", {}), assistant_model))
+            stats_key = adapter_key or model_key
+            with track_generation(stats_key, spec_mode, model, assistant_model, input_length) as stats:
+                output = model.generate(**kwargs)
+                sequences = getattr(output, "sequences", output)
+                stats["new_tokens"] = sequences.shape[-1] - input_length
+            self.generation_stats[stats_key] = stats
+            return output
+
+    def _resolve_speculative(self, model_key: str, requested: str | None, generation_kwargs: dict[str, Any]) -> str:
+        """确定本次生成的投机解码方式；草稿模型未加载或批量输入时关闭"""
+        model_config = self.config["models"].get(model_key, {})
+        assistant_key = model_config.get("assistant_model")
+        mode = requested or model_config.get("speculative", {}).get("mode") or ("assistant" if assistant_key else "off")
+        if mode not in SPECULATIVE_MODES:
+            logger.warning(f"未知的投机解码方式 '{mode}'，已关闭")
+            return "off"
+        input_ids = generation_kwargs.get("input_ids")
+        if mode != "off" and input_ids is not None and input_ids.shape[0] > 1:
+            return "off"
+        if mode == "assistant" and assistant_key not in self.models:
+            return "off"
+        return mode
 
     def switch_model(self, model_key: str) -> bool:
         """切换到指定的模型"""
@@ -128,16 +448,52 @@ class ModelManager:
             logger.info(f"已切换到模型: {self.config['models'][model_key]['name']}")
             return True
 
-    def unload_model(self, model_key: str) -> bool:
-        """卸载指定的模型以释放内存"""
-        if model_key in self.models:
-            del self.models[model_key]
-        if model_key in self.processors:
-            del self.processors[model_key]
+    def unload_model(self, model_key: str, reason: str | None = None) -> bool:
+        """卸载指定的模型以释放内存；reason 非空表示自动回收，下次使用时会重新加载
 
-        # 清理GPU内存
-        torch.cuda.empty_cache()
-        logger.info(f"模型 '{model_key}' 已卸载")
+        卸载适配器条目只从基础模型上移除该适配器；卸载基础模型时其适配器一并释放
+        """
+        model_config = self.config["models"].get(model_key, {})
+        if is_adapter_entry(model_config):
+            adapter_cache = self.adapters.get(model_config["base"])
+            chat_session_store.drop_model_caches(model_key)
+            return adapter_cache.unload(model_key) if adapter_cache is not None else False
+
+        with self._lock:
+            if self._in_use.get(model_key):
+                logger.warning(f"模型 '{model_key}' 正在使用，跳过卸载")
+                return False
+            model = self.models.pop(model_key, None)
+            self.processors.pop(model_key, None)
+            self.executions.pop(model_key, None)
+            self.cpu_profiles.pop(model_key, None)
+            self.memory_headroom.pop(model_key, None)
+            self.adapters.pop(model_key, None)
+            self.last_used.pop(model_key, None)
+            if reason is not None and model is not None:
+                self.evicted.add(model_key)
+
+        # 会话中保存的 KV cache 属于该模型（及其适配器），一并释放
+        for key in [model_key, *self.adapter_keys(model_key)]:
+            chat_session_store.drop_model_caches(key)
+
+        param_bytes = 0
+        if model is not None:
+            param_bytes = sum(t.numel() * t.element_size() for t in [*model.parameters(), *model.buffers()])
+        rss_before = process_rss()
+        cuda_before = torch.cuda.memory_allocated() if torch.cuda.is_available() else 0
+        del model
+        gc.collect()
+
+        if torch.cuda.is_available():
+            # 清理GPU内存
+            torch.cuda.empty_cache()
+        else:
+            _malloc_trim()
+
+        rss_freed = max(rss_before - process_rss(), 0)
+        cuda_freed = max(cuda_before - torch.cuda.memory_allocated(), 0) if torch.cuda.is_available() else 0
+        logger.info(f"模型 '{model_key}' 已卸载{f'（{reason}）' if reason else ''}: 参数 {param_bytes / 1024 / 1024:.0f} MB, RSS 释放 {rss_freed / 1024 / 1024:.0f} MB, 显存释放 {cuda_freed / 1024 / 1024:.0f} MB")
         return True
 
     def reload_config(self):
@@ -145,5 +501,13 @@ class ModelManager:
         self.config = self._load_config()
 
 
+def _malloc_trim():
+    """让 glibc 把释放的堆内存归还给系统（CPU 上 empty_cache 不起作用）"""
+    with contextlib.suppress(OSError, AttributeError):
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+
+
 # 全局模型管理器实例
 model_manager = ModelManager()
+# 模型回收守护线程（由应用启动时 start）
+model_reaper = ModelReaper.from_config(model_manager)
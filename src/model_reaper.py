@@ -0,0 +1,106 @@
+"""
+模型回收守护线程
+- 空闲超过 TTL（可按模型配置 idle_ttl_seconds）的本地模型自动卸载
+- 进程 RSS 超限、系统可用内存或 GPU 空闲显存不足时，按最久未使用顺序卸载模型
+"""
+
+import threading
+import time
+
+import torch
+from loguru import logger
+
+from src.kv_cache_policy import available_memory
+from src.utils.config import Config
+
+MB = 1024 * 1024
+
+
+def process_rss() -> int:
+    """当前进程常驻内存（字节）"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class ModelReaper:
+    """定期检查已加载模型的空闲时间和内存压力"""
+
+    def __init__(self, manager, *, interval_seconds: float = 30, default_idle_ttl_seconds: float | None = 1800, max_rss_mb: int | None = None, min_available_mb: int | None = None, min_gpu_free_mb: int | None = None):
+        self.manager = manager
+        self.interval_seconds = interval_seconds
+        self.default_idle_ttl_seconds = default_idle_ttl_seconds
+        self.max_rss_bytes = max_rss_mb * MB if max_rss_mb else None
+        self.min_available_bytes = min_available_mb * MB if min_available_mb else None
+        self.min_gpu_free_bytes = min_gpu_free_mb * MB if min_gpu_free_mb else None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_config(cls, manager) -> "ModelReaper":
+        reaper_config = Config().get_config().get("model_reaper", {}) or {}
+        return cls(
+            manager,
+            interval_seconds=reaper_config.get("interval_seconds", 30),
+            default_idle_ttl_seconds=reaper_config.get("default_idle_ttl_seconds", 1800),
+            max_rss_mb=reaper_config.get("max_rss_mb"),
+            min_available_mb=reaper_config.get("min_available_mb"),
+            min_gpu_free_mb=reaper_config.get("min_gpu_free_mb"),
+        )
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="model-reaper")
+        self._thread.start()
+        logger.info(f"模型回收线程已启动，检查间隔 {self.interval_seconds}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"模型回收检查出错: {e}")
+
+    def _idle_ttl(self, model_key: str) -> float | None:
+        return self.manager.config["models"].get(model_key, {}).get("idle_ttl_seconds", self.default_idle_ttl_seconds)
+
+    def check(self):
+        """执行一次检查：先按 TTL 卸载空闲模型，再处理内存压力"""
+        now = time.monotonic()
+        for model_key, idle in self.manager.idle_models(now):
+            ttl = self._idle_ttl(model_key)
+            if ttl is not None and idle > ttl:
+                self.manager.unload_model(model_key, reason=f"空闲 {idle:.0f}s 超过 TTL {ttl}s")
+
+        while True:
+            reason = self._pressure_reason()
+            if reason is None:
+                return
+            candidates = self.manager.idle_models(time.monotonic())
+            if not candidates:
+                logger.warning(f"内存压力（{reason}），但没有可卸载的空闲模型")
+                return
+            coldest_key, _idle = max(candidates, key=lambda item: item[1])
+            self.manager.unload_model(coldest_key, reason=f"内存压力: {reason}")
+
+    def _pressure_reason(self) -> str | None:
+        if self.max_rss_bytes and (rss := process_rss()) > self.max_rss_bytes:
+            return f"RSS {rss / MB:.0f} MB > {self.max_rss_bytes / MB:.0f} MB"
+        if self.min_available_bytes and (available := available_memory(torch.device("cpu"))) < self.min_available_bytes:
+            return f"系统可用内存 {available / MB:.0f} MB < {self.min_available_bytes / MB:.0f} MB"
+        if self.min_gpu_free_bytes and torch.cuda.is_available():
+            for index in range(torch.cuda.device_count()):
+                free = available_memory(torch.device("cuda", index))
+                if free < self.min_gpu_free_bytes:
+                    return f"cuda:{index} 空闲显存 {free / MB:.0f} MB < {self.min_gpu_free_bytes / MB:.0f} MB"
+        return None
@@ -0,0 +1,159 @@
+"""
+请求调度器
+本地模型生成和在线服务请求分别由一个调度器控制并发槽位：
+- 两个优先级：interactive（文本、对话、图像问答）优先于 bulk（PDF、视频、GIF、embeddings 等批量任务）
+- 同一优先级内按会话做加权公平排队（start-time fair queuing），一个会话的大量请求不会挤占其它会话
+- bulk 任务最多占用 bulk_max_slots 个槽位；最近 interactive 排队时间的 p95 超过 SLO 时暂停放行新的 bulk 请求，
+  多步任务（如逐页处理的 PDF）在步骤之间让出槽位
+- 每个优先级记录排队数、运行数、完成数、拒绝数和排队时间分位数
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from loguru import logger
+
+from src.utils.config import Config
+
+PRIORITY_CLASSES = ("interactive", "bulk")
+DEFAULT_SCHEDULER_CONFIG = {"interactive_slo_ms": 2000, "slo_window_seconds": 60, "max_queue": 64}
+
+
+class SchedulerFullError(RuntimeError):
+    """排队请求过多，拒绝新请求"""
+
+
+@dataclass(order=True)
+class _Ticket:
+    tag: float
+    seq: int
+    priority: str = field(compare=False)
+    session_id: str = field(compare=False)
+    enqueued: float = field(compare=False, default_factory=time.monotonic)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+class RequestScheduler:
+    """按优先级和会话公平性分配并发槽位"""
+
+    def __init__(self, name: str, slots: int, bulk_max_slots: int | None = None, *, interactive_slo_ms: float = 2000, slo_window_seconds: float = 60, max_queue: int = 64):
+        self.name = name
+        self.slots = max(int(slots), 1)
+        self.bulk_max_slots = self.slots if bulk_max_slots is None else max(int(bulk_max_slots), 0)
+        self.interactive_slo = interactive_slo_ms / 1000
+        self.slo_window_seconds = slo_window_seconds
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queues: dict[str, list[_Ticket]] = {cls: [] for cls in PRIORITY_CLASSES}
+        self._virtual_time = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        self._session_finish: dict[tuple[str, str], float] = {}
+        self._running = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self._completed = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self._rejected = dict.fromkeys(PRIORITY_CLASSES, 0)
+        # (时间戳, 排队秒数)
+        self._waits: dict[str, deque] = {cls: deque(maxlen=1000) for cls in PRIORITY_CLASSES}
+
+    @classmethod
+    def from_config(cls, name: str, slots: int, bulk_max_slots: int | None = None) -> "RequestScheduler":
+        config = {**DEFAULT_SCHEDULER_CONFIG, **(Config().get_config().get("scheduler", {}) or {})}
+        return cls(name, slots, bulk_max_slots, interactive_slo_ms=config["interactive_slo_ms"], slo_window_seconds=config["slo_window_seconds"], max_queue=config["max_queue"])
+
+    def _recent_waits(self, priority: str) -> list[float]:
+        cutoff = time.monotonic() - self.slo_window_seconds
+        return [wait for stamp, wait in self._waits[priority] if stamp >= cutoff]
+
+    def slo_at_risk(self) -> bool:
+        """最近窗口内 interactive 的排队时间 p95 超过 SLO，或已有 interactive 请求排队超过 SLO"""
+        now = time.monotonic()
+        if any(now - ticket.enqueued > self.interactive_slo for ticket in self._queues["interactive"]):
+            return True
+        return _percentile(self._recent_waits("interactive"), 0.95) > self.interactive_slo
+
+    def bulk_limit(self) -> int:
+        return 0 if self.slo_at_risk() else self.bulk_max_slots
+
+    def _can_run(self, ticket: _Ticket) -> bool:
+        queue = self._queues[ticket.priority]
+        if not queue or queue[0] is not ticket or sum(self._running.values()) >= self.slots:
+            return False
+        if ticket.priority == "interactive":
+            return True
+        return not self._queues["interactive"] and self._running["bulk"] < self.bulk_limit()
+
+    @contextmanager
+    def slot(self, priority: str = "interactive", session_id: str | None = None, weight: float = 1.0):
+        """排队直到获得槽位；同一会话的请求按权重与其它会话公平分享"""
+        if priority not in PRIORITY_CLASSES:
+            logger.warning(f"未知的优先级 '{priority}'，按 interactive 处理")
+            priority = "interactive"
+        session_id = session_id or "anonymous"
+        with self._cond:
+            if sum(len(q) for q in self._queues.values()) >= self.max_queue:
+                self._rejected[priority] += 1
+                raise SchedulerFullError(f"{self.name} 排队请求已满（{self.max_queue}），请稍后重试")
+            key = (priority, session_id)
+            tag = max(self._virtual_time[priority], self._session_finish.get(key, 0.0))
+            self._session_finish[key] = tag + 1.0 / max(weight, 1e-3)
+            ticket = _Ticket(tag, next(self._seq), priority, session_id)
+            heapq.heappush(self._queues[priority], ticket)
+            while not self._can_run(ticket):
+                # 超时唤醒以便 SLO 窗口过期后重新评估 bulk 放行
+                self._cond.wait(timeout=1.0)
+            heapq.heappop(self._queues[priority])
+            self._virtual_time[priority] = ticket.tag
+            self._running[priority] += 1
+            self._waits[priority].append((time.monotonic(), time.monotonic() - ticket.enqueued))
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[priority] -= 1
+                self._completed[priority] += 1
+                if not self._queues[priority]:
+                    # 队列清空后丢弃会话的虚拟完成时间，避免无限增长
+                    self._session_finish = {k: v for k, v in self._session_finish.items() if k[0] != priority}
+                self._cond.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        """各优先级的队列指标"""
+        with self._cond:
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                waits = self._recent_waits(priority)
+                classes[priority] = {
+                    "queued": len(self._queues[priority]),
+                    "running": self._running[priority],
+                    "completed": self._completed[priority],
+                    "rejected": self._rejected[priority],
+                    "wait_p50_ms": round(_percentile(waits, 0.5) * 1000, 1),
+                    "wait_p95_ms": round(_percentile(waits, 0.95) * 1000, 1),
+                }
+            return {"name": self.name, "slots": self.slots, "bulk_limit": self.bulk_limit(), "slo_at_risk": self.slo_at_risk(), "classes": classes}
+
+
+def _build_schedulers() -> tuple[RequestScheduler, RequestScheduler]:
+    global_config = Config().get_config()
+    queue_config = global_config.get("queue", {}) or {}
+    scheduler_config = global_config.get("scheduler", {}) or {}
+    local_slots = int(queue_config.get("local_slots", 1))
+    online_slots = int(queue_config.get("online_concurrency", 8))
+    local = RequestScheduler.from_config("local", local_slots, scheduler_config.get("local_bulk_max_slots", local_slots))
+    online = RequestScheduler.from_config("online", online_slots, scheduler_config.get("online_bulk_max_slots", max(online_slots // 2, 1)))
+    return local, online
+
+
+# 全局调度器：本地模型生成、在线服务请求
+local_scheduler, online_scheduler = _build_schedulers()
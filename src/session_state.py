@@ -0,0 +1,256 @@
+"""
+会话状态存储
+每个浏览器会话选择的模型、在线服务地址、API Key 和文档引用保存在可替换的后端中，而不是进程全局对象里：
+- memory: 进程内字典，单实例部署
+- sqlite: 本地 SQLite 文件，同一台机器（或共享卷）上的多个 UI 实例共享
+- redis: Redis 兼容服务（Redis / Valkey / KeyDB 等，只用到 GET / SETEX / DEL），未安装 redis 包或未配置地址时退回 sqlite
+上传的 PDF 等大文件按内容哈希保存在共享目录（ArtifactStore）中，会话状态和 gr.State 只保存引用；
+引用它的会话过期后文件随之清理
+API Key 等密钥只保存在本进程内存中，不写入 SQLite / Redis；请求落到其它实例时需要重新设置
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from src.utils.config import Config
+
+DEFAULT_SESSION_STATE_CONFIG = {
+    "backend": "memory",
+    "sqlite_path": "./cache/session_state.db",
+    "redis_url": "",
+    "key_prefix": "llm-web-ui:session:",
+    "artifacts_dir": "./cache/artifacts",
+    "ttl_seconds": 86400,
+}
+
+# 只保存在本进程内存中、不写入共享后端的字段
+SECRET_FIELDS = ("api_key",)
+# 清理过期文件的最短间隔（秒）
+ARTIFACT_CLEANUP_INTERVAL = 3600
+
+
+@dataclass
+class SessionState:
+    """单个会话的状态；未设置的字段使用进程默认值"""
+
+    model_key: str | None = None
+    server_url: str | None = None
+    api_key: str = ""
+    # 文档名称 -> ArtifactStore 引用
+    documents: dict[str, str] = field(default_factory=dict)
+
+
+class MemorySessionBackend:
+    """进程内存后端"""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> str | None:
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None or entry[0] < time.time():
+                self._data.pop(session_id, None)
+                return None
+            return entry[1]
+
+    def save(self, session_id: str, value: str, ttl_seconds: int):
+        with self._lock:
+            self._data[session_id] = (time.time() + ttl_seconds, value)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+
+class SQLiteSessionBackend:
+    """SQLite 后端；过期记录在读取时忽略，写入时顺带清理"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS session_state (session_id TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def load(self, session_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM session_state WHERE session_id = ? AND expires >= ?", (session_id, time.time())).fetchone()
+        return row[0] if row else None
+
+    def save(self, session_id: str, value: str, ttl_seconds: int):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO session_state (session_id, value, expires) VALUES (?, ?, ?)", (session_id, value, now + ttl_seconds))
+            self._conn.execute("DELETE FROM session_state WHERE expires < ?", (now,))
+
+    def delete(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+
+class RedisSessionBackend:
+    """Redis 兼容后端"""
+
+    def __init__(self, url: str, key_prefix: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self.key_prefix = key_prefix
+
+    def load(self, session_id: str) -> str | None:
+        return self._client.get(self.key_prefix + session_id)
+
+    def save(self, session_id: str, value: str, ttl_seconds: int):
+        self._client.setex(self.key_prefix + session_id, ttl_seconds, value)
+
+    def delete(self, session_id: str):
+        self._client.delete(self.key_prefix + session_id)
+
+
+def create_backend(config: dict[str, Any]):
+    backend = config["backend"]
+    if backend == "redis":
+        if config.get("redis_url"):
+            try:
+                return RedisSessionBackend(config["redis_url"], config["key_prefix"])
+            except ImportError:
+                logger.warning("未安装 redis 包，会话状态改用本地 SQLite")
+        else:
+            logger.warning("未配置 redis_url，会话状态改用本地 SQLite")
+        backend = "sqlite"
+    if backend == "sqlite":
+        return SQLiteSessionBackend(config["sqlite_path"])
+    if backend != "memory":
+        logger.warning(f"未知的会话状态后端 '{backend}'，使用内存后端")
+    return MemorySessionBackend()
+
+
+class ArtifactStore:
+    """按内容哈希保存大文件，多个实例共享同一目录时引用可以跨实例使用
+
+    文件的修改时间记录最近一次被会话引用或读取的时间，超过会话过期时间未被引用的文件由 cleanup 删除
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def put_file(self, source: str) -> str:
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        ref = digest.hexdigest() + Path(source).suffix.lower()
+        target = self.root / ref
+        if target.exists():
+            self.touch(ref)
+        else:
+            temp = target.with_name(f".{ref}.{threading.get_ident()}")
+            shutil.copyfile(source, temp)
+            temp.replace(target)
+        return ref
+
+    def path(self, ref: str) -> str:
+        """引用对应的本地文件路径"""
+        target = self.root / Path(ref).name
+        if not self.touch(ref):
+            raise FileNotFoundError(f"文件引用不存在: {ref}")
+        return str(target)
+
+    def touch(self, ref: str) -> bool:
+        """把文件标记为刚被引用；文件不存在时返回 False"""
+        try:
+            os.utime(self.root / Path(ref).name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def cleanup(self, max_age_seconds: float) -> int:
+        """删除超过 max_age_seconds 未被引用的文件（包括中断写入留下的临时文件），返回删除数量"""
+        deadline = time.time() - max_age_seconds
+        removed = 0
+        for target in self.root.iterdir():
+            try:
+                if target.is_file() and target.stat().st_mtime < deadline:
+                    target.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            logger.info(f"已清理 {removed} 个过期文件: {self.root}")
+        return removed
+
+
+class SessionStateStore:
+    """读写会话状态"""
+
+    def __init__(self, backend, artifacts: ArtifactStore, ttl_seconds: int = 86400):
+        self.backend = backend
+        self.artifacts = artifacts
+        self.ttl_seconds = ttl_seconds
+        self.secrets = MemorySessionBackend()
+        self._next_cleanup = 0.0
+
+    @classmethod
+    def from_config(cls) -> "SessionStateStore":
+        config = {**DEFAULT_SESSION_STATE_CONFIG, **(Config().get_config().get("session_state", {}) or {})}
+        return cls(create_backend(config), ArtifactStore(config["artifacts_dir"]), ttl_seconds=int(config["ttl_seconds"]))
+
+    def get(self, session_id: str | None) -> SessionState:
+        if not session_id:
+            return SessionState()
+        value = self.backend.load(session_id)
+        data = json.loads(value) if value else {}
+        for name in SECRET_FIELDS:
+            data.pop(name, None)
+        secrets = self.secrets.load(session_id)
+        if secrets:
+            data.update(json.loads(secrets))
+        return SessionState(**data)
+
+    def update(self, session_id: str | None, **changes) -> SessionState:
+        """更新会话状态的部分字段；没有会话标识时不保存"""
+        state = self.get(session_id)
+        for name, value in changes.items():
+            setattr(state, name, value)
+        if session_id:
+            data = asdict(state)
+            secrets = {name: data.pop(name) for name in SECRET_FIELDS}
+            self.backend.save(session_id, json.dumps(data, ensure_ascii=False), self.ttl_seconds)
+            if any(secrets.values()):
+                self.secrets.save(session_id, json.dumps(secrets), self.ttl_seconds)
+            else:
+                self.secrets.delete(session_id)
+            # 引用的文件与会话同时过期
+            for ref in state.documents.values():
+                self.artifacts.touch(ref)
+            self._cleanup_artifacts()
+        return state
+
+    def reset(self, session_id: str):
+        self.backend.delete(session_id)
+        self.secrets.delete(session_id)
+
+    def _cleanup_artifacts(self):
+        now = time.monotonic()
+        if now < self._next_cleanup:
+            return
+        self._next_cleanup = now + min(self.ttl_seconds, ARTIFACT_CLEANUP_INTERVAL)
+        self.artifacts.cleanup(self.ttl_seconds)
+
+
+# 全局会话状态存储
+session_state_store = SessionStateStore.from_config()
@@ -0,0 +1,77 @@
+"""
+投机解码（speculative / assisted decoding）
+- assistant: 小的草稿模型逐 token 起草，目标模型一次前向验证多个 token
+- prompt_lookup: 从输入中查找 n-gram 作为草稿，无需额外模型，适合摘要、抽取类任务
+统计目标模型前向次数和草稿 token 数，输出接受率与有效 tokens/s
+"""
+
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any
+
+from loguru import logger
+
+SPECULATIVE_MODES = ("off", "assistant", "prompt_lookup")
+DEFAULT_NUM_ASSISTANT_TOKENS = 5
+DEFAULT_PROMPT_LOOKUP_NUM_TOKENS = 10
+
+_local = threading.local()
+_hooked_models: weakref.WeakSet = weakref.WeakSet()
+_hook_lock = threading.Lock()
+
+
+def _counter_hook(module, _args):
+    roles = getattr(_local, "roles", None)
+    if roles is not None and id(module) in roles:
+        _local.counters[roles[id(module)]] += 1
+
+
+def _ensure_hook(model):
+    """在模型上注册一次前向计数 hook；只统计当前线程正在跟踪的生成"""
+    with _hook_lock:
+        if model in _hooked_models:
+            return
+        model.register_forward_pre_hook(_counter_hook)
+        _hooked_models.add(model)
+
+
+def speculative_kwargs(mode: str, spec_config: dict[str, Any], assistant_model=None) -> dict[str, Any]:
+    """把投机解码模式转换为 generate() 参数"""
+    if mode == "assistant" and assistant_model is not None:
+        assistant_model.generation_config.num_assistant_tokens = int(spec_config.get("num_assistant_tokens", DEFAULT_NUM_ASSISTANT_TOKENS))
+        return {"assistant_model": assistant_model}
+    if mode == "prompt_lookup":
+        return {"prompt_lookup_num_tokens": int(spec_config.get("prompt_lookup_num_tokens", DEFAULT_PROMPT_LOOKUP_NUM_TOKENS))}
+    return {}
+
+
+@contextmanager
+def track_generation(model_key: str, mode: str, target_model, assistant_model=None, input_length: int = 0):
+    """统计一次生成的投机解码效果，结束时写入 stats 并记录日志"""
+    _ensure_hook(target_model)
+    _local.roles = {id(target_model): "target"}
+    if assistant_model is not None:
+        _ensure_hook(assistant_model)
+        _local.roles[id(assistant_model)] = "assistant"
+    _local.counters = {"target": 0, "assistant": 0}
+    stats: dict[str, Any] = {"model_key": model_key, "mode": mode, "input_length": input_length}
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        counters = _local.counters
+        _local.roles = None
+        elapsed = time.perf_counter() - start
+        new_tokens = stats.get("new_tokens", 0)
+        target_steps = counters["target"]
+        stats.update({"elapsed": elapsed, "target_forward_steps": target_steps, "tokens_per_s": new_tokens / elapsed if elapsed > 0 else 0.0})
+        stats["tokens_per_step"] = new_tokens / target_steps if target_steps else 0.0
+        if mode == "assistant" and counters["assistant"]:
+            # 每步目标模型验证后额外产出 1 个 token，其余为被接受的草稿 token
+            accepted = max(new_tokens - target_steps, 0)
+            stats["acceptance_rate"] = accepted / counters["assistant"]
+        if mode != "off":
+            rate = f", acceptance={stats['acceptance_rate']:.2%}" if "acceptance_rate" in stats else ""
+            logger.info(f"投机解码[{mode}] {model_key}: {new_tokens} tokens / {target_steps} 次目标前向 ({stats['tokens_per_step']:.2f} tokens/step{rate}), {stats['tokens_per_s']:.1f} tokens/s")
@@ -3,9 +3,36 @@ pytest configuration file
 """
 
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 
+import pytest
+
 # Add src directory to Python path
 src_path = Path(__file__).parent.parent / "src"
 if str(src_path) not in sys.path:
     sys.path.insert(0, str(src_path))
+
+
+@pytest.fixture
+def running_scheduler():
+    """Start a segment scheduler on an in-process inference pool for the duration of an `async with` block"""
+    server_path = Path(__file__).parent.parent / "docker" / "indextts2"
+    if str(server_path) not in sys.path:
+        sys.path.insert(0, str(server_path))
+    from inference_worker import InferencePool
+    from segment_scheduler import SegmentScheduler
+
+    @asynccontextmanager
+    async def run(run_segment, replicas=1, **kwargs):
+        pool = InferencePool(["replica"] * replicas)
+        scheduler = SegmentScheduler(pool, run_segment, **kwargs)
+        await pool.start()
+        await scheduler.start()
+        try:
+            yield scheduler
+        finally:
+            await scheduler.stop()
+            await pool.stop()
+
+    return run
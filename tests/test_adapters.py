@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试 LoRA 适配器的 LRU 挂载和切换
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from src.adapters import AdapterCache, is_adapter_entry
+from src.model_manager import ModelManager
+
+
+class FakeModel:
+    """记录适配器操作的基础模型"""
+
+    def __init__(self):
+        self.adapters = []
+        self.active = None
+        self.enabled = True
+
+    def load_adapter(self, path, adapter_name):
+        if path == "missing":
+            raise OSError("not found")
+        self.adapters.append(adapter_name)
+
+    def delete_adapter(self, name):
+        self.adapters.remove(name)
+
+    def set_adapter(self, name):
+        self.active = name
+
+    def enable_adapters(self):
+        self.enabled = True
+
+    def disable_adapters(self):
+        self.enabled = False
+
+
+@pytest.fixture(autouse=True)
+def peft_installed():
+    with patch("src.adapters.importlib.util.find_spec", return_value=object()):
+        yield
+
+
+def test_is_adapter_entry():
+    assert is_adapter_entry({"base": "qwen", "adapter_path": "./lora"})
+    assert not is_adapter_entry({"id": "Qwen/Qwen3-0.6B"})
+
+
+def test_lru_evicts_least_recently_used_adapter():
+    model = FakeModel()
+    cache = AdapterCache(model, max_adapters=2)
+    cache.load("a", "./a")
+    cache.load("b", "./b")
+    cache.load("a", "./a")
+    cache.load("c", "./c")
+    assert model.adapters == ["a", "c"]
+    assert list(cache.loaded) == ["a", "c"]
+
+
+def test_activate_switches_and_disables_for_base():
+    model = FakeModel()
+    cache = AdapterCache(model)
+    with cache.activate("a", "./a"):
+        assert model.active == "a" and model.enabled
+    with cache.activate(None):
+        assert not model.enabled
+
+
+def test_activate_raises_when_adapter_fails_to_load():
+    cache = AdapterCache(FakeModel())
+    with pytest.raises(RuntimeError):
+        with cache.activate("broken", "missing"):
+            pass
+    assert "broken" not in cache.loaded
+
+
+def test_adapter_request_after_reap_runs_on_reloaded_base():
+    manager = ModelManager(config_path="missing-model-config.json")
+    manager.config = {"models": {"base": {"id": "base"}, "lora": {"base": "base", "adapter_path": "./lora"}}, "default_model": "base"}
+    models = []
+
+    def fake_load(model_key):
+        model = FakeModel()
+        model.parameters = model.buffers = lambda: []
+        models.append(model)
+        manager.models[model_key], manager.processors[model_key] = model, object()
+        manager.adapters[model_key] = AdapterCache(model)
+        return True
+
+    def fake_generate(model_key, kv_cache_mode, speculative, adapter_key=None, **kwargs):
+        model = manager.models[model_key]
+        return model.active if model.enabled else None
+
+    with patch.object(manager, "load_model", side_effect=fake_load), patch.object(manager, "_generate", side_effect=fake_generate):
+        fake_load("base")
+        assert manager.generate("lora") == "lora"
+        # 回收线程卸载基础模型后，适配器请求应在重新加载的基础模型上启用适配器
+        assert manager.unload_model("base", reason="空闲")
+        assert manager.generate("lora") == "lora"
+    assert len(models) == 2
+    assert models[1].adapters == ["lora"]
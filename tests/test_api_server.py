@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+测试 OpenAI 兼容 API 的请求转换、流式输出和错误处理
+"""
+
+import asyncio
+import base64
+import json
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.api_server import ChatCompletionRequest, ChatMessage, create_app, load_image, to_processor_messages
+from src.scheduler import SchedulerFullError
+
+
+class FakeManager:
+    """返回固定文本的模型管理器"""
+
+    def __init__(self, chunks=("Hello", ", world")):
+        self.calls = []
+        self.chunks = chunks
+        self.cancels = []
+
+    def get_available_models(self):
+        return {"qwen": {"name": "Qwen", "type": "text"}, "vl": {"name": "VL", "type": "multimodal"}}
+
+    def ensure_loaded(self, model_key):
+        return True
+
+    def stream_generate(self, model_key, messages, images=None, cancel=None, **kwargs):
+        self.calls.append((model_key, messages, images, kwargs))
+        self.cancels.append(cancel)
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+def _client(manager=None):
+    manager = manager or FakeManager()
+    patcher = patch("src.api_server.model_manager", manager)
+    patcher.start()
+    return TestClient(create_app()), manager, patcher
+
+
+def _data_url():
+    buffer = BytesIO()
+    Image.new("RGB", (4, 4)).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_image_parts_become_placeholders():
+    messages, images = to_processor_messages([ChatMessage(role="user", content=[{"type": "image_url", "image_url": {"url": _data_url()}}, {"type": "text", "text": "describe"}])])
+    assert messages == [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": "describe"}]}]
+    assert len(images) == 1 and images[0].size == (4, 4)
+
+
+def test_remote_image_urls_are_rejected():
+    with pytest.raises(HTTPException) as info:
+        load_image("http://169.254.169.254/latest/meta-data")
+    assert info.value.status_code == 400
+
+
+def test_list_models():
+    client, _, patcher = _client()
+    try:
+        data = client.get("/v1/models").json()["data"]
+    finally:
+        patcher.stop()
+    assert [m["id"] for m in data] == ["qwen", "vl"]
+
+
+def test_chat_completion():
+    client, manager, patcher = _client()
+    try:
+        response = client.post("/v1/chat/completions", json={"model": "qwen", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 16, "temperature": 0})
+    finally:
+        patcher.stop()
+    assert response.json()["choices"][0]["message"]["content"] == "Hello, world"
+    assert manager.calls[0][3] == {"max_new_tokens": 16, "do_sample": False, "priority": "interactive", "session_id": None}
+
+
+def test_chat_completion_stream():
+    client, _, patcher = _client()
+    try:
+        response = client.post("/v1/chat/completions", json={"model": "qwen", "messages": [{"role": "user", "content": "hi"}], "stream": True})
+    finally:
+        patcher.stop()
+    events = [line[len("data: ") :] for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    content = "".join(json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1])
+    assert content == "Hello, world"
+
+
+def test_unknown_model_and_image_on_text_model():
+    client, _, patcher = _client()
+    try:
+        assert client.post("/v1/chat/completions", json={"model": "missing", "messages": []}).status_code == 404
+        image_message = {"role": "user", "content": [{"type": "image_url", "image_url": {"url": _data_url()}}]}
+        assert client.post("/v1/chat/completions", json={"model": "qwen", "messages": [image_message]}).status_code == 400
+    finally:
+        patcher.stop()
+
+
+def test_stream_returns_429_when_scheduler_is_full():
+    client, _, patcher = _client(FakeManager(chunks=[SchedulerFullError("full")]))
+    try:
+        response = client.post("/v1/chat/completions", json={"model": "qwen", "messages": [{"role": "user", "content": "hi"}], "stream": True})
+    finally:
+        patcher.stop()
+    assert response.status_code == 429
+
+
+def test_stream_disconnect_cancels_generation():
+    produced = []
+
+    class EndlessManager(FakeManager):
+        def stream_generate(self, model_key, messages, images=None, cancel=None, **kwargs):
+            self.cancels.append(cancel)
+            # 模拟生成线程：cancel 置位后在下一个 token 结束
+            while not cancel.is_set() and len(produced) < 100000:
+                produced.append(1)
+                yield "token"
+
+    async def disconnect_after_first_event():
+        endpoint = next(route.endpoint for route in create_app().routes if getattr(route, "path", "") == "/v1/chat/completions")
+        response = await endpoint(ChatCompletionRequest(model="qwen", messages=[ChatMessage(role="user", content="hi")], stream=True))
+        await anext(response.body_iterator)
+        # 客户端断开时 Starlette 关闭响应的迭代器
+        await response.body_iterator.aclose()
+
+    manager = EndlessManager()
+    with patch("src.api_server.model_manager", manager):
+        asyncio.run(disconnect_after_first_event())
+    assert manager.cancels[0].is_set()
+    assert len(produced) < 100000
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试音频服务的文本分段和流式编码
+"""
+
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+import pytest
+from audio_encoding import CONTENT_TYPES, create_stream_encoder, encode_audio, estimate_tokens, ffmpeg_output_args, parse_bitrates, pcm16_bytes, silence_bytes, split_segments
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("hello") == 2
+    assert estimate_tokens("，。") == 0
+
+
+def test_short_text_is_one_segment():
+    assert split_segments("第一章。开始了！", 120) == ["第一章。开始了！"]
+
+
+def test_segments_respect_sentence_boundaries():
+    text = "这是第一句话。" * 10
+    segments = split_segments(text, 20)
+    assert "".join(segments) == text
+    assert all(segment.endswith("。") for segment in segments)
+    assert all(estimate_tokens(segment) <= 20 for segment in segments)
+
+
+def test_long_sentence_without_punctuation_is_cut():
+    text = "字" * 50
+    segments = split_segments(text, 20)
+    assert "".join(segments) == text
+    assert all(estimate_tokens(segment) <= 20 for segment in segments)
+
+
+def test_pcm16_bytes_flattens_mono():
+    wav = np.array([[1], [-2], [3]], dtype=np.int16)
+    assert pcm16_bytes(wav) == struct.pack("<3h", 1, -2, 3)
+
+
+def test_silence_length():
+    assert silence_bytes(22050, 200) == bytes(2 * 4410)
+
+
+def test_wav_stream_encoder_writes_streaming_header():
+    encoder = create_stream_encoder("wav", 22050)
+    header = encoder.start()
+    assert header[:4] == b"RIFF" and header[8:12] == b"WAVE" and len(header) == 44
+    assert struct.unpack("<I", header[24:28])[0] == 22050
+    assert struct.unpack("<I", header[40:44])[0] == 0xFFFFFFFF
+    assert encoder.encode(b"\x01\x00") == b"\x01\x00"
+
+
+def test_pcm_stream_encoder_has_no_header():
+    encoder = create_stream_encoder("pcm", 22050)
+    assert encoder.start() == b""
+
+
+def test_encode_wav_in_memory():
+    data = encode_audio(np.array([[1], [2]], dtype=np.int16), 16000, "wav")
+    assert len(data) == 44 + 4
+    assert struct.unpack("<I", data[4:8])[0] == 36 + 4
+    assert struct.unpack("<I", data[40:44])[0] == 4
+    assert data[44:] == struct.pack("<2h", 1, 2)
+
+
+def test_encode_pcm_is_passthrough():
+    assert encode_audio(np.array([5, -5], dtype=np.int16), 16000, "pcm") == struct.pack("<2h", 5, -5)
+
+
+def test_every_openai_format_has_a_content_type():
+    assert set(CONTENT_TYPES) == {"mp3", "opus", "aac", "flac", "wav", "pcm"}
+    assert CONTENT_TYPES["opus"].startswith("audio/ogg")
+
+
+def test_parse_bitrates():
+    bitrates = parse_bitrates("mp3=96k, opus=24k")
+    assert bitrates["mp3"] == "96k" and bitrates["opus"] == "24k" and bitrates["aac"] == "64k"
+    assert parse_bitrates("") == parse_bitrates(",")
+    with pytest.raises(ValueError):
+        parse_bitrates("flac=500k")
+
+
+def test_ffmpeg_args_use_bitrate_only_for_lossy_formats():
+    assert ffmpeg_output_args("opus", "24k")[-2:] == ["-b:a", "24k"]
+    assert "-ar" in ffmpeg_output_args("opus")
+    assert "-b:a" not in ffmpeg_output_args("flac")
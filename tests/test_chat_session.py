@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试多轮对话会话存储
+"""
+
+import time
+
+from src.chat_session import ChatSessionStore, common_prefix_length
+
+
+class FakeCache:
+    """模拟 DynamicCache，只提供字节统计所需的属性"""
+
+    def __init__(self, nbytes: int):
+        self.key_cache = [FakeTensor(nbytes // 2)]
+        self.value_cache = [FakeTensor(nbytes // 2)]
+
+
+class FakeTensor:
+    def __init__(self, nbytes: int):
+        self._nbytes = nbytes
+
+    def numel(self):
+        return self._nbytes
+
+    def element_size(self):
+        return 1
+
+
+class TestCommonPrefix:
+    def test_full_prefix(self):
+        assert common_prefix_length([1, 2, 3], [1, 2, 3, 4]) == 3
+
+    def test_diverging(self):
+        assert common_prefix_length([1, 2, 9], [1, 2, 3, 4]) == 2
+
+    def test_empty(self):
+        assert common_prefix_length([], [1, 2]) == 0
+
+
+class TestChatSessionStore:
+    def test_history_persists_between_turns(self):
+        store = ChatSessionStore()
+        session = store.get_or_create("s1", "qwen3-4b-fp8")
+        session.messages.append({"role": "user", "content": "hi"})
+        assert store.get_or_create("s1", "qwen3-4b-fp8").messages == [{"role": "user", "content": "hi"}]
+
+    def test_model_switch_drops_cache_keeps_history(self):
+        store = ChatSessionStore()
+        session = store.get_or_create("s1", "model-a")
+        session.messages.append({"role": "user", "content": "hi"})
+        store.update_cache(session, FakeCache(1024), [1, 2, 3])
+        switched = store.get_or_create("s1", "model-b")
+        assert switched.past_key_values is None
+        assert switched.messages == [{"role": "user", "content": "hi"}]
+
+    def test_cache_over_session_limit_is_dropped(self):
+        store = ChatSessionStore(max_cache_mb_per_session=1)
+        session = store.get_or_create("s1", "m")
+        store.update_cache(session, FakeCache(2 * 1024 * 1024), [1, 2, 3])
+        assert session.past_key_values is None
+        assert session.cache_bytes == 0
+
+    def test_total_limit_evicts_least_recent_cache(self):
+        store = ChatSessionStore(max_cache_mb_per_session=2, max_total_cache_mb=3)
+        first = store.get_or_create("s1", "m")
+        store.update_cache(first, FakeCache(2 * 1024 * 1024), [1])
+        second = store.get_or_create("s2", "m")
+        store.update_cache(second, FakeCache(2 * 1024 * 1024), [1])
+        assert first.past_key_values is None
+        assert second.past_key_values is not None
+
+    def test_idle_sessions_release_cache_but_keep_history(self):
+        store = ChatSessionStore(idle_ttl_seconds=0)
+        session = store.get_or_create("s1", "m")
+        session.messages.append({"role": "user", "content": "hi"})
+        store.update_cache(session, FakeCache(1024), [1])
+        time.sleep(0.01)
+        store.evict_idle()
+        assert store.get("s1").past_key_values is None
+        assert store.get("s1").messages == [{"role": "user", "content": "hi"}]
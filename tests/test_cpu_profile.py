@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+测试 CPU 执行配置
+"""
+
+from unittest.mock import patch
+
+import torch
+
+from src.cpu_profile import CpuProfile, parse_cores
+
+
+class TestParseCores:
+    def test_range_and_list(self):
+        assert parse_cores("0-3,8") == {0, 1, 2, 3, 8}
+
+    def test_list(self):
+        assert parse_cores([1, 2]) == {1, 2}
+
+    def test_none(self):
+        assert parse_cores(None) is None
+
+
+class TestCpuProfile:
+    def test_resolve_skips_when_gpu_available(self):
+        with patch("torch.cuda.is_available", return_value=True):
+            assert CpuProfile.resolve({"cpu_profile": {"enabled": "auto"}}, "auto") is None
+
+    def test_resolve_on_cpu_host(self):
+        with patch("torch.cuda.is_available", return_value=False):
+            assert CpuProfile.resolve({"cpu_profile": {"enabled": "auto"}}, "auto") is not None
+
+    def test_resolve_without_profile(self):
+        assert CpuProfile.resolve({}, "cpu") is None
+
+    def test_dynamic_int8_forces_float32(self):
+        assert CpuProfile({"quantization": "dynamic_int8", "dtype": "bfloat16"}).dtype() == torch.float32
+
+    def test_auto_dtype_follows_cpu_bf16_support(self):
+        with patch("src.cpu_profile.cpu_supports_bf16", return_value=True):
+            assert CpuProfile({"dtype": "auto"}).dtype() == torch.bfloat16
+        with patch("src.cpu_profile.cpu_supports_bf16", return_value=False):
+            assert CpuProfile({"dtype": "auto"}).dtype() == torch.float32
+
+    def test_threads_default_to_core_count(self):
+        assert CpuProfile({"cores": "0-3"}).num_threads == 4
+
+    def test_load_kwargs_place_model_on_cpu(self):
+        kwargs = CpuProfile({"dtype": "float32"}).load_kwargs()
+        assert kwargs["device_map"] == "cpu"
+        assert kwargs["dtype"] == torch.float32
+
+
+def test_dynamic_int8_quantizes_in_place():
+    model = torch.nn.Sequential(torch.nn.Linear(4, 4))
+    quantized = CpuProfile({"quantization": "dynamic_int8"}).quantize(model)
+    assert quantized is model
+    assert type(model[0]) is not torch.nn.Linear
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试设备预算参数和输入设备选择
+"""
+
+from unittest.mock import patch
+
+import torch
+
+from src.device_placement import input_device, normalize_max_memory, placement_kwargs
+
+
+class FakeModel(torch.nn.Module):
+    """embedding 在 model.embed_tokens，按 hf_device_map 切分的模型"""
+
+    def __init__(self, device_map):
+        super().__init__()
+        self.model = torch.nn.Module()
+        self.model.embed_tokens = torch.nn.Embedding(4, 2)
+        self.lm_head = torch.nn.Linear(2, 4)
+        self.hf_device_map = device_map
+
+    def get_input_embeddings(self):
+        return self.model.embed_tokens
+
+
+def test_normalize_max_memory_converts_gpu_indices():
+    assert normalize_max_memory({"0": "20GiB", "cpu": "64GiB"}) == {0: "20GiB", "cpu": "64GiB"}
+
+
+def test_placement_ignored_for_explicit_device():
+    assert placement_kwargs({"max_memory": {"0": "1GiB"}}, "cuda:0") == {}
+
+
+def test_placement_kwargs_with_offload():
+    kwargs = placement_kwargs({"max_memory": {"0": "20GiB", "cpu": "48GiB"}, "offload_folder": "./offload"}, "auto")
+    assert kwargs == {"max_memory": {0: "20GiB", "cpu": "48GiB"}, "offload_folder": "./offload", "offload_buffers": False}
+
+
+def test_reserve_mb_fills_unlisted_gpus():
+    with patch("torch.cuda.is_available", return_value=True), patch("torch.cuda.device_count", return_value=2), patch("src.device_placement.available_memory", return_value=10 * 1024 * 1024 * 1024):
+        kwargs = placement_kwargs({"max_memory": {"0": "4GiB"}, "reserve_mb": 1024}, "auto")
+    assert kwargs["max_memory"] == {0: "4GiB", 1: 9 * 1024 * 1024 * 1024}
+
+
+def test_input_device_follows_embedding_layer():
+    model = FakeModel({"model.embed_tokens": "cpu", "model.layers.0": 0, "lm_head": 1})
+    assert input_device(model) == torch.device("cpu")
+    model = FakeModel({"model": 1, "lm_head": 0})
+    assert input_device(model) == torch.device("cuda", 1)
+
+
+def test_input_device_without_device_map():
+    model = FakeModel(None)
+    assert input_device(model) == torch.device("cpu")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试模型快速加载辅助函数
+"""
+
+from unittest.mock import MagicMock, patch
+
+from src.fast_load import LoadTimer, load_processor
+
+
+def test_load_timer_accumulates_phases():
+    timer = LoadTimer("m")
+    with timer.phase("config"):
+        pass
+    with timer.phase("weights"):
+        pass
+    assert set(timer.phases) == {"config", "weights"}
+    assert "m" in timer.report()
+
+
+def _model_dir(tmp_path):
+    model_dir = tmp_path / "model"
+    model_dir.mkdir()
+    (model_dir / "tokenizer_config.json").write_text("{}")
+    return str(model_dir)
+
+
+def test_load_processor_saves_snapshot_and_reuses_it(tmp_path):
+    processor = MagicMock()
+    model_dir = _model_dir(tmp_path)
+    with patch("src.fast_load.AutoProcessor.from_pretrained", return_value=processor) as from_pretrained:
+        load_processor(model_dir, snapshot_dir=str(tmp_path / "snapshots"))
+        processor.save_pretrained.assert_called_once()
+        snapshot = processor.save_pretrained.call_args[0][0]
+
+        load_processor(model_dir, snapshot_dir=str(tmp_path / "snapshots"))
+        assert from_pretrained.call_args[0][0] == snapshot
+
+
+def test_snapshot_is_invalidated_by_source_changes_and_use_fast(tmp_path):
+    processor = MagicMock()
+    model_dir = _model_dir(tmp_path)
+    snapshots = str(tmp_path / "snapshots")
+    with patch("src.fast_load.AutoProcessor.from_pretrained", return_value=processor) as from_pretrained:
+        load_processor(model_dir, snapshot_dir=snapshots)
+        first = processor.save_pretrained.call_args[0][0]
+
+        load_processor(model_dir, use_fast=False, snapshot_dir=snapshots)
+        assert from_pretrained.call_args[0][0] == model_dir
+        load_processor(model_dir, snapshot_dir=snapshots)
+        assert from_pretrained.call_args[0][0] == first
+
+        # 上游更新了 tokenizer 配置
+        with open(f"{model_dir}/tokenizer_config.json", "w") as f:
+            f.write('{"model_max_length": 8}')
+        load_processor(model_dir, snapshot_dir=snapshots)
+        assert from_pretrained.call_args[0][0] == model_dir
+        assert processor.save_pretrained.call_args[0][0] != first
+
+
+def test_load_processor_falls_back_to_slow_tokenizer(tmp_path):
+    processor = MagicMock()
+
+    def fake_from_pretrained(model_id, trust_remote_code, use_fast):
+        if use_fast:
+            raise ValueError("no fast tokenizer")
+        return processor
+
+    with patch("src.fast_load.AutoProcessor.from_pretrained", side_effect=fake_from_pretrained):
+        assert load_processor("Qwen/Test", snapshot_dir=str(tmp_path)) is processor
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+测试进程外推理的共享内存传输和请求处理
+"""
+
+import threading
+from multiprocessing import Pipe
+
+import numpy as np
+import pytest
+
+from src.inference_worker import DEFAULT_AUTHKEY, _handle_connection, pack_arrays, parse_address, release_arrays, resolve_authkey, unpack_arrays
+
+
+class FakeManager:
+    """已加载单个模型、逐个返回固定 token 的模型管理器"""
+
+    def __init__(self):
+        self.models = {"qwen": object()}
+        self.requests = []
+
+    def base_key(self, model_key):
+        return model_key
+
+    def load_model(self, model_key):
+        return False
+
+    def stream_generate(self, model_key, messages, images=None, **generation_kwargs):
+        self.requests.append((model_key, messages, images, generation_kwargs))
+        yield from ["你", "好"]
+
+
+def test_parse_address():
+    assert parse_address("127.0.0.1:7870") == ("127.0.0.1", 7870)
+
+
+def test_pack_unpack_roundtrip():
+    arrays = [np.arange(12, dtype=np.uint8).reshape(2, 2, 3), np.ones((4,), dtype=np.float32)]
+    descriptors, segments = pack_arrays(arrays)
+    try:
+        restored = unpack_arrays(descriptors)
+    finally:
+        release_arrays(segments)
+    assert all(np.array_equal(a, b) and a.dtype == b.dtype for a, b in zip(arrays, restored, strict=True))
+
+
+def _serve(manager):
+    client, server = Pipe()
+    threading.Thread(target=_handle_connection, args=(server, manager), daemon=True).start()
+    return client
+
+
+def test_generate_streams_tokens_then_done():
+    manager = FakeManager()
+    client = _serve(manager)
+    client.send({"op": "generate", "model_key": "qwen", "messages": [{"role": "user", "content": "hi"}], "generation": {"max_new_tokens": 8}})
+    responses = [client.recv() for _ in range(3)]
+    assert [r.get("text") for r in responses[:2]] == ["你", "好"]
+    assert responses[2]["type"] == "done"
+    assert manager.requests[0][3]["max_new_tokens"] == 8
+    client.close()
+
+
+def test_generate_reports_load_failure():
+    client = _serve(FakeManager())
+    client.send({"op": "generate", "model_key": "missing", "messages": []})
+    assert client.recv()["type"] == "error"
+    client.close()
+
+
+def test_authkey_for_remote_workers_must_be_configured():
+    assert resolve_authkey(None, ["127.0.0.1:7870"], spawn=False) == DEFAULT_AUTHKEY.encode()
+    assert resolve_authkey(None, ["0.0.0.0:7870"], spawn=True) != DEFAULT_AUTHKEY.encode()
+    assert resolve_authkey("secret", ["10.0.0.2:7870"], spawn=False) == b"secret"
+    with pytest.raises(ValueError):
+        resolve_authkey(None, ["10.0.0.2:7870"], spawn=False)
+    with pytest.raises(ValueError):
+        resolve_authkey(DEFAULT_AUTHKEY, ["10.0.0.2:7870"], spawn=False)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+测试后台任务的单元持久化、重启恢复、取消和重试
+"""
+
+import threading
+import time
+
+import pytest
+
+from src.jobs import JobHandler, JobManager, JobStore
+
+
+class CountingJob(JobHandler):
+    """每个单元输出单元序号；fail_at 指定的单元抛出异常"""
+
+    def __init__(self, units=3, fail_at=None, gate=None):
+        self.units = units
+        self.fail_at = fail_at
+        self.gate = gate
+        self.calls = []
+
+    def count_units(self, job):
+        return self.units
+
+    def run_unit(self, job, index):
+        self.calls.append(index)
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        if index == self.fail_at:
+            raise RuntimeError("boom")
+        yield f"unit-{index}"
+
+
+def _manager(tmp_path, handler):
+    manager = JobManager(JobStore(str(tmp_path / "jobs.db"), str(tmp_path / "files")), poll_interval_seconds=0.01)
+    manager.register("count", handler)
+    return manager
+
+
+def test_job_runs_all_units(tmp_path):
+    manager = _manager(tmp_path, CountingJob())
+    manager.start()
+    job_id = manager.submit("count", {})
+    statuses = list(manager.follow(job_id))
+    assert statuses[-1]["status"] == "completed"
+    assert statuses[-1]["result"] == "unit-0\n\nunit-1\n\nunit-2"
+
+
+def test_retry_skips_completed_units(tmp_path):
+    handler = CountingJob(fail_at=1)
+    manager = _manager(tmp_path, handler)
+    manager.start()
+    job_id = manager.submit("count", {})
+    assert list(manager.follow(job_id))[-1]["status"] == "failed"
+
+    handler.fail_at = None
+    assert manager.retry(job_id)
+    job = list(manager.follow(job_id))[-1]
+    assert job["status"] == "completed" and job["completed_units"] == 3
+    assert handler.calls == [0, 1, 1, 2]
+
+
+def test_unfinished_jobs_resume_after_restart(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), str(tmp_path / "files"))
+    store.create("job-1", "count", {})
+    store.update("job-1", status="running", total_units=3)
+    store.save_unit("job-1", 0, "unit-0")
+
+    handler = CountingJob()
+    manager = _manager(tmp_path, handler)
+    manager.start()
+    assert list(manager.follow("job-1"))[-1]["status"] == "completed"
+    assert handler.calls == [1, 2]
+
+
+def test_cancel_running_job(tmp_path):
+    gate = threading.Event()
+    manager = _manager(tmp_path, CountingJob(gate=gate))
+    manager.start()
+    job_id = manager.submit("count", {})
+    deadline = time.monotonic() + 5
+    while manager.store.get(job_id)["status"] != "running":
+        assert time.monotonic() < deadline, "job did not start"
+        time.sleep(0.01)
+    assert manager.cancel(job_id)
+    gate.set()
+    assert list(manager.follow(job_id))[-1]["status"] == "cancelled"
+
+
+def test_submit_copies_input_files(tmp_path):
+    source = tmp_path / "doc.pdf"
+    source.write_bytes(b"%PDF")
+    manager = _manager(tmp_path, CountingJob())
+    job_id = manager.submit("count", {}, files={"pdf_path": str(source)})
+    copied = manager.store.get(job_id)["params"]["pdf_path"]
+    assert copied != str(source) and open(copied, "rb").read() == b"%PDF"
+    assert manager.files(job_id) == []
+
+
+def test_secrets_are_used_but_not_persisted(tmp_path):
+    seen = []
+
+    class KeyJob(CountingJob):
+        def run_unit(self, job, index):
+            seen.append(job["params"].get("api_key"))
+            yield "ok"
+
+    manager = _manager(tmp_path, KeyJob(units=1))
+    manager.start()
+    job_id = manager.submit("count", {"server_url": "http://upstream"}, secrets={"api_key": "sk-secret"})
+    assert list(manager.follow(job_id))[-1]["status"] == "completed"
+    assert seen == ["sk-secret"]
+    assert "api_key" not in manager.store.get(job_id)["params"]
+    assert all(b"sk-secret" not in path.read_bytes() for path in tmp_path.glob("jobs.db*"))
+
+
+def test_cancel_between_status_read_and_start_is_kept(tmp_path):
+    handler = CountingJob()
+    manager = _manager(tmp_path, handler)
+    job_id = manager.submit("count", {})
+    read = manager.store.get
+
+    def get_then_cancel(job_id):
+        # 工作线程读取状态之后、开始执行之前任务被取消
+        job = read(job_id)
+        manager.store.get = read
+        assert manager.cancel(job_id)
+        return job
+
+    manager.store.get = get_then_cancel
+    manager._run(job_id)
+    assert manager.store.get(job_id)["status"] == "cancelled"
+    assert handler.calls == []
+
+
+def test_handler_must_implement_units():
+    class Incomplete(JobHandler):
+        def count_units(self, job):
+            return 1
+
+    with pytest.raises(TypeError):
+        Incomplete()
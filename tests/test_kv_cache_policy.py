@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试 KV cache 策略的内存估算和模式选择
+"""
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import torch
+
+from src.kv_cache_policy import KVCachePolicy, estimate_kv_bytes
+
+
+class FakeModel:
+    """只提供策略需要的 config / dtype / parameters"""
+
+    def __init__(self, sliding_window=None):
+        self.config = SimpleNamespace(num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2, head_dim=8, sliding_window=sliding_window, use_sliding_window=bool(sliding_window))
+        self.dtype = torch.float16
+
+    def parameters(self):
+        yield torch.zeros(1)
+
+
+def test_estimate_kv_bytes():
+    config = SimpleNamespace(num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2, head_dim=8)
+    # 2 (K/V) * 2 层 * 2 KV 头 * 8 维 * 10 token * 2 字节
+    assert estimate_kv_bytes(config, 10) == 2 * 2 * 2 * 8 * 10 * 2
+
+
+def test_estimate_uses_text_config_for_multimodal():
+    text_config = SimpleNamespace(num_hidden_layers=1, num_attention_heads=1, num_key_value_heads=1, head_dim=4)
+    assert estimate_kv_bytes(SimpleNamespace(text_config=text_config), 1) == 2 * 1 * 1 * 4 * 1 * 2
+
+
+def test_auto_selects_dynamic_when_memory_is_enough():
+    with patch("src.kv_cache_policy.available_memory", return_value=10**12):
+        mode, _ = KVCachePolicy().resolve(FakeModel(), {}, 1000)
+    assert mode == "dynamic"
+
+
+def test_auto_falls_back_to_offloaded_without_quant_backend():
+    with patch("src.kv_cache_policy.available_memory", return_value=1), patch.object(KVCachePolicy, "_quant_backend", return_value=None):
+        mode, _ = KVCachePolicy().resolve(FakeModel(), {}, 1000)
+    assert mode == "offloaded"
+
+
+def test_auto_prefers_sliding_window_when_model_supports_it():
+    with patch("src.kv_cache_policy.available_memory", return_value=1), patch.object(KVCachePolicy, "_quant_backend", return_value=None):
+        mode, _ = KVCachePolicy().resolve(FakeModel(sliding_window=256), {}, 1000)
+    assert mode == "sliding_window"
+
+
+def test_requested_mode_overrides_auto():
+    mode, _ = KVCachePolicy().resolve(FakeModel(), {"mode": "auto"}, 10, requested="offloaded")
+    assert mode == "offloaded"
+
+
+def test_reservations_reduce_budget():
+    policy = KVCachePolicy()
+    needed = estimate_kv_bytes(FakeModel().config, 1000)
+    with patch("src.kv_cache_policy.available_memory", return_value=needed * 2), patch.object(KVCachePolicy, "_quant_backend", return_value=None):
+        assert policy.resolve(FakeModel(), {"memory_fraction": 1.0}, 1000)[0] == "dynamic"
+        with policy.reserve(torch.device("cpu"), needed * 2):
+            assert policy.resolve(FakeModel(), {"memory_fraction": 1.0}, 1000)[0] == "offloaded"
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试模型回收线程的空闲 TTL 和内存压力淘汰
+"""
+
+from unittest.mock import MagicMock, patch
+
+from src.model_reaper import ModelReaper
+
+
+class FakeManager:
+    """记录卸载调用的模型管理器"""
+
+    def __init__(self, idle, models_config=None):
+        self.idle = dict(idle)
+        self.config = {"models": models_config or {}}
+        self.unloaded = []
+
+    def idle_models(self, now):
+        return list(self.idle.items())
+
+    def unload_model(self, model_key, reason=None):
+        self.unloaded.append((model_key, reason))
+        self.idle.pop(model_key, None)
+        return True
+
+
+def test_unloads_models_idle_longer_than_ttl():
+    manager = FakeManager({"a": 100, "b": 10})
+    ModelReaper(manager, default_idle_ttl_seconds=60).check()
+    assert [key for key, _ in manager.unloaded] == ["a"]
+
+
+def test_per_model_ttl_overrides_default():
+    manager = FakeManager({"a": 100, "b": 100}, {"a": {"idle_ttl_seconds": None}, "b": {"idle_ttl_seconds": 50}})
+    ModelReaper(manager, default_idle_ttl_seconds=1000).check()
+    assert [key for key, _ in manager.unloaded] == ["b"]
+
+
+def test_memory_pressure_unloads_coldest_first():
+    manager = FakeManager({"warm": 5, "cold": 50, "hot": 1})
+    reaper = ModelReaper(manager, default_idle_ttl_seconds=None, max_rss_mb=1)
+    # 卸载两个模型后压力解除
+    rss = iter([10 * 1024 * 1024, 10 * 1024 * 1024, 0])
+    with patch("src.model_reaper.process_rss", side_effect=lambda: next(rss)):
+        reaper.check()
+    assert [key for key, _ in manager.unloaded] == ["cold", "warm"]
+    assert all(reason.startswith("内存压力") for _, reason in manager.unloaded)
+
+
+def test_memory_pressure_without_candidates_stops():
+    manager = FakeManager({})
+    reaper = ModelReaper(manager, default_idle_ttl_seconds=None, max_rss_mb=1)
+    with patch("src.model_reaper.process_rss", return_value=10 * 1024 * 1024):
+        reaper.check()
+    assert manager.unloaded == []
+
+
+def test_model_unloaded_after_ensure_loaded_is_reloaded_for_use():
+    from src.model_manager import ModelManager
+
+    manager = ModelManager(config_path="missing-model-config.json")
+    key = manager.current_model_key
+
+    def fake_load(model_key):
+        manager.models[model_key], manager.processors[model_key] = MagicMock(**{"parameters.return_value": [], "buffers.return_value": []}), object()
+        return True
+
+    with patch.object(manager, "load_model", side_effect=fake_load) as load:
+        assert manager.ensure_loaded(key)
+        # 回收线程在界面检查之后、生成之前卸载了模型
+        assert manager.unload_model(key, reason="空闲")
+        with manager.loaded(key) as (model, processor):
+            assert model is manager.models[key] and processor is manager.processors[key]
+            assert not manager.unload_model(key, reason="空闲")
+    assert load.call_count == 2
+    assert key in manager.models
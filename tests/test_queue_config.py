@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+测试 Gradio 并发组上限的计算
+"""
+
+from unittest.mock import patch
+
+from src.gradio.queue_config import DEFAULT_QUEUE_CONFIG, concurrency_limits, event_options
+
+
+def _limits(global_config):
+    with patch("src.gradio.queue_config.Config") as config:
+        config.return_value.get_config.return_value = global_config
+        return concurrency_limits({**DEFAULT_QUEUE_CONFIG, **global_config.get("queue", {})})
+
+
+def test_long_jobs_have_their_own_limit():
+    limits = _limits({"queue": {"long_job_concurrency": 1, "online_concurrency": 8}})
+    assert limits["long_job"] == 1
+    assert limits["text_online"] == 8
+
+
+def test_local_and_online_text_have_separate_limits():
+    limits = _limits({"queue": {"local_slots": 1, "online_concurrency": 8}})
+    assert limits["text_local"] == 1
+    assert limits["vision_local"] == 1
+    assert limits["text_online"] == 8
+
+
+def test_local_capacity_scales_with_inference_workers():
+    limits = _limits({"queue": {"local_slots": 4, "online_concurrency": 2}, "inference_worker": {"enabled": True, "workers": 3}})
+    assert limits["text_local"] == 12
+
+
+def test_event_options_share_concurrency_id():
+    options = event_options("tts", {"tts": 2})
+    assert options["concurrency_id"] == "tts"
+    assert options["concurrency_limit"] == 2
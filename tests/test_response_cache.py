@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+测试阅读接口的整段响应缓存：Range 解析与 206/416 响应、相同请求合并为一次合成、失败不缓存、LRU 淘汰
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from response_cache import RangeNotSatisfiableError, ResponseCache, byte_range_response, parse_range
+
+
+class TestParseRange:
+    def test_no_header_means_whole_content(self):
+        assert parse_range(None, 100) is None
+
+    def test_closed_range(self):
+        assert parse_range("bytes=10-19", 100) == (10, 19)
+
+    def test_open_range(self):
+        assert parse_range("bytes=90-", 100) == (90, 99)
+
+    def test_suffix_range(self):
+        assert parse_range("bytes=-10", 100) == (90, 99)
+        assert parse_range("bytes=-500", 100) == (0, 99)
+
+    def test_end_is_clamped(self):
+        assert parse_range("bytes=50-1000", 100) == (50, 99)
+
+    def test_multiple_and_malformed_ranges_are_ignored(self):
+        assert parse_range("bytes=0-1,5-6", 100) is None
+        assert parse_range("items=0-1", 100) is None
+        assert parse_range("bytes=-", 100) is None
+
+    def test_unsatisfiable_ranges(self):
+        for header in ("bytes=100-", "bytes=20-10", "bytes=-0"):
+            with pytest.raises(RangeNotSatisfiableError):
+                parse_range(header, 100)
+
+
+class TestByteRangeResponse:
+    content = bytes(range(100))
+
+    def test_full_response(self):
+        response = byte_range_response(self.content, "audio/mpeg", None)
+        assert response.status_code == 200
+        assert response.body == self.content
+        assert response.headers["accept-ranges"] == "bytes"
+
+    def test_partial_response(self):
+        response = byte_range_response(self.content, "audio/mpeg", "bytes=10-19")
+        assert response.status_code == 206
+        assert response.body == self.content[10:20]
+        assert response.headers["content-range"] == "bytes 10-19/100"
+        assert response.headers["content-length"] == "10"
+
+    def test_unsatisfiable_response(self):
+        response = byte_range_response(self.content, "audio/mpeg", "bytes=200-")
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */100"
+
+
+class CountingSynthesis:
+    def __init__(self, content=b"audio", seconds=0.05, error=None):
+        self.content = content
+        self.seconds = seconds
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        if self.error:
+            raise self.error
+        return self.content
+
+
+def test_repeated_request_is_served_from_cache():
+    cache = ResponseCache(max_bytes=1024)
+    synthesis = CountingSynthesis()
+
+    async def main():
+        first = await cache.get_or_create(("段落", "0%", "1"), synthesis)
+        second = await cache.get_or_create(("段落", "0%", "1"), synthesis)
+        return first, second
+
+    assert asyncio.run(main()) == (b"audio", b"audio")
+    assert synthesis.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_identical_requests_share_one_synthesis():
+    cache = ResponseCache(max_bytes=1024)
+    synthesis = CountingSynthesis()
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_create("key", synthesis) for _ in range(5)))
+
+    assert asyncio.run(main()) == [b"audio"] * 5
+    assert synthesis.calls == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_failures_reach_all_waiters_and_are_not_cached():
+    cache = ResponseCache(max_bytes=1024)
+    synthesis = CountingSynthesis(error=RuntimeError("boom"))
+
+    async def main():
+        results = await asyncio.gather(*(cache.get_or_create("key", synthesis) for _ in range(2)), return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_create("key", synthesis)
+        return results
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main()))
+    assert synthesis.calls == 2
+
+
+def test_disconnected_client_does_not_cancel_synthesis():
+    cache = ResponseCache(max_bytes=1024)
+    synthesis = CountingSynthesis()
+
+    async def main():
+        waiter = asyncio.create_task(cache.get_or_create("key", synthesis))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.1)
+        # The retry finds the finished audio
+        return await cache.get_or_create("key", synthesis)
+
+    assert asyncio.run(main()) == b"audio"
+    assert synthesis.calls == 1
+
+
+def test_least_recently_used_responses_are_evicted():
+    cache = ResponseCache(max_bytes=10)
+
+    async def main():
+        for key in ("a", "b"):
+            await cache.get_or_create(key, CountingSynthesis(content=b"12345", seconds=0))
+        await cache.get_or_create("a", CountingSynthesis(seconds=0))
+        await cache.get_or_create("c", CountingSynthesis(content=b"12345", seconds=0))
+
+    asyncio.run(main())
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] == 10
+    assert stats["hits"] == 1
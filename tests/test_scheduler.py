@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+测试请求调度器的优先级、会话公平排队和 SLO 保护
+"""
+
+import threading
+import time
+
+import pytest
+
+from src.scheduler import RequestScheduler, SchedulerFullError
+
+
+def _run_in_order(scheduler, requests):
+    """占住唯一槽位后依次提交请求，释放槽位后记录实际执行顺序"""
+    order = []
+    release = threading.Event()
+
+    def _hold():
+        with scheduler.slot("interactive", "holder"):
+            release.wait()
+
+    def _request(priority, session_id, label):
+        with scheduler.slot(priority, session_id):
+            order.append(label)
+
+    holder = threading.Thread(target=_hold)
+    holder.start()
+    time.sleep(0.05)
+    threads = []
+    for priority, session_id, label in requests:
+        thread = threading.Thread(target=_request, args=(priority, session_id, label))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    release.set()
+    for thread in [holder, *threads]:
+        thread.join(timeout=5)
+    return order
+
+
+def test_interactive_runs_before_bulk():
+    scheduler = RequestScheduler("test", slots=1)
+    order = _run_in_order(scheduler, [("bulk", "a", "bulk"), ("interactive", "b", "interactive")])
+    assert order == ["interactive", "bulk"]
+
+
+def test_sessions_share_fairly():
+    scheduler = RequestScheduler("test", slots=1)
+    order = _run_in_order(scheduler, [("interactive", "a", "a1"), ("interactive", "a", "a2"), ("interactive", "a", "a3"), ("interactive", "b", "b1")])
+    assert order.index("b1") < order.index("a2")
+
+
+def test_bulk_paused_while_slo_at_risk():
+    scheduler = RequestScheduler("test", slots=2, interactive_slo_ms=10)
+    scheduler._waits["interactive"].append((time.monotonic(), 1.0))
+    assert scheduler.slo_at_risk()
+    assert scheduler.bulk_limit() == 0
+
+
+def test_rejects_when_queue_full():
+    scheduler = RequestScheduler("test", slots=1, max_queue=0)
+    with pytest.raises(SchedulerFullError), scheduler.slot("bulk"):
+        pass
+    assert scheduler.stats()["classes"]["bulk"]["rejected"] == 1
+
+
+def test_stats_count_completed():
+    scheduler = RequestScheduler("test", slots=1)
+    with scheduler.slot("interactive", "a"):
+        assert scheduler.stats()["classes"]["interactive"]["running"] == 1
+    stats = scheduler.stats()["classes"]["interactive"]
+    assert stats["completed"] == 1 and stats["running"] == 0
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+测试音频服务的托管临时目录
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from scratch_dir import ScratchDir
+
+
+def test_cleanup_removes_everything(tmp_path):
+    scratch = ScratchDir(str(tmp_path))
+    (scratch.subdir("prompts") / "a.wav").write_bytes(b"x")
+    scratch.cleanup()
+    assert not scratch.root.exists()
+
+
+def test_directories_of_dead_processes_are_removed(tmp_path):
+    stale = tmp_path / "indextts-scratch-999999999-abc"
+    stale.mkdir()
+    (stale / "leftover.wav").write_bytes(b"x")
+    scratch = ScratchDir(str(tmp_path))
+    assert not stale.exists()
+    assert scratch.root.exists()
+    scratch.cleanup()
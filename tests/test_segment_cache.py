@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+测试分段合成缓存：键的规范化与失效、按字节数的 LRU 淘汰、重启后保留、流水线从缓存拼装请求
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from inference_worker import InferencePool
+from segment_cache import SegmentCache, segment_key
+from segment_scheduler import SegmentScheduler
+from synthesis_pipeline import SegmentPipeline
+
+
+def test_key_ignores_whitespace_and_verbose(tmp_path):
+    voice = tmp_path / "a.wav"
+    voice.write_bytes(b"voice")
+    kwargs = {"spk_audio_prompt": str(voice), "top_p": 0.8}
+    assert segment_key(" 第一章  开端 ", kwargs) == segment_key("第一章 开端", {**kwargs, "verbose": True})
+    assert segment_key("第一章", kwargs) != segment_key("第一章", {**kwargs, "top_p": 0.9})
+
+
+def test_key_changes_when_voice_file_changes(tmp_path):
+    voice = tmp_path / "a.wav"
+    voice.write_bytes(b"voice")
+    before = segment_key("第一章", {"spk_audio_prompt": str(voice)})
+    stat = voice.stat()
+    os.utime(voice, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert segment_key("第一章", {"spk_audio_prompt": str(voice)}) != before
+
+
+def test_random_emotion_is_not_cached(tmp_path):
+    assert segment_key("第一章", {"use_random": True}) is None
+    assert segment_key("第一章", {"spk_audio_prompt": str(tmp_path / "missing.wav")}) is None
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = SegmentCache(str(tmp_path), max_bytes=1024)
+    cache.put("k", 22050, np.array([[1], [-2], [3]], dtype=np.int16))
+    sample_rate, wav = cache.get("k")
+    assert sample_rate == 22050
+    assert wav.tolist() == [1, -2, 3]
+    assert "k" in cache
+
+
+def test_least_recently_used_segments_are_evicted(tmp_path):
+    # Each entry is a 4-byte header plus 10 samples
+    cache = SegmentCache(str(tmp_path), max_bytes=60)
+    for key in ("a", "b"):
+        cache.put(key, 1000, np.zeros(10, dtype=np.int16))
+    cache.get("a")
+    cache.put("c", 1000, np.zeros(10, dtype=np.int16))
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert not (tmp_path / "b.seg").exists()
+    assert cache.stats()["bytes"] == 48
+
+
+def test_entries_survive_a_restart(tmp_path):
+    SegmentCache(str(tmp_path), max_bytes=1024).put("k", 1000, np.ones(4, dtype=np.int16))
+    cache = SegmentCache(str(tmp_path), max_bytes=1024)
+    assert "k" in cache
+    assert cache.get("k")[1].tolist() == [1, 1, 1, 1]
+
+
+class CountingSynthesizer:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, replica, text, infer_kwargs):
+        self.texts.append(text)
+        time.sleep(0.01)
+        return 1000, np.full((2, 1), len(text), dtype=np.int16)
+
+
+def test_repeated_segments_are_served_from_cache(tmp_path):
+    synthesizer = CountingSynthesizer()
+    cache = SegmentCache(str(tmp_path / "segments"), max_bytes=1 << 20)
+
+    async def synthesize(scheduler, segments):
+        pipeline = SegmentPipeline(scheduler, segments, {"top_p": 0.8}, cache=cache)
+        pipeline.start()
+        return b"".join([chunk async for chunk in pipeline.encode("pcm")])
+
+    async def main():
+        pool = InferencePool(["replica"])
+        scheduler = SegmentScheduler(pool, synthesizer)
+        await pool.start()
+        await scheduler.start()
+        first = await synthesize(scheduler, ["第一章", "正文一"])
+        second = await synthesize(scheduler, ["第一章", "正文二"])
+        await scheduler.stop()
+        await pool.stop()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert synthesizer.texts == ["第一章", "正文一", "正文二"]
+    # Same text lengths, so the fake audio is identical
+    assert first == second
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
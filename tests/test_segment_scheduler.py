@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+测试跨请求的分段调度：逐段按到达顺序执行、结果回到各自请求、并发请求交替推进、队列满时拒绝
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from inference_worker import QueueFullError
+
+
+class RecordingSynthesizer:
+    """Stands in for run_segment and records the order in which segments ran"""
+
+    def __init__(self, seconds=0.02):
+        self.seconds = seconds
+        self.segments = []
+
+    def __call__(self, replica, text, infer_kwargs):
+        self.segments.append((infer_kwargs["spk_audio_prompt"], text))
+        time.sleep(self.seconds)
+        return f"{infer_kwargs['spk_audio_prompt']}:{text}"
+
+
+def test_results_are_routed_back_in_order(running_scheduler):
+    synthesizer = RecordingSynthesizer()
+
+    async def main():
+        async with running_scheduler(synthesizer) as scheduler:
+            first = scheduler.submit(["一", "二", "三"], spk_audio_prompt="a.wav")
+            second = scheduler.submit(["甲", "乙"], spk_audio_prompt="b.wav")
+            results = await asyncio.gather(asyncio.gather(*first), asyncio.gather(*second))
+        return results
+
+    first, second = asyncio.run(main())
+    assert first == ["a.wav:一", "a.wav:二", "a.wav:三"]
+    assert second == ["b.wav:甲", "b.wav:乙"]
+
+
+def test_segments_run_one_at_a_time_oldest_first(running_scheduler):
+    synthesizer = RecordingSynthesizer()
+
+    async def main():
+        async with running_scheduler(synthesizer) as scheduler:
+            futures = scheduler.submit(["一。", "二。"], spk_audio_prompt="a.wav")
+            futures += scheduler.submit(["甲。"], spk_audio_prompt="b.wav")
+            await asyncio.gather(*futures)
+            stats = scheduler.stats()
+        return stats
+
+    stats = asyncio.run(main())
+    assert synthesizer.segments == [("a.wav", "一。"), ("a.wav", "二。"), ("b.wav", "甲。")]
+    assert stats["segments"] == 3
+
+
+def test_short_request_does_not_wait_for_a_whole_long_one(running_scheduler):
+    synthesizer = RecordingSynthesizer()
+
+    async def main():
+        async with running_scheduler(synthesizer) as scheduler:
+            # A long request refills one segment at a time, like SegmentPipeline does
+            async def long_request():
+                for text in ["一。", "二。", "三。", "四。"]:
+                    await scheduler.submit([text], request=long_id, spk_audio_prompt="a.wav")[0]
+
+            long_id = scheduler.admit()
+            task = asyncio.create_task(long_request())
+            await asyncio.sleep(0.01)
+            await scheduler.submit(["甲。"], spk_audio_prompt="b.wav")[0]
+            await task
+
+    asyncio.run(main())
+    assert synthesizer.segments.index(("b.wav", "甲。")) <= 2
+
+
+def test_replicas_run_segments_concurrently(running_scheduler):
+    synthesizer = RecordingSynthesizer(seconds=0.1)
+
+    async def main():
+        async with running_scheduler(synthesizer, replicas=2) as scheduler:
+            start = time.monotonic()
+            await asyncio.gather(*scheduler.submit(["一。", "二。"], spk_audio_prompt="a.wav"))
+            return time.monotonic() - start
+
+    assert asyncio.run(main()) < 0.18
+
+
+def test_cancelled_segments_are_skipped(running_scheduler):
+    synthesizer = RecordingSynthesizer(seconds=0.05)
+
+    async def main():
+        async with running_scheduler(synthesizer) as scheduler:
+            running = scheduler.submit(["一。"], spk_audio_prompt="a.wav")
+            abandoned = scheduler.submit(["二。", "三。"], spk_audio_prompt="b.wav")
+            for future in abandoned:
+                future.cancel()
+            await asyncio.gather(*running)
+            await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    assert synthesizer.segments == [("a.wav", "一。")]
+
+
+def test_full_queue_is_rejected_per_request(running_scheduler):
+    synthesizer = RecordingSynthesizer(seconds=0.1)
+
+    async def main():
+        async with running_scheduler(synthesizer, max_pending_requests=2) as scheduler:
+            # The first request is dispatched right away, the next two wait
+            futures = scheduler.submit(["一。"], spk_audio_prompt="a.wav")
+            await asyncio.sleep(0.01)
+            futures += scheduler.submit(["二。", "三。", "四。"], spk_audio_prompt="a.wav")
+            futures += scheduler.submit(["五。"], spk_audio_prompt="a.wav")
+            with pytest.raises(QueueFullError) as excinfo:
+                scheduler.submit(["六。"], spk_audio_prompt="a.wav")
+            await asyncio.gather(*futures)
+        return excinfo.value.retry_after
+
+    assert asyncio.run(main()) >= 1
+
+
+def test_segment_failure_reaches_its_request(running_scheduler):
+    def failing(replica, text, infer_kwargs):
+        if text == "二。":
+            raise RuntimeError("boom")
+        return text
+
+    async def main():
+        async with running_scheduler(failing) as scheduler:
+            futures = scheduler.submit(["一。", "二。"], spk_audio_prompt="a.wav")
+            results = await asyncio.gather(*futures, return_exceptions=True)
+        return results
+
+    first, second = asyncio.run(main())
+    assert first == "一。"
+    assert isinstance(second, RuntimeError)
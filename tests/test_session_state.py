@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+测试会话状态后端、过期和大文件引用
+"""
+
+import os
+import time
+
+import pytest
+
+from src.session_state import ArtifactStore, MemorySessionBackend, SessionStateStore, SQLiteSessionBackend, create_backend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    backend = MemorySessionBackend() if request.param == "memory" else SQLiteSessionBackend(str(tmp_path / "state.db"))
+    return SessionStateStore(backend, ArtifactStore(str(tmp_path / "artifacts")), ttl_seconds=60)
+
+
+def test_sessions_are_isolated(store):
+    store.update("a", model_key="online:qwen", server_url="http://a/v1", api_key="key-a")
+    store.update("b", model_key="local-vl")
+    assert store.get("a").model_key == "online:qwen"
+    assert store.get("a").api_key == "key-a"
+    assert store.get("b").model_key == "local-vl"
+    assert store.get("b").server_url is None
+
+
+def test_update_keeps_other_fields(store):
+    store.update("a", model_key="m1")
+    store.update("a", documents={"pdf": "ref.pdf"})
+    state = store.get("a")
+    assert state.model_key == "m1" and state.documents == {"pdf": "ref.pdf"}
+
+
+def test_without_session_id_nothing_is_saved(store):
+    store.update(None, model_key="m1")
+    assert store.get(None).model_key is None
+
+
+def test_expired_state_is_dropped(tmp_path):
+    store = SessionStateStore(SQLiteSessionBackend(str(tmp_path / "state.db")), ArtifactStore(str(tmp_path / "artifacts")), ttl_seconds=-1)
+    store.update("a", model_key="m1")
+    assert store.get("a").model_key is None
+
+
+def test_sqlite_state_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    artifacts = ArtifactStore(str(tmp_path / "artifacts"))
+    SessionStateStore(SQLiteSessionBackend(path), artifacts).update("a", model_key="m1")
+    assert SessionStateStore(SQLiteSessionBackend(path), artifacts).get("a").model_key == "m1"
+
+
+def test_artifacts_are_content_addressed(tmp_path):
+    artifacts = ArtifactStore(str(tmp_path / "artifacts"))
+    first = tmp_path / "a.pdf"
+    second = tmp_path / "b.pdf"
+    first.write_bytes(b"%PDF-1")
+    second.write_bytes(b"%PDF-1")
+    ref = artifacts.put_file(str(first))
+    assert artifacts.put_file(str(second)) == ref
+    assert open(artifacts.path(ref), "rb").read() == b"%PDF-1"
+    with pytest.raises(FileNotFoundError):
+        artifacts.path("missing.pdf")
+
+
+def test_api_key_is_not_written_to_backend(tmp_path):
+    backend = SQLiteSessionBackend(str(tmp_path / "state.db"))
+    store = SessionStateStore(backend, ArtifactStore(str(tmp_path / "artifacts")))
+    store.update("a", model_key="m1", api_key="secret")
+    assert "secret" not in backend.load("a")
+    assert store.get("a").api_key == "secret"
+    assert SessionStateStore(backend, ArtifactStore(str(tmp_path / "artifacts"))).get("a").api_key == ""
+
+
+def test_unreferenced_artifacts_are_cleaned_up(tmp_path):
+    artifacts = ArtifactStore(str(tmp_path / "artifacts"))
+    store = SessionStateStore(MemorySessionBackend(), artifacts, ttl_seconds=60)
+    (tmp_path / "old.pdf").write_bytes(b"%PDF-old")
+    (tmp_path / "new.pdf").write_bytes(b"%PDF-new")
+    old_ref = artifacts.put_file(str(tmp_path / "old.pdf"))
+    new_ref = artifacts.put_file(str(tmp_path / "new.pdf"))
+    stale = time.time() - 120
+    os.utime(artifacts.root / old_ref, (stale, stale))
+    os.utime(artifacts.root / new_ref, (stale, stale))
+    # 会话保存时刷新它引用的文件
+    store.update("a", documents={"pdf": new_ref})
+    assert artifacts.path(new_ref)
+    with pytest.raises(FileNotFoundError):
+        artifacts.path(old_ref)
+
+
+def test_redis_backend_without_url_falls_back_to_sqlite(tmp_path):
+    backend = create_backend({"backend": "redis", "redis_url": "", "key_prefix": "x:", "sqlite_path": str(tmp_path / "state.db")})
+    assert isinstance(backend, SQLiteSessionBackend)
+
+
+def test_memory_backend_ttl():
+    backend = MemorySessionBackend()
+    backend.save("a", "{}", ttl_seconds=0)
+    time.sleep(0.01)
+    assert backend.load("a") is None
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+测试投机解码参数构造和接受率统计
+"""
+
+from types import SimpleNamespace
+
+from src.speculative import speculative_kwargs, track_generation
+
+
+class FakeModel:
+    """记录 forward pre hook 并可手动触发的模拟模型"""
+
+    def __init__(self):
+        self.hooks = []
+        self.generation_config = SimpleNamespace()
+
+    def register_forward_pre_hook(self, hook):
+        self.hooks.append(hook)
+
+    def forward(self):
+        for hook in self.hooks:
+            hook(self, ())
+
+
+def test_assistant_kwargs():
+    assistant = FakeModel()
+    kwargs = speculative_kwargs("assistant", {"num_assistant_tokens": 7}, assistant)
+    assert kwargs == {"assistant_model": assistant}
+    assert assistant.generation_config.num_assistant_tokens == 7
+
+
+def test_prompt_lookup_kwargs():
+    assert speculative_kwargs("prompt_lookup", {}) == {"prompt_lookup_num_tokens": 10}
+
+
+def test_off_or_missing_assistant_gives_no_kwargs():
+    assert speculative_kwargs("off", {}) == {}
+    assert speculative_kwargs("assistant", {}, None) == {}
+
+
+def test_acceptance_rate():
+    target, assistant = FakeModel(), FakeModel()
+    with track_generation("m", "assistant", target, assistant) as stats:
+        # 4 次目标前向验证、每次起草 5 个 token，共生成 16 个 token
+        for _ in range(4):
+            for _ in range(5):
+                assistant.forward()
+            target.forward()
+        stats["new_tokens"] = 16
+    assert stats["target_forward_steps"] == 4
+    assert stats["tokens_per_step"] == 4.0
+    assert stats["acceptance_rate"] == (16 - 4) / 20
+
+
+def test_forwards_outside_tracking_are_ignored():
+    target = FakeModel()
+    with track_generation("m", "prompt_lookup", target) as stats:
+        target.forward()
+        stats["new_tokens"] = 3
+    target.forward()
+    assert stats["target_forward_steps"] == 1
+    assert "acceptance_rate" not in stats
@@ -427,3 +427,48 @@ class TestGetAvailableVoices:
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
+
+
+class TestStreamSpeech:
+    """测试流式语音合成"""
+
+    @staticmethod
+    def _wav(samples, sample_rate=22050):
+        import struct
+
+        import numpy as np
+
+        pcm = np.asarray(samples, dtype="<i2").tobytes()
+        header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 0xFFFFFFFF, b"WAVE", b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16, b"data", 0xFFFFFFFF)
+        return header + pcm
+
+    def test_parse_wav_header(self):
+        """测试解析流式 WAV 头"""
+        from gradio.speech import parse_wav_header
+
+        data = self._wav([1, 2, 3])
+        assert parse_wav_header(data[:20]) is None
+        assert parse_wav_header(data) == (22050, 1, 44)
+
+    def test_parse_wav_header_rejects_other_formats(self):
+        """测试非 WAV 数据"""
+        from gradio.speech import parse_wav_header
+
+        with pytest.raises(ValueError):
+            parse_wav_header(b"ID3\x04" + b"\x00" * 20)
+
+    def test_stream_speech_yields_samples(self, mock_online_client):
+        """测试分块到达的 WAV 流被拼接成完整采样"""
+        from gradio.speech import stream_speech
+
+        data = self._wav(list(range(100)), sample_rate=100)
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.iter_content.return_value = [data[:30], data[30:101], data[101:]]
+        mock_online_client.session.post.return_value.__enter__.return_value = mock_response
+
+        chunks = list(stream_speech("你好", model="tts-1", voice="alloy"))
+
+        assert all(rate == 100 for rate, _ in chunks)
+        assert [int(x) for _, samples in chunks for x in samples] == list(range(100))
+        assert mock_online_client.session.post.call_args.kwargs["json"]["stream"] is True
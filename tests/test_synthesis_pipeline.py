@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试分段合成流水线：按顺序输出、在途段数有上限、客户端断开后丢弃剩余段、记录各阶段耗时
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from audio_encoding import silence_bytes
+from synthesis_pipeline import SegmentPipeline, StageTimings
+
+SAMPLE_RATE = 1000
+
+
+class FakeSynthesizer:
+    """One sample per segment whose value is the segment number"""
+
+    def __init__(self, seconds=0.01):
+        self.seconds = seconds
+        self.texts = []
+
+    def __call__(self, replica, text, infer_kwargs):
+        self.texts.append(text)
+        time.sleep(self.seconds)
+        return SAMPLE_RATE, np.array([[int(text)]], dtype=np.int16)
+
+
+def segment_pcm(value):
+    return np.array([value], dtype="<i2").tobytes()
+
+
+def test_segments_come_out_in_order_with_pauses(running_scheduler):
+    synthesizer = FakeSynthesizer()
+
+    async def main():
+        async with running_scheduler(synthesizer) as scheduler:
+            pipeline = SegmentPipeline(scheduler, ["1", "2", "3"], {"spk_audio_prompt": "a.wav"}, depth=2)
+            pipeline.start()
+            chunks = [chunk async for chunk in pipeline.encode("pcm")]
+        return b"".join(chunks)
+
+    pause = silence_bytes(SAMPLE_RATE)
+    assert asyncio.run(main()) == segment_pcm(1) + pause + segment_pcm(2) + pause + segment_pcm(3)
+
+
+def test_at_most_depth_segments_run_ahead_of_the_consumer(running_scheduler):
+    synthesizer = FakeSynthesizer()
+
+    async def main():
+        async with running_scheduler(synthesizer) as scheduler:
+            pipeline = SegmentPipeline(scheduler, [str(i) for i in range(1, 9)], {"spk_audio_prompt": "a.wav"}, depth=3)
+            pipeline.start()
+            chunks = pipeline.encode("pcm")
+            await anext(chunks)
+            # The consumer stalls after the first segment; synthesis must stop at the window
+            await asyncio.sleep(0.2)
+            synthesized = len(synthesizer.texts)
+            await chunks.aclose()
+        return synthesized
+
+    assert asyncio.run(main()) == 4
+
+
+def test_closing_drops_unsynthesized_segments(running_scheduler):
+    synthesizer = FakeSynthesizer(seconds=0.05)
+
+    async def main():
+        async with running_scheduler(synthesizer) as scheduler:
+            pipeline = SegmentPipeline(scheduler, [str(i) for i in range(1, 9)], {"spk_audio_prompt": "a.wav"}, depth=4)
+            pipeline.start()
+            chunks = pipeline.encode("wav")
+            await anext(chunks)
+            await chunks.aclose()
+            await asyncio.sleep(0.2)
+
+    asyncio.run(main())
+    assert len(synthesizer.texts) < 8
+
+
+def test_stage_timings_are_recorded(running_scheduler):
+    timings = StageTimings()
+
+    async def main():
+        async with running_scheduler(FakeSynthesizer(), timings=timings) as scheduler:
+            pipeline = SegmentPipeline(scheduler, ["1", "2"], {"spk_audio_prompt": "a.wav"}, timings=timings)
+            pipeline.start()
+            async for _ in pipeline.encode("pcm"):
+                pass
+
+    asyncio.run(main())
+    stats = timings.stats()
+    assert {"queue_wait", "synthesis", "encode", "first_audio", "request"} <= set(stats)
+    assert stats["synthesis"]["count"] == 2
+    assert stats["first_audio"]["count"] == 1
+    assert stats["request"]["avg_ms"] >= stats["first_audio"]["avg_ms"]
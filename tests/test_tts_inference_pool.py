@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+测试音频服务的推理工作队列：副本串行执行、队列满时拒绝、异常传递
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from inference_worker import InferencePool, QueueFullError
+
+
+class FakeReplica:
+    def __init__(self, name):
+        self.name = name
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def infer(self, seconds=0.05):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(seconds)
+        with self.lock:
+            self.running -= 1
+        return self.name
+
+
+def test_replica_runs_one_job_at_a_time():
+    replica = FakeReplica("a")
+
+    async def main():
+        pool = InferencePool([replica], max_queue_depth=10)
+        await pool.start()
+        results = await asyncio.gather(*(pool.run(lambda tts: tts.infer()) for _ in range(4)))
+        await pool.stop()
+        return results
+
+    assert asyncio.run(main()) == ["a"] * 4
+    assert replica.max_running == 1
+
+
+def test_replicas_run_in_parallel():
+    replicas = [FakeReplica("a"), FakeReplica("b")]
+
+    async def main():
+        pool = InferencePool(replicas, max_queue_depth=10)
+        await pool.start()
+        results = await asyncio.gather(*(pool.run(lambda tts: tts.infer(0.1)) for _ in range(2)))
+        await pool.stop()
+        return results
+
+    assert sorted(asyncio.run(main())) == ["a", "b"]
+
+
+def test_event_loop_stays_responsive():
+    async def main():
+        pool = InferencePool([FakeReplica("a")])
+        await pool.start()
+        job = asyncio.create_task(pool.run(lambda tts: tts.infer(0.3)))
+        start = time.monotonic()
+        await asyncio.sleep(0.01)
+        responsive = time.monotonic() - start < 0.2
+        await job
+        await pool.stop()
+        return responsive
+
+    assert asyncio.run(main())
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def main():
+        pool = InferencePool([FakeReplica("a")], max_queue_depth=1, initial_job_seconds=2.0)
+        await pool.start()
+        running = asyncio.create_task(pool.run(lambda tts: tts.infer(0.2)))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(pool.run(lambda tts: tts.infer(0.01)))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as info:
+            await pool.run(lambda tts: tts.infer(0.01))
+        await asyncio.gather(running, queued)
+        await pool.stop()
+        return info.value.retry_after, pool.stats()
+
+    retry_after, stats = asyncio.run(main())
+    assert retry_after >= 1
+    assert stats["rejected"] == 1 and stats["completed"] == 2
+
+
+def test_exceptions_reach_the_caller():
+    def fail(tts):
+        raise ValueError("bad prompt")
+
+    async def main():
+        pool = InferencePool([FakeReplica("a")])
+        await pool.start()
+        try:
+            with pytest.raises(ValueError):
+                await pool.run(fail)
+            return await pool.run(lambda tts: tts.infer(0.01))
+        finally:
+            await pool.stop()
+
+    assert asyncio.run(main()) == "a"
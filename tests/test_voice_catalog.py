@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试音频服务的声音目录：稳定 ID、增量刷新、扩展名猜测和 ETag
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+from voice_catalog import VoiceCatalog
+
+
+class CountingProbe:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(os.path.basename(path))
+        return 3.0, 22050
+
+
+def _catalog(tmp_path, probe=None):
+    return VoiceCatalog(str(tmp_path / "voices"), str(tmp_path / "manifest.json"), probe=probe or CountingProbe())
+
+
+def _add(tmp_path, name, data=b"audio"):
+    (tmp_path / "voices").mkdir(exist_ok=True)
+    (tmp_path / "voices" / name).write_bytes(data)
+
+
+def test_ids_are_stable_across_changes_and_restarts(tmp_path):
+    _add(tmp_path, "a.mp3")
+    _add(tmp_path, "b.wav")
+    catalog = _catalog(tmp_path)
+    catalog.refresh()
+    ids = {entry.name: entry.id for entry in catalog.voices()}
+
+    os.remove(tmp_path / "voices" / "a.mp3")
+    _add(tmp_path, "c.flac")
+    catalog.refresh()
+    assert catalog.resolve(ids["b.wav"]).name == "b.wav"
+    assert catalog.resolve(ids["a.mp3"]) is None
+    new_id = catalog.resolve("c.flac").id
+    assert new_id not in ids.values()
+
+    restarted = _catalog(tmp_path)
+    restarted.refresh()
+    assert restarted.resolve(ids["b.wav"]).name == "b.wav"
+    assert restarted.resolve(new_id).name == "c.flac"
+
+
+def test_first_manifest_keeps_listdir_ids(tmp_path):
+    _add(tmp_path, "notes.txt")
+    _add(tmp_path, "a.mp3")
+    (tmp_path / "voices" / "sub.wav").mkdir()
+    _add(tmp_path, "b.wav")
+    # 旧版按未过滤的 os.listdir() 顺序编号
+    legacy = {str(i): name for i, name in enumerate(os.listdir(tmp_path / "voices"))}
+    catalog = _catalog(tmp_path)
+    catalog.refresh()
+    for voice_id, name in legacy.items():
+        if name in ("a.mp3", "b.wav"):
+            assert catalog.resolve(voice_id).name == name
+        else:
+            assert catalog.resolve(voice_id) is None
+
+    _add(tmp_path, "c.flac")
+    catalog.refresh()
+    assert int(catalog.resolve("c.flac").id) == len(legacy)
+
+
+def test_resolve_by_name_and_stem(tmp_path):
+    _add(tmp_path, "江疏影_60.wav")
+    _add(tmp_path, "江疏影_60.mp3")
+    _add(tmp_path, "notes.txt")
+    catalog = _catalog(tmp_path)
+    catalog.refresh()
+    assert catalog.resolve("江疏影_60.wav").name == "江疏影_60.wav"
+    assert catalog.resolve("江疏影_60").name == "江疏影_60.mp3"
+    assert catalog.resolve("notes.txt") is None
+    assert catalog.resolve("zh-CN-XiaoxiaoNeural") is None
+    assert catalog.resolve(None) is None
+
+
+def test_only_new_or_modified_files_are_probed(tmp_path):
+    probe = CountingProbe()
+    _add(tmp_path, "a.mp3")
+    catalog = _catalog(tmp_path, probe)
+    catalog.refresh()
+    catalog.refresh()
+    assert probe.calls == ["a.mp3"]
+
+    _add(tmp_path, "a.mp3", b"longer audio")
+    catalog.refresh()
+    assert probe.calls == ["a.mp3", "a.mp3"]
+    entry = catalog.resolve("a.mp3")
+    assert entry.duration == 3.0 and entry.sample_rate == 22050 and entry.size == len(b"longer audio")
+
+    # 重启后未变化的文件不再探测
+    restarted = _catalog(tmp_path, probe)
+    restarted.refresh()
+    assert probe.calls == ["a.mp3", "a.mp3"]
+
+
+def test_etag_changes_only_when_catalog_changes(tmp_path):
+    _add(tmp_path, "a.mp3")
+    catalog = _catalog(tmp_path)
+    assert catalog.refresh() is True
+    etag = catalog.etag
+    assert catalog.refresh() is False and catalog.etag == etag
+    _add(tmp_path, "b.mp3")
+    assert catalog.refresh() is True and catalog.etag != etag
+
+
+def test_missing_directory_is_empty(tmp_path):
+    catalog = _catalog(tmp_path)
+    catalog.refresh()
+    assert catalog.voices() == []
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+测试音频服务的声音条件缓存、时长缓存和 base64 提示音去重
+"""
+
+import base64
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "docker" / "indextts2"))
+
+import voice_registry
+from voice_registry import VoiceRegistry
+
+
+class FakeTTS:
+    """模拟 IndexTTS2 的单条目条件缓存：提示音路径变化时重新提取"""
+
+    def __init__(self):
+        self.extractions = []
+        self.cache_spk_audio_prompt = None
+        self.cache_emo_audio_prompt = None
+        for attr in ("cache_spk_cond", "cache_s2mel_style", "cache_s2mel_prompt", "cache_mel", "cache_emo_cond"):
+            setattr(self, attr, None)
+
+    def infer(self, spk_audio_prompt, text, emo_audio_prompt=None, **kwargs):
+        if self.cache_spk_audio_prompt != spk_audio_prompt:
+            self.extractions.append(spk_audio_prompt)
+            features = f"spk:{open(spk_audio_prompt).read()}"
+            self.cache_spk_cond, self.cache_s2mel_style, self.cache_s2mel_prompt, self.cache_mel = features, "style", "prompt", "mel"
+            self.cache_spk_audio_prompt = spk_audio_prompt
+        emotion = emo_audio_prompt or spk_audio_prompt
+        if self.cache_emo_audio_prompt != emotion:
+            self.cache_emo_cond = f"emo:{emotion}"
+            self.cache_emo_audio_prompt = emotion
+        return self.cache_spk_cond
+
+
+def _voices(tmp_path):
+    a, b = tmp_path / "a.wav", tmp_path / "b.wav"
+    a.write_text("A")
+    b.write_text("B")
+    return str(a), str(b)
+
+
+def test_alternating_voices_extract_once(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"))
+    tts = FakeTTS()
+    a, b = _voices(tmp_path)
+    for path in (a, b, a, b, a):
+        registry.infer(tts, spk_audio_prompt=path, text="你好")
+    assert tts.extractions == [a, b]
+    assert registry.stats()["hits"] > 0
+
+
+def test_conditioning_is_shared_between_replicas(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"))
+    first, second = FakeTTS(), FakeTTS()
+    a, _ = _voices(tmp_path)
+    registry.infer(first, spk_audio_prompt=a, text="你好")
+    assert registry.infer(second, spk_audio_prompt=a, text="你好") == "spk:A"
+    assert second.extractions == []
+
+
+def test_modified_voice_file_is_reextracted(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"))
+    tts = FakeTTS()
+    a, _ = _voices(tmp_path)
+    registry.infer(tts, spk_audio_prompt=a, text="你好")
+    Path(a).write_text("A2")
+    os.utime(a, ns=(0, 10**18))
+    assert registry.infer(tts, spk_audio_prompt=a, text="你好") == "spk:A2"
+    assert tts.extractions == [a, a]
+
+
+def test_lru_evicts_oldest_entry(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"), max_entries=2)
+    tts = FakeTTS()
+    a, b = _voices(tmp_path)
+    registry.infer(tts, spk_audio_prompt=a, text="x")
+    registry.infer(tts, spk_audio_prompt=b, text="x")
+    assert registry.stats()["conditioning_entries"] == 2
+
+
+def test_duration_is_probed_once_per_version(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"))
+    a, _ = _voices(tmp_path)
+    with patch.object(voice_registry, "probe_audio", return_value=(3.5, 22050)) as probe:
+        assert registry.duration(a) == 3.5
+        assert registry.duration(a) == 3.5
+    assert probe.call_count == 1
+    assert registry.duration(str(tmp_path / "missing.wav")) is None
+
+
+def test_base64_prompts_are_deduplicated(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"), max_prompts=2, prompt_grace=0)
+    encoded = base64.b64encode(b"RIFF-audio").decode()
+    first = registry.store_base64_prompt(f"data:audio/wav;base64,{encoded}")
+    second = registry.store_base64_prompt(encoded)
+    assert first == second and open(first, "rb").read() == b"RIFF-audio"
+
+    registry.store_prompt(b"two")
+    registry.store_prompt(b"three")
+    assert not os.path.exists(first)
+    assert len(os.listdir(tmp_path / "prompts")) == 2
+
+
+def test_base64_prompt_suffix_follows_mime_type(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"))
+    assert registry.store_base64_prompt("data:audio/mpeg;base64," + base64.b64encode(b"ID3-audio").decode()).endswith(".mp3")
+    assert registry.store_base64_prompt("data:audio/flac;codecs=flac;base64," + base64.b64encode(b"fLaC-audio").decode()).endswith(".flac")
+    # 未知类型和裸 base64 沿用 .wav
+    assert registry.store_base64_prompt("data:audio/unknown;base64," + base64.b64encode(b"other").decode()).endswith(".wav")
+    assert registry.store_base64_prompt(base64.b64encode(b"raw").decode()).endswith(".wav")
+
+
+def test_evicted_prompt_survives_queued_and_running_requests(tmp_path):
+    registry = VoiceRegistry(str(tmp_path / "prompts"), max_prompts=1, prompt_grace=60)
+    queued = registry.store_prompt(b"queued")
+    registry.store_prompt(b"newer")
+    # 排队中的请求仍持有被淘汰的路径，宽限期内不删除
+    assert os.path.exists(queued)
+
+    class BlockingTTS(FakeTTS):
+        def infer(self, spk_audio_prompt, text, **kwargs):
+            registry.prompt_grace = 0
+            registry.store_prompt(b"newest")
+            # 推理进行中的提示音即使超过宽限期也不删除
+            assert os.path.exists(spk_audio_prompt)
+            return super().infer(spk_audio_prompt, text, **kwargs)
+
+    assert registry.infer(BlockingTTS(), spk_audio_prompt=queued, text="你好") == "spk:queued"
+    registry.store_prompt(b"later")
+    assert not os.path.exists(queued)